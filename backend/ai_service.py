@@ -1,85 +1,133 @@
 import openai
+import httpx
 import os
 from dotenv import load_dotenv
-from typing import Dict, List
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from cassettes import create_transport, is_offline
+from scheduler import PRIORITY_BACKGROUND, Scheduler, VendorScheduler, retry_after_seconds
 
 load_dotenv()
 
 class AIService:
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, scheduler: Optional[VendorScheduler] = None):
+        # One pooled async HTTP client shared by every game and a default per-request
+        # timeout; completions in flight and per-minute usage are capped by the scheduler
+        self.request_timeout = float(os.getenv("OPENAI_TIMEOUT", "60"))
+        self.scheduler = scheduler or Scheduler().openai
+        self.max_concurrency = self.scheduler.max_concurrency
+        max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", str(self.max_concurrency * 2)))
         
-    async def generate_story(self, prompt: str, current_context: str = "", gm_role: str = "") -> Dict[str, str]:
-        """Generate story content using OpenAI API"""
-        
-        # Build system prompt with custom GM role if provided
-        base_prompt = """
-        You are a skilled Game Master for a collaborative fantasy adventure game. Your role is to:
-        
-        1. Create engaging, immersive story content
-        2. Respond to player actions with logical consequences
-        3. Maintain narrative flow and consistency
-        4. Create opportunities for all players to participate
-        5. Balance challenge and fun
-        6. Describe scenes vividly but concisely
-        
-        Guidelines:
-        - Keep responses between 100-300 words
-        - End with a clear situation requiring player decision/action
-        - Maintain consistent tone and world-building
-        - Include sensory details (sights, sounds, smells)
-        - Create meaningful choices and consequences
-        - Indicate if the scene is: adventure, combat, dialog, or exploration
-        - NEVER include meta text like "Scene:", "Dialog:", "Decision:", or player names as labels
-        - Focus on immersive storytelling without breaking the fourth wall
-        
-        Return your response as a story that advances the narrative based on the prompt.
-        """
-        
-        if gm_role and gm_role.strip():
-            role_prompt = f"""
-            
-        IMPORTANT: Adopt this specific Game Master personality and style:
-        {gm_role.strip()}
+        # The transport decides whether requests go out live, recorded, replayed or synthetic (BACKEND_MODE)
+        self.http_client = httpx.AsyncClient(
+            transport=create_transport("openai", httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=60.0
+            )),
+            timeout=httpx.Timeout(self.request_timeout, connect=10.0),
+            # Sees every attempt, including the SDK's own retries of a 429
+            event_hooks={"response": [self._on_response]}
+        )
+        self.client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY") or ("offline" if is_offline() else None),
+            # Override to run against a stand-in such as emulator.py
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            http_client=self.http_client,
+            timeout=self.request_timeout,
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+        )
+    
+    async def _on_response(self, response: httpx.Response):
+        """Pause all OpenAI calls while the API is rate limiting us, not just the one that was refused"""
+        if response.status_code == 429:
+            self.scheduler.backoff(retry_after_seconds(response.headers))
+    
+    def _estimate_tokens(self, messages: List[Dict[str, str]], max_tokens: int) -> int:
+        """Rough token cost of a completion for rate limiting: ~4 characters per prompt token plus the reply budget"""
+        return sum(len(message["content"]) for message in messages) // 4 + max_tokens
+    
+    async def close(self):
+        """Close the pooled HTTP connections"""
+        await self.client.close()
+        await self.http_client.aclose()
         
-        Embody this role consistently throughout the adventure. Let this personality shine through in your narration style, descriptions, and how you present challenges to the players.
-        """
-            system_prompt = base_prompt + role_prompt
-        else:
-            system_prompt = base_prompt
+    def _build_story_result(self, story_text: str) -> Dict[str, str]:
+        """Derive the scene type from a finished story"""
+        # Extract scene type for music selection
+        scene_type = self._determine_scene_type(story_text)
         
+        return {
+            "story": story_text,
+            "scene_type": scene_type
+        }
+    
+    def _fallback_story_result(self) -> Dict[str, str]:
+        """Story result used when the AI request fails"""
+        return {
+            "story": "The tale continues as the adventurers face an unexpected turn of events...",
+            "scene_type": "adventure"
+        }
+    
+    async def generate_story(self, messages: List[Dict[str, str]], timeout: Optional[float] = None) -> Dict[str, str]:
+        """Generate story content using OpenAI API"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Context: {current_context}\n\nPrompt: {prompt}"}
-                ],
-                max_tokens=400,
-                temperature=0.8
-            )
+            async with self.scheduler.slot(self._estimate_tokens(messages, 400)):
+                response = await self.client.chat.completions.create(
+                    model="gpt-4",
+                    messages=messages,
+                    max_tokens=400,
+                    temperature=0.8,
+                    timeout=timeout or self.request_timeout
+                )
             
             story_text = response.choices[0].message.content
+            return self._build_story_result(story_text)
             
-            # Extract scene type for music selection
-            scene_type = self._determine_scene_type(story_text)
-            
-            # Update context for future reference
-            updated_context = self._update_context(current_context, story_text)
+        except Exception as e:
+            print(f"Error generating story: {e}")
+            return self._fallback_story_result()
+    
+    async def stream_story(self, messages: List[Dict[str, str]], timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Yield story text deltas as OpenAI generates them"""
+        async with self.scheduler.slot(self._estimate_tokens(messages, 400)):
+            stream = await self.client.chat.completions.create(
+                model="gpt-4",
+                messages=messages,
+                max_tokens=400,
+                temperature=0.8,
+                stream=True,
+                timeout=timeout or self.request_timeout
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+    
+    async def generate_story_streaming(self, messages: List[Dict[str, str]], on_delta: Callable[[str], Awaitable[None]], timeout: Optional[float] = None) -> Dict[str, str]:
+        """Generate story content, passing each text delta to on_delta as it arrives"""
+        parts: List[str] = []
+        try:
+            async for delta in self.stream_story(messages, timeout):
+                parts.append(delta)
+                try:
+                    await on_delta(delta)
+                except Exception as e:
+                    # Delivering a delta failed, the story itself is fine: keep generating
+                    print(f"⚠️ Could not deliver story delta: {e}")
             
-            return {
-                "story": story_text,
-                "scene_type": scene_type,
-                "context": updated_context
-            }
+            return self._build_story_result("".join(parts))
             
         except Exception as e:
-            print(f"Error generating story: {e}")
-            return {
-                "story": "The tale continues as the adventurers face an unexpected turn of events...",
-                "scene_type": "adventure",
-                "context": current_context
-            }
+            print(f"Error streaming story: {e}")
+            if parts:
+                # Keep what the players have already seen
+                return self._build_story_result("".join(parts))
+            
+            result = self._fallback_story_result()
+            await on_delta(result["story"])
+            return result
     
     def _determine_scene_type(self, story_text: str) -> str:
         """Determine the type of scene based on story content"""
@@ -102,22 +150,39 @@ class AIService:
         else:
             return "adventure"
     
-    def _update_context(self, current_context: str, new_story: str) -> str:
-        """Update the scene context with new story developments"""
-        # Keep context concise by focusing on key elements
-        context_lines = current_context.split('\n') if current_context else []
-        
-        # Add new story summary (keep last 3 story beats)
-        new_summary = f"Recent: {new_story[:100]}..."
-        context_lines.append(new_summary)
-        
-        # Keep only last 3 context entries to prevent context from growing too large
-        if len(context_lines) > 3:
-            context_lines = context_lines[-3:]
-        
-        return '\n'.join(context_lines)
+    async def summarize_story(self, summary: str, chapters: List[str], language: str = "English", max_tokens: int = 400, timeout: Optional[float] = None) -> Optional[str]:
+        """Fold finished chapters into the running story summary; None if the request failed"""
+        try:
+            chapter_text = "\n\n".join(chapters)
+            prompt = f"""
+            Summary of the adventure so far:
+            {summary or "(the adventure has just begun)"}
+            
+            Chapters that happened since:
+            {chapter_text}
+            
+            Rewrite the summary so it also covers these chapters. Keep every fact the Game Master needs to stay consistent: characters and what they did, places, items, open quests, promises and threats. Drop scenery and wording.
+            Write it in {language}, as plain prose of at most {max_tokens * 3 // 4} words.
+            """
+            
+            messages = [{"role": "user", "content": prompt}]
+            # Nobody is waiting on the summary
+            async with self.scheduler.slot(self._estimate_tokens(messages, max_tokens), priority=PRIORITY_BACKGROUND):
+                response = await self.client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=0.3,
+                    timeout=timeout or self.request_timeout
+                )
+            
+            return response.choices[0].message.content
+            
+        except Exception as e:
+            print(f"Error summarizing story: {e}")
+            return None
     
-    async def generate_character_response(self, character_name: str, situation: str, personality: str = "") -> str:
+    async def generate_character_response(self, character_name: str, situation: str, personality: str = "", timeout: Optional[float] = None) -> str:
         """Generate dialog for NPCs"""
         try:
             prompt = f"""
@@ -128,12 +193,16 @@ class AIService:
             Respond in character with 1-2 sentences of dialog.
             """
             
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=100,
-                temperature=0.9
-            )
+            messages = [{"role": "user", "content": prompt}]
+            # NPC lines are never what a round is waiting on
+            async with self.scheduler.slot(self._estimate_tokens(messages, 100), priority=PRIORITY_BACKGROUND):
+                response = await self.client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=messages,
+                    max_tokens=100,
+                    temperature=0.9,
+                    timeout=timeout or self.request_timeout
+                )
             
             return response.choices[0].message.content
             
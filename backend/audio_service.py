@@ -2,35 +2,246 @@ import os
 import asyncio
 import aiofiles
 from dotenv import load_dotenv
-import random
-from typing import Optional, List
-import hashlib
+from typing import Awaitable, Callable, Dict, Optional, List, Tuple
 import httpx
 import time
-import subprocess
 import shutil
+from collections import OrderedDict
+from bgm_library import BgmLibrary
+from cache_keys import CacheStats, render_key
+from cassettes import backend_mode, create_transport, is_offline
+from dialogue_parser import DialogueAttributor, resolve_overlaps
+from live_audio import LiveRenders
+from mp3_concat import Mp3FormatError, concatenate_mp3_files
+from resilience import CircuitBreaker, CircuitOpenError
+from scheduler import Scheduler, VendorScheduler, retry_after_seconds
+from speech_markup import add_speech_elements
+from transcoder import VoiceTranscoder
+from voice_cache import NegativeCache, SingleFlight, VoiceCache
 
 load_dotenv()
 
+# Called with the live URL once a voice file starts streaming in
+LiveCallback = Callable[[str], Awaitable[None]]
+
+FREYA_VOICE_ID = "pFZP5JQG7iQjIQuC4Bku"
+
+# Silent stand-in used in mock mode; one shared file, never stored under a content-addressed name
+PLACEHOLDER_FILENAME = "placeholder_silence.mp3"
+PLACEHOLDER_MP3 = bytes([0xFF, 0xFB, 0x90, 0x00] + [0x00] * 20) * 100
+
+# Narrator settings: lower stability for more expression variety, high similarity for consistency
+NARRATOR_VOICE_SETTINGS = {
+    "stability": 0.4,
+    "similarity_boost": 0.8,
+    "style": 0.3,
+    "use_speaker_boost": True
+}
+
+# Text to Dialogue request parameters; part of the multi-voice cache key
+DIALOGUE_MODEL_ID = "eleven_v3"  # Text to Dialogue requires v3
+DIALOGUE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.8,
+    "style": 0.3
+}
+
+# Request parameters for dialogue segments rendered one by one; part of the segment cache key
+SEGMENT_MODEL_ID = "eleven_multilingual_v2"
+SEGMENT_VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.8,
+    "style": 0.3,
+    "use_speaker_boost": True
+}
+
 class AudioService:
     """AudioService with ElevenLabs API integration"""
     
-    def __init__(self):
+    def __init__(self, scheduler: Optional[VendorScheduler] = None):
         self.bgm_folder = os.getenv("BGM_FOLDER_PATH", "../bgm")
+        self.bgm_library = BgmLibrary(self.bgm_folder)
         self.voice_cache_dir = "static/audio"
-        self.elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
+        self.backend_mode = backend_mode()
+        # Replayed and synthetic backends need no key; their audio is cached apart from real renders
+        self.elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY") or ("offline" if is_offline(self.backend_mode) else None)
         self.use_mock = not self.elevenlabs_api_key
+        self.cache_namespace = self.backend_mode if is_offline(self.backend_mode) else None
+        # Override to run against a stand-in such as emulator.py
+        self.base_url = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io").rstrip("/")
+        
+        # One keep-alive connection pool shared by every ElevenLabs call
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.max_connections = int(os.getenv("ELEVENLABS_MAX_CONNECTIONS", "20"))
+        self.max_keepalive_connections = int(os.getenv("ELEVENLABS_MAX_KEEPALIVE", "10"))
+        self.use_http2 = os.getenv("ELEVENLABS_HTTP2", "true").lower() not in ("0", "false", "no")
+        
+        # Segment-based multi-voice rendering
+        self.segment_concurrency = int(os.getenv("ELEVENLABS_SEGMENT_CONCURRENCY", "4"))
+        self.segment_retries = int(os.getenv("ELEVENLABS_SEGMENT_RETRIES", "2"))
+        
+        # Dialogue attribution patterns compiled once per roster
+        self._attributors: "OrderedDict[tuple, DialogueAttributor]" = OrderedDict()
+        self.max_cached_rosters = 64
         
         # Create cache directory
         os.makedirs(self.voice_cache_dir, exist_ok=True)
+        self.voice_cache = VoiceCache(self.voice_cache_dir)
+        # Identical renders requested while one is running share its result
+        self._inflight_renders = SingleFlight()
+        # Renders that failed recently are not retried until their TTL runs out
+        self.failed_renders = NegativeCache()
+        self.cache_stats = CacheStats()
+        # Optional compact copies (Opus, low-bitrate MP3) for clients that can play them
+        self.transcoder = VoiceTranscoder(self.voice_cache)
+        # Voice files still streaming in from ElevenLabs, followed by /audio/live
+        self.live_renders = LiveRenders()
+        # on_live callbacks of callers waiting for a shared render to start streaming
+        self._live_listeners: Dict[str, List[LiveCallback]] = {}
+        
+        # Concurrency and per-minute limits shared with every other game
+        self.scheduler = scheduler or Scheduler().elevenlabs
+        
+        # Fail fast to text-only while an endpoint is down instead of waiting out timeouts
+        self.breakers = {
+            "tts": CircuitBreaker("ElevenLabs text-to-speech", slow_call=float(os.getenv("CIRCUIT_SLOW_CALL_TTS", "10"))),
+            "dialogue": CircuitBreaker("ElevenLabs text-to-dialogue", slow_call=float(os.getenv("CIRCUIT_SLOW_CALL_DIALOGUE", "30")))
+        }
         
         if self.use_mock:
             print("🎭 Using Mock AudioService (no ElevenLabs API key)")
         else:
             print("🔊 Using ElevenLabs AudioService")
     
-    async def generate_voice(self, text: str, language: str = "English", voice_id: Optional[str] = None, character_voices: Optional[dict] = None, narrator_voice_id: Optional[str] = None, session_language: Optional[str] = None) -> Optional[str]:
-        """Generate voice using ElevenLabs with speech elements and language support"""
+    async def startup(self):
+        """Index voice cache and music library, open the shared ElevenLabs connection pool"""
+        await self.voice_cache.startup()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._purge_placeholders)
+        await self.bgm_library.startup()
+        self._get_http_client()
+    
+    async def shutdown(self):
+        """Close the shared ElevenLabs connection pool and persist the cache index"""
+        self.transcoder.cancel()
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+        await self.bgm_library.shutdown()
+        await self.voice_cache.shutdown()
+    
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating it on first use"""
+        if self.http_client is None:
+            http2 = self.use_http2
+            if http2:
+                try:
+                    import h2  # noqa: F401 - optional, enables HTTP/2 in httpx
+                except ImportError:
+                    print("⚠️ h2 not installed, ElevenLabs client falls back to HTTP/1.1")
+                    http2 = False
+            
+            self.http_client = httpx.AsyncClient(
+                transport=create_transport("elevenlabs", httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=60.0
+                ), http2=http2),
+                timeout=httpx.Timeout(30.0, connect=10.0)
+            )
+            print(f"🔌 ElevenLabs connection pool ready (HTTP/{'2' if http2 else '1.1'}, max {self.max_connections} connections)")
+        return self.http_client
+    
+    async def _stream_to_cache(self, url: str, data: dict, headers: dict, filename: str, timeout: float, on_live: Optional[LiveCallback] = None, endpoint: str = "tts") -> httpx.Response:
+        """Render through the endpoint's circuit breaker; raises CircuitOpenError while it is open"""
+        breaker = self.breakers[endpoint]
+        if not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} circuit is open")
+        
+        try:
+            async with self.scheduler.slot(self._request_characters(data)):
+                response, time_to_headers = await self._download_to_cache(url, data, headers, filename, timeout, on_live)
+        except httpx.HTTPError as e:
+            breaker.record_failure(type(e).__name__)
+            raise
+        except BaseException:
+            # Cancelled or a local error: says nothing about the vendor
+            breaker.release()
+            raise
+        
+        if response.status_code == 429:
+            self.scheduler.backoff(self._retry_after(response))
+        
+        # Client errors (bad voice id, endpoint not available) are not outages
+        if response.status_code == 429 or response.status_code >= 500:
+            breaker.record_failure(f"HTTP {response.status_code}")
+        else:
+            # Only the wait for the response counts: a long chapter takes long to stream but is healthy
+            breaker.record_success(time_to_headers)
+        return response
+    
+    @staticmethod
+    def _request_characters(data: dict) -> int:
+        """Characters a render request is billed for"""
+        if "inputs" in data:
+            return sum(len(item.get("text", "")) for item in data["inputs"])
+        return len(data.get("text", ""))
+    
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> float:
+        return retry_after_seconds(response.headers)
+    
+    async def _download_to_cache(self, url: str, data: dict, headers: dict, filename: str, timeout: float, on_live: Optional[LiveCallback] = None) -> Tuple[httpx.Response, float]:
+        """POST a render request and write the audio into the cache as it arrives
+        
+        Chunks go to a .part file that is renamed into place once complete, so
+        the cache never holds a truncated file; while it grows, /audio/live can
+        follow it. On an error status the body is read for the message and
+        nothing is written. Returns the response and the seconds until its
+        headers arrived.
+        """
+        filepath = self.voice_cache.path(filename)
+        temp_path = filepath + ".part"
+        client = self._get_http_client()
+        
+        started = time.monotonic()
+        async with client.stream("POST", url, json=data, headers=headers, timeout=timeout) as response:
+            time_to_headers = time.monotonic() - started
+            if response.status_code != 200:
+                await response.aread()
+                return response, time_to_headers
+            
+            live = self.live_renders.start(filename, temp_path, filepath)
+            failed = True
+            try:
+                async with aiofiles.open(temp_path, 'wb') as f:
+                    if on_live is not None:
+                        try:
+                            await on_live(f"audio/live/{filename}")
+                        except Exception as e:
+                            print(f"⚠️ Could not announce live audio {filename}: {e}")
+                    async for chunk in response.aiter_bytes():
+                        await f.write(chunk)
+                        live.wrote(len(chunk))
+                os.replace(temp_path, filepath)
+                failed = False
+            finally:
+                self.live_renders.finish(live, failed)
+                if failed:
+                    try:
+                        os.remove(temp_path)
+                    except OSError:
+                        pass
+        
+        return response, time_to_headers
+    
+    async def generate_voice(self, text: str, language: str = "English", voice_id: Optional[str] = None, character_voices: Optional[dict] = None, narrator_voice_id: Optional[str] = None, session_language: Optional[str] = None, on_live: Optional[LiveCallback] = None, on_variants: Optional[LiveCallback] = None) -> Optional[str]:
+        """Generate voice using ElevenLabs with speech elements and language support
+        
+        on_live, if given, is called with a URL that plays the file while it is still streaming in.
+        on_variants, if given, is called with the returned voice file once a compact
+        variant of it was transcoded, so clients can switch to that.
+        """
         if not text or len(text.strip()) == 0:
             return None
         
@@ -51,46 +262,96 @@ class AudioService:
         # If character voices are provided and not empty, use multi-voice generation
         if character_voices and len(character_voices) > 0:
             print(f"🎭 Multi-voice generation with {len(character_voices)} character voices")
-            return await self._generate_multi_voice_story(text, language, character_voices, final_narrator_voice)
-        
-        # Single narrator voice generation
-        print(f"🔊 Single narrator voice generation")
-        return await self._generate_single_narrator_voice(text, language, final_narrator_voice)
+            voice_file = await self._generate_multi_voice_story(text, language, character_voices, final_narrator_voice, on_live)
+        else:
+            # Single narrator voice generation
+            print(f"🔊 Single narrator voice generation")
+            voice_file = await self._generate_single_narrator_voice(text, language, final_narrator_voice, on_live)
+        
+        if voice_file and not self.use_mock and self.transcoder.enabled:
+            # Clients get the original until the variants exist, so nobody waits for ffmpeg
+            on_ready = None
+            if on_variants is not None:
+                async def on_ready(filename: str, voice_file: str = voice_file):
+                    await on_variants(voice_file)
+            self.transcoder.transcode_in_background(os.path.basename(voice_file), on_ready)
+        return voice_file
+    
+    def voice_url_for(self, voice_file: Optional[str], supported_formats: List[str]) -> Optional[str]:
+        """Point a voice file URL at the best variant a client advertised support for"""
+        if not voice_file or not voice_file.startswith("static/audio/"):
+            return voice_file
+        variant = self.transcoder.best_variant(os.path.basename(voice_file), supported_formats)
+        return f"static/audio/{variant}"
     
-    async def _generate_single_narrator_voice(self, text: str, language: str, narrator_voice: Optional[str]) -> Optional[str]:
+    async def _generate_single_narrator_voice(self, text: str, language: str, narrator_voice: Optional[str], on_live: Optional[LiveCallback] = None) -> Optional[str]:
         """Generate voice for single narrator (no character dialogue)"""
         enhanced_text = self._add_speech_elements(text)
         
-        # Create filename with narrator voice for proper caching
-        voice_for_hash = narrator_voice or "default"
-        text_hash = hashlib.md5(f"{enhanced_text}_{language}_{voice_for_hash}".encode()).hexdigest()
-        filename = f"voice_{language.lower()}_{text_hash}.mp3"
-        filepath = os.path.join(self.voice_cache_dir, filename)
+        # Determine which voice to use; voice and model are part of the cache key
+        if narrator_voice:
+            voice_id, model_id = narrator_voice, "eleven_multilingual_v2"
+        else:
+            voice_id, model_id = self._get_voice_for_language(language, None)
+        filename = f"voice_{language.lower()}_{render_key(enhanced_text, voice_id, model_id, NARRATOR_VOICE_SETTINGS, language, namespace=self.cache_namespace)}.mp3"
         
         # Check cache first
-        if os.path.exists(filepath):
+        if self._cached("narration", filename):
             print(f"🔊 Using cached single voice: {filename}")
             return f"static/audio/{filename}"
+        if self._recently_failed(filename):
+            return None
+        
+        return await self._run_render(
+            filename,
+            lambda announce: self._render_single_narrator_voice(enhanced_text, language, voice_id, model_id, filename, announce),
+            on_live
+        )
+    
+    async def _run_render(self, filename: str, render: Callable[[LiveCallback], Awaitable[Optional[str]]], on_live: Optional[LiveCallback] = None) -> Optional[str]:
+        """Start or join the render of `filename`; every caller's on_live hears when it can be played live
+        
+        Callers joining a render that is already streaming are told right away.
+        """
+        if on_live is not None:
+            if self.live_renders.get(filename) is not None:
+                await self._notify_live(on_live, f"audio/live/{filename}")
+                on_live = None
+            else:
+                self._live_listeners.setdefault(filename, []).append(on_live)
         
+        try:
+            return await self._inflight_renders.run(filename, lambda: render(lambda url: self._announce_live(filename, url)))
+        finally:
+            listeners = self._live_listeners.get(filename)
+            if on_live is not None and listeners and on_live in listeners:
+                listeners.remove(on_live)
+                if not listeners:
+                    del self._live_listeners[filename]
+    
+    async def _announce_live(self, filename: str, url: str):
+        for listener in self._live_listeners.pop(filename, []):
+            await self._notify_live(listener, url)
+    
+    @staticmethod
+    async def _notify_live(on_live: LiveCallback, url: str):
+        try:
+            await on_live(url)
+        except Exception as e:
+            print(f"⚠️ Could not announce live audio {url}: {e}")
+    
+    async def _render_single_narrator_voice(self, enhanced_text: str, language: str, voice_id: str, model_id: str, filename: str, on_live: Optional[LiveCallback] = None) -> Optional[str]:
+        """Render a single narrator voice file that is not cached yet"""
         # Mock mode - create silent file
         if self.use_mock:
-            print(f"🎭 Mock: Creating single narrator voice file")
-            await self._create_test_voice_file(filepath, enhanced_text)
-            return f"static/audio/{filename}"
-        
-        # Determine which voice to use
-        if narrator_voice:
-            voice_id = narrator_voice
-            model_id = "eleven_multilingual_v2"
-            print(f"🔒 Using session narrator voice: {voice_id}")
-        else:
-            voice_id, model_id = self._get_voice_for_language(language, None)
-            print(f"🔒 Using language default voice: {voice_id}")
+            print(f"🎭 Mock: Using placeholder for single narrator voice")
+            return f"static/audio/{await self._placeholder_voice()}"
         
+        print(f"🔒 Using narrator voice: {voice_id}")
         try:
             print(f"🔊 Generating {language} single narrator voice...")
             
-            url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+            url = f"{self.base_url}/v1/text-to-speech/{voice_id}/stream"
             headers = {
                 "Accept": "audio/mpeg",
                 "Content-Type": "application/json",
@@ -101,94 +362,33 @@ class AudioService:
             data = {
                 "text": enhanced_text,
                 "model_id": model_id,
-                "voice_settings": {
-                    "stability": 0.4,  # Lower for more expression variety
-                    "similarity_boost": 0.8,  # Higher for voice consistency
-                    "style": 0.3,  # Add some style for character
-                    "use_speaker_boost": True
-                }
+                "voice_settings": NARRATOR_VOICE_SETTINGS
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(url, json=data, headers=headers)
+            response = await self._stream_to_cache(url, data, headers, filename, timeout=30.0, on_live=on_live)
+            
+            if response.status_code == 200:
+                self.voice_cache.add(filename, voice_id, language)
+                self.failed_renders.record_success(filename)
+                
+                print(f"🔊 {language} voice generated successfully: {filename}")
+                return f"static/audio/{filename}"
+            else:
+                print(f"❌ ElevenLabs API error: {response.status_code} - {response.text}")
+                self.failed_renders.record_failure(filename, f"HTTP {response.status_code}")
+                return None
                 
-                if response.status_code == 200:
-                    # Save the audio file
-                    async with aiofiles.open(filepath, 'wb') as f:
-                        await f.write(response.content)
-                    
-                    print(f"🔊 {language} voice generated successfully: {filename}")
-                    return f"static/audio/{filename}"
-                else:
-                    print(f"❌ ElevenLabs API error: {response.status_code} - {response.text}")
-                    # Fallback to test file
-                    await self._create_test_voice_file(filepath, enhanced_text)
-                    return f"static/audio/{filename}"
-                    
+        except CircuitOpenError as e:
+            print(f"⏭️ Skipping narration audio: {e}")
+            return None
         except Exception as e:
             print(f"❌ Error generating voice: {e}")
-            # Fallback to test file
-            await self._create_test_voice_file(filepath, enhanced_text)
-            return f"static/audio/{filename}"
+            self.failed_renders.record_failure(filename, type(e).__name__)
+            return None
     
     def _add_speech_elements(self, text: str) -> str:
         """Add ElevenLabs speech elements for emotional variety and better narration"""
-        import re
-        
-        # Don't process if text is too short
-        if len(text.strip()) < 10:
-            return text
-        
-        enhanced_text = text
-        
-        # Add pauses for dramatic effect
-        enhanced_text = re.sub(r'([.!?])\s+([A-Z])', r'\1 <break time="0.5s"/> \2', enhanced_text)
-        enhanced_text = re.sub(r'([,;:])\s+', r'\1 <break time="0.3s"/> ', enhanced_text)
-        
-        # Enhance dialogue with emotional speech elements
-        dialogue_patterns = [
-            (r'"([^"]*?[!])"', r'"<prosody rate="fast" pitch="+2st">\1</prosody>"'),  # Excited speech
-            (r'"([^"]*?[?])"', r'"<prosody pitch="+1st">\1</prosody>"'),  # Questions
-            (r'"([^"]*?\.\.\.)"', r'"<prosody rate="slow">\1</prosody>"'),  # Hesitation
-            (r'"([^"]*?[.])"', r'"<prosody rate="medium">\1</prosody>"'),  # Normal speech
-        ]
-        
-        for pattern, replacement in dialogue_patterns:
-            enhanced_text = re.sub(pattern, replacement, enhanced_text)
-        
-        # Add emphasis to important words
-        emphasis_words = [
-            'suddenly', 'immediately', 'warning', 'danger', 'attack', 'magic', 
-            'treasure', 'ancient', 'mysterious', 'powerful', 'legendary'
-        ]
-        
-        for word in emphasis_words:
-            pattern = rf'\b({word})\b'
-            replacement = rf'<emphasis level="moderate">\1</emphasis>'
-            enhanced_text = re.sub(pattern, replacement, enhanced_text, flags=re.IGNORECASE)
-        
-        # Add prosody for action descriptions
-        action_patterns = [
-            (r'(fights?|attacks?|strikes?|slashes?)', r'<prosody rate="fast" pitch="+1st">\1</prosody>'),
-            (r'(whispers?|murmurs?)', r'<prosody volume="soft">\1</prosody>'),
-            (r'(shouts?|yells?|screams?)', r'<prosody volume="loud" pitch="+2st">\1</prosody>'),
-            (r'(creeps?|sneaks?|tiptoes?)', r'<prosody rate="slow" volume="soft">\1</prosody>'),
-        ]
-        
-        for pattern, replacement in action_patterns:
-            enhanced_text = re.sub(pattern, replacement, enhanced_text, flags=re.IGNORECASE)
-        
-        # Add breathing for long narrations
-        if len(enhanced_text) > 200:
-            sentences = enhanced_text.split('. ')
-            if len(sentences) > 3:
-                # Add breath after every 2-3 sentences
-                for i in range(2, len(sentences), 3):
-                    if i < len(sentences):
-                        sentences[i] = '<break time="0.8s"/> ' + sentences[i]
-                enhanced_text = '. '.join(sentences)
-        
-        return enhanced_text
+        return add_speech_elements(text)
     
     def _get_voice_for_language(self, language: str, custom_voice_id: Optional[str] = None) -> tuple[str, str]:
         """Get appropriate voice ID and model ID for the specified language"""
@@ -218,111 +418,111 @@ class AudioService:
         # Default to English if language not found
         return language_voices.get(language, language_voices["English"])
     
-    async def _create_test_voice_file(self, filepath: str, text: str):
-        """Create a small test MP3 file with metadata"""
-        # Create a minimal silent MP3 file for testing
-        # This is a valid MP3 header for a 1-second silent file
-        mp3_header = bytes([
-            0xFF, 0xFB, 0x90, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-            0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00
-        ])
-        
-        async with aiofiles.open(filepath, 'wb') as f:
-            # Write a minimal MP3 structure
-            await f.write(mp3_header * 100)  # Repeat to make it ~1 second
-        
-        print(f"🎭 Created test voice file: {os.path.basename(filepath)}")
+    async def _placeholder_voice(self) -> str:
+        """Return the shared silent placeholder used in mock mode, writing it if needed"""
+        filepath = self.voice_cache.path(PLACEHOLDER_FILENAME)
+        if not os.path.exists(filepath):
+            async with aiofiles.open(filepath, 'wb') as f:
+                await f.write(PLACEHOLDER_MP3)
+            print(f"🎭 Created placeholder voice file: {PLACEHOLDER_FILENAME}")
+        return PLACEHOLDER_FILENAME
+    
+    def _purge_placeholders(self) -> int:
+        """Delete placeholder audio that earlier versions cached under real narration names"""
+        purged = 0
+        for filename in self.voice_cache.filenames_with_size(len(PLACEHOLDER_MP3)):
+            if filename == PLACEHOLDER_FILENAME:
+                continue
+            try:
+                with open(self.voice_cache.path(filename), 'rb') as f:
+                    if f.read() != PLACEHOLDER_MP3:
+                        continue
+            except OSError:
+                continue
+            self.voice_cache.remove(filename)
+            purged += 1
+        if purged:
+            print(f"🧹 Removed {purged} cached placeholder voice files")
+        return purged
+    
+    def _cached(self, kind: str, filename: str) -> bool:
+        """Voice cache lookup that feeds the hit/miss counters"""
+        hit = self.voice_cache.lookup(filename)
+        self.cache_stats.record(kind, hit)
+        return hit
+    
+    def cache_report(self) -> dict:
+        """Hit rates, cache size, recent failures and circuit states"""
+        return {
+            "lookups": self.cache_stats.stats(),
+            "voice_cache": self.voice_cache.stats(),
+            "failed_renders": self.failed_renders.stats(),
+            "circuits": {endpoint: breaker.stats() for endpoint, breaker in self.breakers.items()}
+        }
+    
+    def _recently_failed(self, key: str) -> bool:
+        remaining = self.failed_renders.blocked(key)
+        if remaining is None:
+            return False
+        print(f"⏭️ {key} failed recently, retrying in {remaining:.0f}s")
+        return True
     
     async def select_background_music(self, scene_type: str) -> Optional[str]:
         """Select appropriate background music based on scene type"""
-        if not os.path.exists(self.bgm_folder):
-            print(f"BGM folder not found: {self.bgm_folder}")
-            return None
-        
-        # Get all audio files from BGM folder
-        audio_extensions = ['.mp3', '.wav', '.ogg', '.m4a']
-        bgm_files = []
-        
-        try:
-            for file in os.listdir(self.bgm_folder):
-                if any(file.lower().endswith(ext) for ext in audio_extensions):
-                    bgm_files.append(os.path.join(self.bgm_folder, file))
-        except Exception as e:
-            print(f"Error reading BGM folder: {e}")
-            return None
+        if not self.bgm_library.scanned:
+            await self.bgm_library.refresh()
         
-        if not bgm_files:
+        track = self.bgm_library.select(scene_type)
+        if track is None:
             print("No background music files found")
             return None
         
-        # Select music based on scene type
-        selected_file = self._select_music_by_scene(bgm_files, scene_type)
-        
-        # Return relative path for frontend access
-        if selected_file:
-            filename = os.path.basename(selected_file)
-            return f"static/bgm/{filename}"
-        
-        return None
-    
-    def _select_music_by_scene(self, bgm_files: List[str], scene_type: str) -> str:
-        """Select appropriate music file based on scene type"""
-        # Keywords to match in filenames
-        scene_keywords = {
-            "combat": ["combat", "battle", "fight", "war", "boss", "action", "intense"],
-            "dialog": ["calm", "peaceful", "quiet", "ambient", "soft", "gentle"],
-            "exploration": ["mystery", "adventure", "explore", "dungeon", "forest", "ambient"],
-            "adventure": ["adventure", "journey", "travel", "theme", "main"]
-        }
-        
-        keywords = scene_keywords.get(scene_type, scene_keywords["adventure"])
-        
-        # First try to find files matching scene keywords
-        matching_files = []
-        for file in bgm_files:
-            filename_lower = os.path.basename(file).lower()
-            if any(keyword in filename_lower for keyword in keywords):
-                matching_files.append(file)
-        
-        # If no matching files found, use any available file
-        if not matching_files:
-            matching_files = bgm_files
-        
-        return random.choice(matching_files)
+        # Relative, content-addressed URL for frontend access
+        return track.url
     
-    async def _generate_multi_voice_story(self, text: str, language: str, character_voices: dict, narrator_voice_id: Optional[str] = None) -> Optional[str]:
+    async def _generate_multi_voice_story(self, text: str, language: str, character_voices: dict, narrator_voice_id: Optional[str] = None, on_live: Optional[LiveCallback] = None) -> Optional[str]:
         """Generate story with multiple character voices using ElevenLabs Text to Dialogue API"""
         import re
         
-        # Create unique filename including narrator voice for proper caching
-        narrator_for_hash = narrator_voice_id or "default"
-        text_hash = hashlib.md5(f"{text}_{language}_{str(character_voices)}_{narrator_for_hash}".encode()).hexdigest()
-        filename = f"voice_multivoice_{language.lower()}_{text_hash}.mp3"
-        filepath = os.path.join(self.voice_cache_dir, filename)
+        # Create unique filename from the text, roster and narrator voice for proper caching
+        key = render_key(text, narrator_voice_id, DIALOGUE_MODEL_ID, DIALOGUE_SETTINGS, language, character_voices, self.cache_namespace)
+        filename = f"voice_multivoice_{language.lower()}_{key}.mp3"
         
         # Check if we already have this cached
-        if os.path.exists(filepath):
+        if self._cached("multivoice", filename):
             print(f"🔊 Using cached multi-voice story: {filename}")
             return f"static/audio/{filename}"
         
+        return await self._run_render(
+            filename,
+            lambda announce: self._render_multi_voice_story(text, language, character_voices, narrator_voice_id, filename, announce),
+            on_live
+        )
+    
+    async def _render_multi_voice_story(self, text: str, language: str, character_voices: dict, narrator_voice_id: Optional[str], filename: str, on_live: Optional[LiveCallback] = None) -> Optional[str]:
+        """Render a multi-voice story file that is not cached yet"""
         # Parse text into dialogue segments with appropriate voices
         dialogue_inputs = self._create_dialogue_inputs(text, character_voices, narrator_voice_id)
         
         if not dialogue_inputs or len(dialogue_inputs) <= 1:
             # Fallback to single narrator voice if no character dialogue detected
             print(f"🔊 Multi-voice fallback: No character dialogue detected, using single narrator voice")
-            return await self._generate_single_narrator_voice(text, language, narrator_voice_id)
+            return await self._generate_single_narrator_voice(text, language, narrator_voice_id, on_live)
         
         if self.use_mock:
-            print(f"🎭 Mock: Creating multi-voice story with dialogue API")
-            await self._create_test_voice_file(filepath, text)
-            return f"static/audio/{filename}"
+            print(f"🎭 Mock: Using placeholder for multi-voice story")
+            return f"static/audio/{await self._placeholder_voice()}"
+        
+        # Chapters made only of lines rendered before are assembled without any API call
+        if self._all_segments_cached(dialogue_inputs, narrator_voice_id):
+            print(f"♻️ All {len(dialogue_inputs)} dialogue segments cached, assembling chapter from segments")
+            return await self._generate_segment_based_multi_voice(text, language, character_voices, narrator_voice_id, filename)
         
         try:
             # Try Text to Dialogue API first (if available)
             print(f"🔊 Attempting multi-voice story using Text to Dialogue API...")
             
-            url = "https://api.elevenlabs.io/v1/text-to-dialogue/convert"
+            url = f"{self.base_url}/v1/text-to-dialogue/stream"
             headers = {
                 "Accept": "audio/mpeg",
                 "Content-Type": "application/json",
@@ -332,34 +532,31 @@ class AudioService:
             # Use the Text to Dialogue API structure
             data = {
                 "inputs": dialogue_inputs,
-                "model_id": "eleven_v3",  # Text to Dialogue requires v3
-                "settings": {
-                    "stability": 0.5,
-                    "similarity_boost": 0.8,
-                    "style": 0.3
-                }
+                "model_id": DIALOGUE_MODEL_ID,
+                "settings": DIALOGUE_SETTINGS
             }
             
-            async with httpx.AsyncClient(timeout=90.0) as client:
-                response = await client.post(url, json=data, headers=headers)
+            response = await self._stream_to_cache(url, data, headers, filename, timeout=90.0, on_live=on_live, endpoint="dialogue")
+            
+            if response.status_code == 200:
+                self.voice_cache.add(filename, narrator_voice_id, language)
+                print(f"🔊 Multi-voice dialogue generated successfully using Text to Dialogue API: {filename}")
+                return f"static/audio/{filename}"
+            elif response.status_code == 404:
+                print(f"⚠️ Text to Dialogue API not available (404) - falling back to segment-based approach...")
+                return await self._generate_segment_based_multi_voice(text, language, character_voices, narrator_voice_id, filename)
+            else:
+                print(f"❌ ElevenLabs Text to Dialogue API error: {response.status_code} - {response.text}")
+                print(f"🔄 Falling back to segment-based approach...")
+                return await self._generate_segment_based_multi_voice(text, language, character_voices, narrator_voice_id, filename)
                 
-                if response.status_code == 200:
-                    async with aiofiles.open(filepath, 'wb') as f:
-                        await f.write(response.content)
-                    print(f"🔊 Multi-voice dialogue generated successfully using Text to Dialogue API: {filename}")
-                    return f"static/audio/{filename}"
-                elif response.status_code == 404:
-                    print(f"⚠️ Text to Dialogue API not available (404) - falling back to segment-based approach...")
-                    return await self._generate_segment_based_multi_voice(text, language, character_voices, narrator_voice_id, filepath, filename)
-                else:
-                    print(f"❌ ElevenLabs Text to Dialogue API error: {response.status_code} - {response.text}")
-                    print(f"🔄 Falling back to segment-based approach...")
-                    return await self._generate_segment_based_multi_voice(text, language, character_voices, narrator_voice_id, filepath, filename)
-                    
+        except CircuitOpenError as e:
+            print(f"⏭️ {e}, using segment-based approach")
+            return await self._generate_segment_based_multi_voice(text, language, character_voices, narrator_voice_id, filename)
         except Exception as e:
             print(f"❌ Error with Text to Dialogue API: {e}")
             print(f"🔄 Falling back to segment-based approach...")
-            return await self._generate_segment_based_multi_voice(text, language, character_voices, narrator_voice_id, filepath, filename)
+            return await self._generate_segment_based_multi_voice(text, language, character_voices, narrator_voice_id, filename)
     
     def _create_dialogue_inputs(self, text: str, character_voices: dict, narrator_voice_id: Optional[str] = None) -> List[dict]:
         """Parse text into dialogue inputs for ElevenLabs Text to Dialogue API"""
@@ -409,237 +606,27 @@ class AudioService:
     
     def _parse_text_segments(self, text: str, char_voice_map: dict) -> List[dict]:
         """Parse text into segments with voice assignments"""
-        import re
-        
-        segments = []
-        current_pos = 0
-        
-        # Create comprehensive patterns for all characters (including German support)
-        all_patterns = []
-        for char_name, voice_id in char_voice_map.items():
-            escaped_name = re.escape(char_name)
-            
-            # Create both exact name and pronoun patterns
-            name_patterns = [escaped_name]
-            
-            # Add common pronouns that might refer to this character
-            # We'll check if the character name appears in the sentence context
-            pronoun_patterns = [
-                r'(?:he|she|they|er|sie)',  # English/German pronouns
-                r'(?:him|her|them|ihn|ihr)',  # Object pronouns
-            ]
-            
-            patterns = [
-                # Direct speech patterns
-                # "Text" says CharacterName / "Text" sagt CharacterName
-                (rf'"([^"]+)"\s+(?:says?|speaks?|calls?|shouts?|whispers?|replies?|responds?|asks?|sagt|spricht|ruft|flüstert|antwortet)\s+{escaped_name}(?:\b|\.)', voice_id),
-                
-                # CharacterName says "Text" / CharacterName sagt "Text"
-                (rf'{escaped_name}\s+(?:says?|speaks?|calls?|shouts?|whispers?|replies?|responds?|asks?|sagt|spricht|ruft|flüstert|antwortet)(?:\s*[:,])?\s*"([^"]+)"', voice_id),
-                
-                # CharacterName: "Text"
-                (rf'{escaped_name}:\s*"([^"]+)"', voice_id),
-                
-                # "Text," CharacterName said / "Text," sagte CharacterName
-                (rf'"([^"]+),"\s+(?:said|replied|responded|called|shouted|whispered|sagte|antwortete)\s+{escaped_name}', voice_id),
-                
-                # German compound verb patterns - KEY FOR YOUR EXAMPLE
-                # CharacterName rief aus: "Text" / CharacterName stimmte zu: "Text"
-                (rf'{escaped_name}\s+(?:rief\s+aus|stimmte\s+zu|stimmte\s+ihm\s+zu|stimmte\s+ihr\s+zu|antwortete\s+ihm|antwortete\s+ihr|rief\s+zurück|rief\s+hinüber|murmelte\s+vor\s+sich\s+hin|flüsterte\s+leise|schrie\s+laut|sagte\s+leise|sagte\s+laut):\s*"([^"]+)"', voice_id),
-                
-                # More German speech verbs with prepositions
-                (rf'{escaped_name}\s+(?:rief|schrie|flüsterte|murmelte|seufzte|lachte|kicherte|brummte|grinste|nickte|winkte)\s+(?:aus|zu|hinüber|zurück|leise|laut|vor\s+sich\s+hin)?:?\s*"([^"]+)"', voice_id),
-                
-                # Narrative style patterns - key improvement for your example
-                # He/She breaks... "Text" (when character name appears in context)
-                (rf'(?:{escaped_name}[^.!?]*?|(?:he|she|they|er|sie)\s+[^.!?]*?)(?:breaks?|speaks?|continues?|adds?|responds?|replies?|says?|calls?|shouts?|whispers?|bricht|spricht|sagt|antwortet|ruft|flüstert)[^"]*?"([^"]+)"', voice_id),
-                
-                # More flexible: any sentence mentioning character name followed by quoted speech
-                (rf'(?:[^.!?]*{escaped_name}[^.!?]*?"([^"]+)")', voice_id),
-                
-                # Character name appears before quoted text (within same sentence or nearby)
-                # This catches cases where character is mentioned and then speaks without explicit speech verb
-                (rf'{escaped_name}[^"]*?"([^"]+)"', voice_id),
-                
-                # German narrative style: Character performs action then speaks
-                # E.g., "Bert sieht zur Lady Melk hinüber, seine Stimme... 'Text'"
-                (rf'{escaped_name}[^"]*?(?:sieht|blickt|wendet|dreht|nickt|schaut)[^"]*?"([^"]+)"', voice_id),
-                
-                # Extended German patterns for complex expressions
-                # CharacterName stimmte ihm zu / CharacterName agreed with him
-                (rf'{escaped_name}\s+(?:stimmte\s+(?:ihm|ihr|ihnen)\s+zu|antwortete\s+(?:ihm|ihr|ihnen)|erwiderte\s+(?:ihm|ihr|ihnen)|entgegnete\s+(?:ihm|ihr|ihnen))[^"]*:\s*"([^"]+)"', voice_id),
-                
-                # Pronoun-based patterns when character name appears in recent context
-                # This is trickier but we'll look for pronouns in sentences that follow character mentions
-            ]
-            
-            all_patterns.extend([(p[0], voice_id, char_name) for p in patterns])
-        
-        # Additional context-aware pattern matching
-        # Find character mentions and then look for pronouns with dialogue in nearby text
-        for char_name, voice_id in char_voice_map.items():
-            escaped_name = re.escape(char_name)
-            
-            # Find all mentions of the character name
-            name_mentions = list(re.finditer(rf'\b{escaped_name}\b', text, re.IGNORECASE))
-            
-            for mention in name_mentions:
-                # Look for quoted speech within the next 200 characters after character mention
-                search_start = mention.start()
-                search_end = min(mention.end() + 200, len(text))
-                context_text = text[search_start:search_end]
-                
-                # Look for pronouns followed by actions and dialogue
-                pronoun_dialogue_patterns = [
-                    r'(?:he|she|they|er|sie)\s+[^"]*?"([^"]+)"',
-                    r'(?:his|her|their|sein|ihr)\s+[^"]*?"([^"]+)"',
-                ]
-                
-                for pattern in pronoun_dialogue_patterns:
-                    for match in re.finditer(pattern, context_text, re.IGNORECASE):
-                        full_match_start = search_start + match.start()
-                        full_match_end = search_start + match.end()
-                        
-                        all_patterns.append((
-                            text[full_match_start:full_match_end],
-                            voice_id,
-                            char_name,
-                            full_match_start,
-                            full_match_end
-                        ))
-        
-        # Find all character speech matches
-        matches = []
-        print(f"🔍 Analyzing text for character voices: {list(char_voice_map.keys())}")
-        print(f"🔍 Text to analyze: {text[:200]}...")
-        
-        for pattern_data in all_patterns:
-            if len(pattern_data) == 3:  # Regular pattern
-                pattern, voice_id, char_name = pattern_data
-                for match in re.finditer(pattern, text, re.IGNORECASE):
-                    matched_text = match.group(0)
-                    # Extract only the quoted speech from the match
-                    quote_match = re.search(r'"([^"]+)"', matched_text)
-                    if quote_match:
-                        quoted_text = quote_match.group(1)  # Only the text inside quotes
-                        print(f"✅ Found dialogue for {char_name}: \"{quoted_text[:50]}...\"")
-                        matches.append({
-                            'start': match.start(),
-                            'end': match.end(),
-                            'full_text': matched_text,  # Keep full context for positioning
-                            'speech_text': quoted_text,  # Only the quoted speech
-                            'voice_id': voice_id,
-                            'character': char_name
-                        })
-                    else:
-                        print(f"⚠️ No quotes found in match for {char_name}: {matched_text[:50]}...")
-            else:  # Pre-computed match from context analysis
-                match_text, voice_id, char_name, start, end = pattern_data
-                # Extract only the quoted speech from context matches too
-                quote_match = re.search(r'"([^"]+)"', match_text)
-                if quote_match:
-                    quoted_text = quote_match.group(1)
-                    print(f"✅ Found context dialogue for {char_name}: \"{quoted_text[:50]}...\"")
-                    matches.append({
-                        'start': start,
-                        'end': end,
-                        'full_text': match_text,
-                        'speech_text': quoted_text,
-                        'voice_id': voice_id,
-                        'character': char_name
-                    })
-                else:
-                    print(f"⚠️ No quotes in context match for {char_name}: {match_text[:50]}...")
-        
-        print(f"🔍 Total matches found: {len(matches)}")
-        
-        # Remove overlapping matches (keep the longest/most specific one)
-        matches = self._remove_overlapping_matches(matches)
-        
-        # Sort matches by position
-        matches.sort(key=lambda x: x['start'])
-        
-        # Create segments with proper narrator/character separation
-        for i, match in enumerate(matches):
-            # Add narrator text before this character speech (including the attribution)
-            if match['start'] > current_pos:
-                narrator_text = text[current_pos:match['start']].strip()
-                if narrator_text:
-                    segments.append({
-                        'text': narrator_text,
-                        'voice_id': None,  # Will use narrator voice
-                        'type': 'narrator'
-                    })
-            
-            # Extract the attribution part (everything except the quoted speech)
-            full_match_text = match['full_text']
-            speech_text = match['speech_text']
-            
-            # Find the quote in the full match and separate attribution from speech
-            quote_start = full_match_text.find(f'"{speech_text}"')
-            if quote_start > 0:
-                # Add attribution as narrator (e.g., "Melk rief aus:")
-                attribution = full_match_text[:quote_start].strip()
-                if attribution:
-                    segments.append({
-                        'text': attribution,
-                        'voice_id': None,  # Narrator voice for attribution
-                        'type': 'attribution'
-                    })
-            
-            # Add only the quoted character speech
-            segments.append({
-                'text': speech_text,  # Only the quoted text
-                'voice_id': match['voice_id'],
-                'type': 'character_speech',
-                'character': match['character']
-            })
-            
-            current_pos = match['end']
-        
-        # Add remaining narrator text
-        if current_pos < len(text):
-            remaining_text = text[current_pos:].strip()
-            if remaining_text:
-                segments.append({
-                    'text': remaining_text,
-                    'voice_id': None,  # Will use narrator voice
-                    'type': 'narrator'
-                })
-        
-        # If no character speech was found, return the entire text as narrator
-        if not segments:
-            segments = [{
-                'text': text,
-                'voice_id': None,
-                'type': 'narrator'
-            }]
-        
-        return segments
+        return self._get_dialogue_attributor(char_voice_map).parse(text)
+    
+    def _get_dialogue_attributor(self, char_voice_map: dict) -> DialogueAttributor:
+        """Return the compiled attributor for this roster, building it when the roster changes"""
+        roster_key = tuple(sorted(char_voice_map.items()))
+        attributor = self._attributors.get(roster_key)
+        if attributor is None:
+            attributor = DialogueAttributor(char_voice_map)
+            self._attributors[roster_key] = attributor
+            # Keep only recently used rosters
+            while len(self._attributors) > self.max_cached_rosters:
+                self._attributors.popitem(last=False)
+        else:
+            self._attributors.move_to_end(roster_key)
+        return attributor
     
     def _remove_overlapping_matches(self, matches: List[dict]) -> List[dict]:
         """Remove overlapping matches, keeping the most specific ones"""
-        if not matches:
-            return matches
-        
-        # Sort by start position, then by length (longer matches first)
-        sorted_matches = sorted(matches, key=lambda x: (x['start'], -(x['end'] - x['start'])))
-        
-        filtered_matches = []
-        for match in sorted_matches:
-            # Check if this match overlaps with any already accepted match
-            overlaps = False
-            for accepted in filtered_matches:
-                if (match['start'] < accepted['end'] and match['end'] > accepted['start']):
-                    overlaps = True
-                    break
-            
-            if not overlaps:
-                filtered_matches.append(match)
-        
-        return filtered_matches
+        return resolve_overlaps(matches)
     
-    async def _generate_segment_based_multi_voice(self, text: str, language: str, character_voices: dict, narrator_voice_id: Optional[str], filepath: str, filename: str) -> Optional[str]:
+    async def _generate_segment_based_multi_voice(self, text: str, language: str, character_voices: dict, narrator_voice_id: Optional[str], filename: str) -> Optional[str]:
         """Generate multi-voice audio by creating segments and concatenating them"""
         
         print(f"🔊 Using segment-based multi-voice generation...")
@@ -651,73 +638,123 @@ class AudioService:
             # No character dialogue, use single voice
             return await self._generate_single_narrator_voice(text, language, narrator_voice_id)
         
-        # Generate individual segments
-        segment_files = []
-        temp_dir = os.path.join(self.voice_cache_dir, "temp_segments")
-        os.makedirs(temp_dir, exist_ok=True)
+        # Generate individual segments concurrently, then reassemble in story order.
+        # Segments live in the voice cache and are reused by later chapters.
+        semaphore = asyncio.Semaphore(self.segment_concurrency)
         
-        try:
-            for i, segment in enumerate(dialogue_inputs):
-                segment_voice_id = segment.get('voice_id', narrator_voice_id)
-                segment_text = segment['text']
-                
-                # Generate individual segment
-                segment_filename = f"segment_{i}_{hashlib.md5(segment_text.encode()).hexdigest()[:8]}.mp3"
-                segment_filepath = os.path.join(temp_dir, segment_filename)
-                
-                # Generate audio for this segment
-                success = await self._generate_individual_segment(
-                    segment_text, 
-                    language, 
-                    segment_voice_id, 
-                    segment_filepath
-                )
-                
-                if success and os.path.exists(segment_filepath):
-                    segment_files.append(segment_filepath)
-                    print(f"🔊 Generated segment {i+1}/{len(dialogue_inputs)}: {segment_filename}")
-                else:
-                    print(f"❌ Failed to generate segment {i+1}")
+        async def render_segment(i: int, segment: dict) -> Optional[str]:
+            segment_voice_id = segment.get('voice_id', narrator_voice_id)
+            segment_text = segment['text']
             
-            if not segment_files:
-                print(f"❌ No segments generated successfully")
-                return await self._generate_single_narrator_voice(text, language, narrator_voice_id)
+            segment_file = await self._generate_segment_with_retries(segment_text, language, segment_voice_id, semaphore)
+            if segment_file:
+                print(f"🔊 Segment {i+1}/{len(dialogue_inputs)} ready: {os.path.basename(segment_file)}")
+                return segment_file
             
-            # Concatenate segments using ffmpeg if available, otherwise use first segment
-            if len(segment_files) == 1:
-                # Only one segment, just copy it
-                shutil.copy2(segment_files[0], filepath)
-                print(f"🔊 Single segment saved as: {filename}")
+            # Partial failure: keep the line in the chapter using the narrator voice
+            if segment_voice_id != narrator_voice_id:
+                print(f"⚠️ Segment {i+1} failed with character voice, retrying with narrator voice")
+                segment_file = await self._generate_segment_with_retries(segment_text, language, narrator_voice_id, semaphore)
+                if segment_file:
+                    return segment_file
+            
+            print(f"❌ Failed to generate segment {i+1}")
+            return None
+        
+        results = await asyncio.gather(*(render_segment(i, segment) for i, segment in enumerate(dialogue_inputs)))
+        segment_files = [segment_file for segment_file in results if segment_file]
+        
+        if segment_files and len(segment_files) < len(dialogue_inputs):
+            print(f"⚠️ {len(dialogue_inputs) - len(segment_files)}/{len(dialogue_inputs)} segments missing from multi-voice audio")
+        
+        if not segment_files:
+            print(f"❌ No segments generated successfully")
+            return await self._generate_single_narrator_voice(text, language, narrator_voice_id)
+        
+        # Only a complete chapter is stored under its content-addressed name; an
+        # incomplete one gets its own name so the next request renders it again
+        partial_filename = os.path.splitext(filename)[0] + ".partial.mp3"
+        output_filename = filename if len(segment_files) == len(dialogue_inputs) else partial_filename
+        
+        # Concatenate segments, falling back to the first segment if they cannot be joined
+        if len(segment_files) == 1:
+            # Only one segment, just copy it
+            shutil.copy2(segment_files[0], self.voice_cache.path(output_filename))
+            print(f"🔊 Single segment saved as: {output_filename}")
+        else:
+            # Try to concatenate segments
+            success = await self._concatenate_audio_segments(segment_files, self.voice_cache.path(output_filename))
+            if success:
+                print(f"🔊 Multi-voice audio concatenated successfully: {output_filename}")
             else:
-                # Try to concatenate segments
-                success = await self._concatenate_audio_segments(segment_files, filepath)
-                if success:
-                    print(f"🔊 Multi-voice audio concatenated successfully: {filename}")
-                else:
-                    # Fallback: use the first segment
-                    shutil.copy2(segment_files[0], filepath)
-                    print(f"🔊 Concatenation failed, using first segment: {filename}")
+                # Fallback: use the first segment
+                output_filename = partial_filename
+                shutil.copy2(segment_files[0], self.voice_cache.path(output_filename))
+                print(f"🔊 Concatenation failed, using first segment: {output_filename}")
+        
+        self.voice_cache.add(output_filename, narrator_voice_id, language)
+        return f"static/audio/{output_filename}"
+    
+    async def _generate_segment_with_retries(self, text: str, language: str, voice_id: str, semaphore: asyncio.Semaphore) -> Optional[str]:
+        """Generate one segment under the concurrency cap, retrying with backoff"""
+        voice_id = voice_id or FREYA_VOICE_ID
+        filename = self._segment_cache_filename(text, voice_id, SEGMENT_MODEL_ID, SEGMENT_VOICE_SETTINGS)
+        if self._recently_failed(filename):
+            return None
+        
+        for attempt in range(self.segment_retries + 1):
+            async with semaphore:
+                segment_file = await self._generate_individual_segment(text, language, voice_id)
             
-            return f"static/audio/{filename}"
+            if segment_file:
+                self.failed_renders.record_success(filename)
+                return segment_file
             
-        finally:
-            # Clean up temporary segment files
-            for segment_file in segment_files:
-                try:
-                    if os.path.exists(segment_file):
-                        os.remove(segment_file)
-                except Exception as e:
-                    print(f"⚠️ Could not clean up segment file {segment_file}: {e}")
+            if self.breakers["tts"].is_open:
+                # Retrying cannot succeed until the cooldown is over; an outage is not this line's fault
+                return None
+            if attempt < self.segment_retries:
+                # Back off outside the semaphore so other segments keep rendering
+                await asyncio.sleep(0.5 * (2 ** attempt))
+        
+        self.failed_renders.record_failure(filename, f"{self.segment_retries + 1} attempts")
+        return None
     
-    async def _generate_individual_segment(self, text: str, language: str, voice_id: str, filepath: str) -> bool:
-        """Generate audio for a single text segment"""
-        enhanced_text = self._add_speech_elements(text)
-        
+    def _segment_cache_filename(self, text: str, voice_id: str, model_id: str, voice_settings: dict) -> str:
+        """Cache file name for one rendered line, independent of the chapter it appears in"""
+        return f"segment_{render_key(text, voice_id, model_id, voice_settings, namespace=self.cache_namespace)}.mp3"
+    
+    def _all_segments_cached(self, dialogue_inputs: List[dict], narrator_voice_id: Optional[str]) -> bool:
+        """Check whether every line of a chapter has been rendered before"""
+        for segment in dialogue_inputs:
+            # Same voice resolution as render_segment and _generate_individual_segment
+            voice_id = segment.get('voice_id', narrator_voice_id) or FREYA_VOICE_ID
+            filename = self._segment_cache_filename(segment['text'], voice_id, SEGMENT_MODEL_ID, SEGMENT_VOICE_SETTINGS)
+            if not self.voice_cache.lookup(filename):
+                return False
+        return True
+    
+    async def _generate_individual_segment(self, text: str, language: str, voice_id: str) -> Optional[str]:
+        """Generate audio for a single text segment, reusing earlier renders of the same line"""
         if not voice_id:
-            voice_id = "pFZP5JQG7iQjIQuC4Bku"  # Freya narrator voice
+            voice_id = FREYA_VOICE_ID  # Freya narrator voice
+        
+        filename = self._segment_cache_filename(text, voice_id, SEGMENT_MODEL_ID, SEGMENT_VOICE_SETTINGS)
+        if self._cached("segment", filename):
+            return self.voice_cache.path(filename)
+        
+        return await self._inflight_renders.run(
+            filename,
+            lambda: self._render_individual_segment(text, language, voice_id, filename)
+        )
+    
+    async def _render_individual_segment(self, text: str, language: str, voice_id: str, filename: str) -> Optional[str]:
+        """Render one segment that is not cached yet"""
+        enhanced_text = self._add_speech_elements(text)
+        filepath = self.voice_cache.path(filename)
         
         try:
-            url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+            url = f"{self.base_url}/v1/text-to-speech/{voice_id}/stream"
             headers = {
                 "Accept": "audio/mpeg",
                 "Content-Type": "application/json",
@@ -727,72 +764,78 @@ class AudioService:
             # Use multilingual model for better language support
             data = {
                 "text": enhanced_text,
-                "model_id": "eleven_multilingual_v2",
-                "voice_settings": {
-                    "stability": 0.5,
-                    "similarity_boost": 0.8,
-                    "style": 0.3,
-                    "use_speaker_boost": True
-                }
+                "model_id": SEGMENT_MODEL_ID,
+                "voice_settings": SEGMENT_VOICE_SETTINGS
             }
             
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(url, json=data, headers=headers)
+            response = await self._stream_to_cache(url, data, headers, filename, timeout=60.0)
+            
+            if response.status_code == 200:
+                self.voice_cache.add(filename, voice_id, language)
+                return filepath
+            else:
+                print(f"❌ Error generating segment: {response.status_code}")
+                return None
                 
-                if response.status_code == 200:
-                    async with aiofiles.open(filepath, 'wb') as f:
-                        await f.write(response.content)
-                    return True
-                else:
-                    print(f"❌ Error generating segment: {response.status_code}")
-                    return False
-                    
+        except CircuitOpenError:
+            return None
         except Exception as e:
             print(f"❌ Error generating individual segment: {e}")
-            return False
+            return None
     
     async def _concatenate_audio_segments(self, segment_files: List[str], output_path: str) -> bool:
         """Concatenate multiple audio segments into one file"""
+        loop = asyncio.get_running_loop()
+        try:
+            # Same encoding (the normal case for ElevenLabs output): copy MP3 frames in-process
+            frame_count = await loop.run_in_executor(None, concatenate_mp3_files, segment_files, output_path)
+            print(f"🔗 Joined {len(segment_files)} segments frame by frame ({frame_count} frames)")
+            return True
+        except Mp3FormatError as e:
+            print(f"⚠️ Segments cannot be joined frame by frame ({e}), re-encoding with ffmpeg")
+        except OSError as e:
+            print(f"❌ Error concatenating segments: {e}")
+            return False
+        
+        return await self._concatenate_with_ffmpeg(segment_files, output_path)
+    
+    async def _concatenate_with_ffmpeg(self, segment_files: List[str], output_path: str) -> bool:
+        """Re-encode segments with differing formats into one MP3 without blocking the event loop"""
+        temp_list_file = output_path + "_list.txt"
         try:
-            # Check if ffmpeg is available
-            subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
-            
-            # Create ffmpeg command for concatenation
-            # First, create a temporary file list
-            temp_list_file = output_path + "_list.txt"
-            
             with open(temp_list_file, 'w') as f:
                 for segment_file in segment_files:
                     f.write(f"file '{os.path.abspath(segment_file)}'\n")
             
-            # Run ffmpeg to concatenate
-            cmd = [
+            process = await asyncio.create_subprocess_exec(
                 'ffmpeg', '-y',  # -y to overwrite output file
                 '-f', 'concat',
                 '-safe', '0',
                 '-i', temp_list_file,
-                '-c', 'copy',  # Copy streams without re-encoding
-                output_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            
-            # Clean up temp file
-            if os.path.exists(temp_list_file):
-                os.remove(temp_list_file)
+                '-c:a', 'libmp3lame',
+                '-b:a', '128k',
+                '-ar', '44100',
+                '-f', 'mp3',
+                output_path,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await process.communicate()
             
-            if result.returncode == 0:
+            if process.returncode == 0:
                 return True
-            else:
-                print(f"❌ ffmpeg error: {result.stderr}")
-                return False
-                
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            print(f"⚠️ ffmpeg not available, cannot concatenate audio segments")
+            print(f"❌ ffmpeg error: {stderr.decode(errors='replace')[-500:]}")
+            return False
+            
+        except FileNotFoundError:
+            print(f"⚠️ ffmpeg not available, cannot re-encode mismatched audio segments")
             return False
         except Exception as e:
             print(f"❌ Error concatenating segments: {e}")
             return False
+        finally:
+            if os.path.exists(temp_list_file):
+                os.remove(temp_list_file)
 
     def _create_voice_tagged_text(self, text: str, character_voices: dict) -> str:
         """Create ElevenLabs voice-tagged text for character speech"""
@@ -924,22 +967,24 @@ class AudioService:
         """Generate audio for a single segment"""
         enhanced_text = self._add_speech_elements(text)
         
-        # Create filename for this segment
-        text_hash = hashlib.md5(f"{enhanced_text}_{language}_{voice_id}".encode()).hexdigest()
-        filename = f"voice_segment_{language.lower()}_{text_hash}.mp3"
-        filepath = os.path.join(self.voice_cache_dir, filename)
+        model_id = "eleven_multilingual_v2"
+        voice_settings = NARRATOR_VOICE_SETTINGS
+        
+        # Segments are cached by line, voice and render settings so any chapter can reuse them
+        filename = self._segment_cache_filename(text, voice_id, model_id, voice_settings)
         
         # Check if we already have this cached
-        if os.path.exists(filepath):
+        if self._cached("segment", filename):
             return filename
+        if self._recently_failed(filename):
+            return None
         
         if self.use_mock:
-            await self._create_test_voice_file(filepath, enhanced_text)
-            return filename
+            return await self._placeholder_voice()
         
         # Generate with ElevenLabs
         try:
-            url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+            url = f"{self.base_url}/v1/text-to-speech/{voice_id}/stream"
             headers = {
                 "Accept": "audio/mpeg",
                 "Content-Type": "application/json",
@@ -948,60 +993,53 @@ class AudioService:
             
             data = {
                 "text": enhanced_text,
-                "model_id": "eleven_multilingual_v2",
-                "voice_settings": {
-                    "stability": 0.4,
-                    "similarity_boost": 0.8,
-                    "style": 0.3,
-                    "use_speaker_boost": True
-                }
+                "model_id": model_id,
+                "voice_settings": voice_settings
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(url, json=data, headers=headers)
+            response = await self._stream_to_cache(url, data, headers, filename, timeout=30.0)
+            
+            if response.status_code == 200:
+                self.voice_cache.add(filename, voice_id, language)
+                self.failed_renders.record_success(filename)
+                return filename
+            else:
+                print(f"❌ ElevenLabs API error for segment: {response.status_code}")
+                self.failed_renders.record_failure(filename, f"HTTP {response.status_code}")
+                return None
                 
-                if response.status_code == 200:
-                    async with aiofiles.open(filepath, 'wb') as f:
-                        await f.write(response.content)
-                    return filename
-                else:
-                    print(f"❌ ElevenLabs API error for segment: {response.status_code}")
-                    await self._create_test_voice_file(filepath, enhanced_text)
-                    return filename
-                    
+        except CircuitOpenError:
+            return None
         except Exception as e:
             print(f"❌ Error generating segment voice: {e}")
-            await self._create_test_voice_file(filepath, enhanced_text)
-            return filename
+            self.failed_renders.record_failure(filename, type(e).__name__)
+            return None
     
     async def _generate_single_voice(self, text: str, language: str, voice_id: Optional[str] = None) -> Optional[str]:
         """Generate single voice fallback"""
         enhanced_text = self._add_speech_elements(text)
         
-        # Include voice ID in hash for proper caching
-        voice_id_for_hash = voice_id or "default"
-        text_hash = hashlib.md5(f"{enhanced_text}_{language}_{voice_id_for_hash}".encode()).hexdigest()
-        filename = f"voice_{language.lower()}_{text_hash}.mp3"
-        filepath = os.path.join(self.voice_cache_dir, filename)
-        
-        if os.path.exists(filepath):
-            return f"static/audio/{filename}"
-        
-        if self.use_mock:
-            await self._create_test_voice_file(filepath, enhanced_text)
-            return f"static/audio/{filename}"
-        
         # Preserve narrator voice consistency or use language-specific fallback
         if voice_id:
             # Use provided voice ID (narrator voice) consistently
-            print(f"🔒 Using consistent narrator voice: {voice_id}")
             model_id = "eleven_multilingual_v2"  # Use multilingual for consistency
         else:
             # Only fall back to language-specific voice if no voice specified
             voice_id, model_id = self._get_voice_for_language(language, voice_id)
         
+        # Same key as single narrator renders, so either path reuses the other's files
+        filename = f"voice_{language.lower()}_{render_key(enhanced_text, voice_id, model_id, NARRATOR_VOICE_SETTINGS, language, namespace=self.cache_namespace)}.mp3"
+        
+        if self._cached("narration", filename):
+            return f"static/audio/{filename}"
+        if self._recently_failed(filename):
+            return None
+        
+        if self.use_mock:
+            return f"static/audio/{await self._placeholder_voice()}"
+        
         try:
-            url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+            url = f"{self.base_url}/v1/text-to-speech/{voice_id}/stream"
             headers = {
                 "Accept": "audio/mpeg",
                 "Content-Type": "application/json",
@@ -1011,29 +1049,26 @@ class AudioService:
             data = {
                 "text": enhanced_text,
                 "model_id": model_id,
-                "voice_settings": {
-                    "stability": 0.4,
-                    "similarity_boost": 0.8,
-                    "style": 0.3,
-                    "use_speaker_boost": True
-                }
+                "voice_settings": NARRATOR_VOICE_SETTINGS
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(url, json=data, headers=headers)
+            response = await self._stream_to_cache(url, data, headers, filename, timeout=30.0)
+            
+            if response.status_code == 200:
+                self.voice_cache.add(filename, voice_id, language)
+                self.failed_renders.record_success(filename)
+                return f"static/audio/{filename}"
+            else:
+                self.failed_renders.record_failure(filename, f"HTTP {response.status_code}")
+                return None
                 
-                if response.status_code == 200:
-                    async with aiofiles.open(filepath, 'wb') as f:
-                        await f.write(response.content)
-                    return f"static/audio/{filename}"
-                else:
-                    await self._create_test_voice_file(filepath, enhanced_text)
-                    return f"static/audio/{filename}"
-                    
+        except CircuitOpenError as e:
+            print(f"⏭️ Skipping voice: {e}")
+            return None
         except Exception as e:
             print(f"❌ Error generating single voice: {e}")
-            await self._create_test_voice_file(filepath, enhanced_text)
-            return f"static/audio/{filename}"
+            self.failed_renders.record_failure(filename, type(e).__name__)
+            return None
     
     def get_available_voices(self) -> List[dict]:
         """Get available character voices optimized for German and multilingual support"""
@@ -1062,7 +1097,6 @@ class AudioService:
             {"id": "CYw3kZ02Hs0563khs1Fj", "name": "Dave", "gender": "male", "category": "character", "description": "British Essex accent - distinctive"}
         ]
     
-    def cleanup_cache(self, max_files: int = 100):
-        """Clean up old voice cache files"""
-        print("🎭 Mock: Cache cleanup skipped")
-        pass
\ No newline at end of file
+    def cleanup_cache(self, max_files: Optional[int] = None) -> int:
+        """Evict least recently used voice files beyond the cache limits"""
+        return self.voice_cache.evict(max_files=max_files)
\ No newline at end of file
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Golden-output check and benchmark for the single-pass speech markup
+
+Compares speech_markup.add_speech_elements against the former rule-by-rule
+implementation on a fixed corpus plus randomised story text, then times both.
+"""
+
+import random
+import re
+import sys
+import time
+
+from speech_markup import add_speech_elements
+
+
+def legacy_add_speech_elements(text: str) -> str:
+    """Former AudioService._add_speech_elements, kept as the reference output"""
+    if len(text.strip()) < 10:
+        return text
+
+    enhanced_text = text
+
+    enhanced_text = re.sub(r'([.!?])\s+([A-Z])', r'\1 <break time="0.5s"/> \2', enhanced_text)
+    enhanced_text = re.sub(r'([,;:])\s+', r'\1 <break time="0.3s"/> ', enhanced_text)
+
+    dialogue_patterns = [
+        (r'"([^"]*?[!])"', r'"<prosody rate="fast" pitch="+2st">\1</prosody>"'),
+        (r'"([^"]*?[?])"', r'"<prosody pitch="+1st">\1</prosody>"'),
+        (r'"([^"]*?\.\.\.)"', r'"<prosody rate="slow">\1</prosody>"'),
+        (r'"([^"]*?[.])"', r'"<prosody rate="medium">\1</prosody>"'),
+    ]
+    for pattern, replacement in dialogue_patterns:
+        enhanced_text = re.sub(pattern, replacement, enhanced_text)
+
+    emphasis_words = [
+        'suddenly', 'immediately', 'warning', 'danger', 'attack', 'magic',
+        'treasure', 'ancient', 'mysterious', 'powerful', 'legendary'
+    ]
+    for word in emphasis_words:
+        pattern = rf'\b({word})\b'
+        replacement = rf'<emphasis level="moderate">\1</emphasis>'
+        enhanced_text = re.sub(pattern, replacement, enhanced_text, flags=re.IGNORECASE)
+
+    action_patterns = [
+        (r'(fights?|attacks?|strikes?|slashes?)', r'<prosody rate="fast" pitch="+1st">\1</prosody>'),
+        (r'(whispers?|murmurs?)', r'<prosody volume="soft">\1</prosody>'),
+        (r'(shouts?|yells?|screams?)', r'<prosody volume="loud" pitch="+2st">\1</prosody>'),
+        (r'(creeps?|sneaks?|tiptoes?)', r'<prosody rate="slow" volume="soft">\1</prosody>'),
+    ]
+    for pattern, replacement in action_patterns:
+        enhanced_text = re.sub(pattern, replacement, enhanced_text, flags=re.IGNORECASE)
+
+    if len(enhanced_text) > 200:
+        sentences = enhanced_text.split('. ')
+        if len(sentences) > 3:
+            for i in range(2, len(sentences), 3):
+                if i < len(sentences):
+                    sentences[i] = '<break time="0.8s"/> ' + sentences[i]
+            enhanced_text = '. '.join(sentences)
+
+    return enhanced_text
+
+
+GOLDEN_CORPUS = [
+    "Short.",
+    "The door creaks open. Suddenly, a shadow moves: something ancient stirs!",
+    '"Run!" shouts Alice. "Where to?" Bert asks, drawing his sword.',
+    '"I... I don\'t know..." she whispers; the magic fades.',
+    'The guard says, "Halt. Who goes there?" and attacks without warning.',
+    'Melk rief aus: "Das ist gefährlich!" Die Gruppe schleicht weiter, leise und vorsichtig.',
+    '"Stay close, " the knight murmurs, "the treasure is near."',
+    'A legendary blade strikes twice! The orc yells. The goblin sneaks away, tiptoes past the fire.',
+    'Unclosed "quote with a danger. Then more text follows here.',
+    '""Empty quotes."" And "nested "quotes" here!" Immediately, they fight.',
+    '"Wait, ..." he said. "Hmm, ?" she replied. "Yes, !" they shouted.',
+    'The MYSTERIOUS figure ATTACKS. The Powerful mage slashes!\n\nA new paragraph begins. Fights erupt.',
+    "The road winds on.  Rain falls; wind howls: nobody speaks, nobody moves. Dawn comes.\tStill nothing. "
+    "The travelers wait. Then a voice calls. They turn. A stranger approaches the camp slowly. "
+    "He carries an ancient map. The map shows a path. The path leads to treasure.",
+]
+
+WORDS = [
+    'the', 'party', 'suddenly', 'attack', 'attacks', 'magic', 'whispers', 'shouts', 'creeps',
+    'door', 'Alice', 'Bert', 'danger', 'warning', 'ancient', 'legendary', 'fights', 'murmur',
+    'screams', 'sneaks', 'tiptoe', 'strike', 'slashes', 'Powerful', 'treasure', 'mysterious',
+    'yells', 'Immediately', 'forest', 'shadow', 'dragon', 'sword'
+]
+PUNCTUATION = ['.', '!', '?', ',', ';', ':', '...', '', '', '', '']
+QUOTES = ['"', '', '', '', '']
+
+
+def random_story(rng: random.Random, words: int) -> str:
+    parts = []
+    for _ in range(words):
+        parts.append(rng.choice(QUOTES) + rng.choice(WORDS) + rng.choice(PUNCTUATION) + rng.choice(QUOTES))
+        parts.append(rng.choice([' ', ' ', ' ', '  ', '\n', '\n\n']))
+    return ''.join(parts)
+
+
+def check_golden() -> bool:
+    rng = random.Random(42)
+    samples = GOLDEN_CORPUS + [random_story(rng, rng.randint(3, 120)) for _ in range(3000)]
+
+    failures = 0
+    for sample in samples:
+        expected = legacy_add_speech_elements(sample)
+        actual = add_speech_elements(sample)
+        if expected != actual:
+            failures += 1
+            if failures <= 3:
+                print(f"❌ Mismatch for: {sample!r}\n   expected: {expected!r}\n   actual:   {actual!r}")
+
+    if failures:
+        print(f"❌ {failures}/{len(samples)} samples differ")
+        return False
+
+    print(f"✅ Golden output identical for {len(samples)} samples")
+    return True
+
+
+def benchmark():
+    story = " ".join(GOLDEN_CORPUS[1:]) * 4
+    rounds = 500
+
+    for name, func in [("legacy", legacy_add_speech_elements), ("single-pass", add_speech_elements)]:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func(story)
+        elapsed = time.perf_counter() - start
+        print(f"⏱️ {name:12} {elapsed / rounds * 1000:.3f} ms per call ({len(story)} chars)")
+
+
+if __name__ == "__main__":
+    ok = check_golden()
+    benchmark()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,256 @@
+import asyncio
+import os
+import random
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+from bgm_metadata import analyze_track, can_measure_loudness, integrated_loudness, load_sidecar, save_sidecar
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.ogg', '.m4a')
+
+# Keywords to match in filenames
+SCENE_KEYWORDS = {
+    "combat": ["combat", "battle", "fight", "war", "boss", "action", "intense"],
+    "dialog": ["calm", "peaceful", "quiet", "ambient", "soft", "gentle"],
+    "exploration": ["mystery", "adventure", "explore", "dungeon", "forest", "ambient"],
+    "adventure": ["adventure", "journey", "travel", "theme", "main"]
+}
+
+
+class BgmTrack:
+    __slots__ = ('filename', 'path', 'size', 'mtime', 'scenes', 'content_hash', 'duration', 'bitrate', 'loudness_lufs', 'loudness_measured')
+
+    def __init__(self, filename: str, path: str, size: int, mtime: float):
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        filename_lower = filename.lower()
+        self.scenes = [scene for scene, keywords in SCENE_KEYWORDS.items() if any(keyword in filename_lower for keyword in keywords)]
+
+        # Filled in by the background analyzer
+        self.content_hash: Optional[str] = None
+        self.duration: Optional[float] = None
+        self.bitrate: Optional[int] = None
+        self.loudness_lufs: Optional[float] = None
+        self.loudness_measured = False
+
+    @property
+    def url(self) -> str:
+        """Content-addressed URL once the track is hashed, so browsers can cache it forever"""
+        return f"bgm/{self.content_hash or 'latest'}/{quote(self.filename)}"
+
+    def unchanged_on_disk(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return stat.st_size == self.size and stat.st_mtime == self.mtime
+
+    def apply_metadata(self, metadata: dict):
+        self.content_hash = metadata.get("content_hash")
+        self.duration = metadata.get("duration")
+        self.bitrate = metadata.get("bitrate")
+        self.loudness_lufs = metadata.get("loudness_lufs")
+        self.loudness_measured = metadata.get("loudness_measured", False)
+
+    def metadata(self) -> dict:
+        return {
+            "size": self.size,
+            "mtime": self.mtime,
+            "content_hash": self.content_hash,
+            "duration": self.duration,
+            "bitrate": self.bitrate,
+            "loudness_lufs": self.loudness_lufs,
+            "loudness_measured": self.loudness_measured
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "filename": self.filename,
+            "size": self.size,
+            "scenes": self.scenes,
+            "url": self.url,
+            "content_hash": self.content_hash,
+            "duration": self.duration,
+            "bitrate": self.bitrate,
+            "loudness_lufs": self.loudness_lufs
+        }
+
+
+class BgmLibrary:
+    """In-memory index of the background music folder
+
+    The folder is scanned once at startup and then polled: a single stat of
+    the folder tells whether files were added, removed or renamed, and only
+    then is it listed again. Picking a track for a scene is a dictionary
+    lookup and never touches the filesystem.
+
+    New or changed tracks are analyzed in the background (content hash,
+    duration, bitrate, loudness) and the results are kept in a JSON sidecar,
+    so a restart only analyzes what changed.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.poll_interval = float(os.getenv("BGM_POLL_INTERVAL", "30"))
+        self.metadata_path = os.getenv("BGM_METADATA_PATH", "bgm_metadata.json")
+        self.measure_loudness = os.getenv("BGM_MEASURE_LOUDNESS", "true").lower() not in ("0", "false", "no")
+        self._analyzer: Optional[asyncio.Task] = None
+        self._analyze_wakeup: Optional[asyncio.Event] = None
+        self.tracks: Dict[str, BgmTrack] = {}
+        self.by_scene: Dict[str, List[BgmTrack]] = {}
+        self.all_tracks: List[BgmTrack] = []
+        self._folder_mtime: Optional[float] = None
+        self._scanned = False
+        self._poller: Optional[asyncio.Task] = None
+        self._sidecar: Dict[str, dict] = {}
+
+    async def startup(self):
+        """Index the folder and start watching and analyzing it"""
+        loop = asyncio.get_running_loop()
+        self._sidecar = await loop.run_in_executor(None, load_sidecar, self.metadata_path)
+        self._analyze_wakeup = asyncio.Event()
+        await self.refresh()
+        self._poller = asyncio.create_task(self._poll_loop())
+        self._analyzer = asyncio.create_task(self._analyze_loop())
+        print(f"🎵 BGM library ready: {len(self.all_tracks)} tracks in {self.folder}")
+
+    async def shutdown(self):
+        for task in (self._poller, self._analyzer):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._poller = None
+        self._analyzer = None
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Re-index the folder if it changed; returns True when the index was rebuilt"""
+        loop = asyncio.get_running_loop()
+        changed = await loop.run_in_executor(None, self._refresh, force)
+        if changed and self._analyze_wakeup is not None:
+            self._analyze_wakeup.set()
+        return changed
+
+    def get(self, filename: str) -> Optional[BgmTrack]:
+        return self.tracks.get(filename)
+
+    def select(self, scene_type: str) -> Optional[BgmTrack]:
+        """Select appropriate music for a scene type"""
+        if scene_type not in SCENE_KEYWORDS:
+            scene_type = "adventure"
+        # First try files matching the scene keywords, otherwise any available file
+        candidates = self.by_scene.get(scene_type) or self.all_tracks
+        if not candidates:
+            return None
+        return random.choice(candidates)
+
+    @property
+    def scanned(self) -> bool:
+        return self._scanned
+
+    def list_tracks(self) -> List[dict]:
+        return [track.to_dict() for track in self.all_tracks]
+
+    def _refresh(self, force: bool = False) -> bool:
+        try:
+            folder_mtime = os.stat(self.folder).st_mtime
+        except OSError:
+            if self.tracks or not self._scanned:
+                print(f"BGM folder not found: {self.folder}")
+            self._scanned = True
+            self._folder_mtime = None
+            self._rebuild({})
+            return True
+
+        if not force and self._scanned and folder_mtime == self._folder_mtime:
+            return False
+
+        tracks: Dict[str, BgmTrack] = {}
+        try:
+            with os.scandir(self.folder) as scan:
+                for item in scan:
+                    if not item.name.lower().endswith(AUDIO_EXTENSIONS) or not item.is_file():
+                        continue
+                    stat = item.stat()
+                    existing = self.tracks.get(item.name)
+                    if existing is not None and existing.size == stat.st_size and existing.mtime == stat.st_mtime:
+                        # Unchanged file: keep the existing entry
+                        tracks[item.name] = existing
+                    else:
+                        track = BgmTrack(item.name, item.path, stat.st_size, stat.st_mtime)
+                        known = self._sidecar.get(item.name)
+                        if known and known.get("size") == stat.st_size and known.get("mtime") == stat.st_mtime:
+                            track.apply_metadata(known)
+                        tracks[item.name] = track
+        except OSError as e:
+            print(f"Error reading BGM folder: {e}")
+            return False
+
+        added = tracks.keys() - self.tracks.keys()
+        removed = self.tracks.keys() - tracks.keys()
+        if self._scanned and (added or removed):
+            print(f"🎵 BGM library updated: +{len(added)} / -{len(removed)} tracks")
+
+        self._folder_mtime = folder_mtime
+        self._scanned = True
+        self._rebuild(tracks)
+        return True
+
+    def _rebuild(self, tracks: Dict[str, BgmTrack]):
+        by_scene: Dict[str, List[BgmTrack]] = {scene: [] for scene in SCENE_KEYWORDS}
+        for track in tracks.values():
+            for scene in track.scenes:
+                by_scene[scene].append(track)
+
+        # Swap in complete structures so readers never see a half-built index
+        self.tracks = tracks
+        self.all_tracks = sorted(tracks.values(), key=lambda track: track.filename)
+        self.by_scene = by_scene
+
+    async def _poll_loop(self):
+        polls = 0
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            polls += 1
+            try:
+                # Files replaced in place keep the folder mtime; list everything now and then
+                await self.refresh(force=polls % 10 == 0)
+            except Exception as e:
+                print(f"⚠️ BGM library refresh failed: {e}")
+
+    async def _analyze_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._analyze_wakeup.wait()
+            self._analyze_wakeup.clear()
+
+            # Hash and duration first so content-hash URLs are available quickly,
+            # then the slower loudness measurement
+            pending = [track for track in self.all_tracks if track.content_hash is None]
+            for track in pending:
+                try:
+                    metadata = await loop.run_in_executor(None, analyze_track, track.path, False)
+                except OSError as e:
+                    print(f"⚠️ Could not analyze BGM track {track.filename}: {e}")
+                    continue
+                metadata["loudness_measured"] = False
+                track.apply_metadata(metadata)
+
+            unmeasured = []
+            if self.measure_loudness and can_measure_loudness():
+                unmeasured = [track for track in self.all_tracks if track.content_hash and not track.loudness_measured]
+            for track in unmeasured:
+                track.loudness_lufs = await loop.run_in_executor(None, integrated_loudness, track.path)
+                track.loudness_measured = True
+
+            if pending or unmeasured:
+                print(f"🎵 Analyzed {len(pending)} BGM tracks, measured loudness of {len(unmeasured)}")
+                self._sidecar = {track.filename: track.metadata() for track in self.all_tracks if track.content_hash}
+                try:
+                    await loop.run_in_executor(None, save_sidecar, self.metadata_path, self._sidecar)
+                except OSError as e:
+                    print(f"⚠️ Could not save BGM metadata: {e}")
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import wave
+from typing import Dict, Optional
+
+from mp3_concat import mp3_duration
+
+LOUDNESS_PATTERN = re.compile(r'I:\s+(-?\d+(?:\.\d+)?) LUFS')
+
+
+def analyze_track(path: str, measure_loudness: bool = True) -> Dict[str, Optional[float]]:
+    """Read the metadata of one music file
+
+    Returns the content hash, duration in seconds, average bitrate in kbit/s
+    and integrated loudness in LUFS. MP3 and WAV are measured in-process;
+    other formats and loudness need ffmpeg/ffprobe and are left empty
+    without them. Blocking: run it in an executor.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    metadata: Dict[str, Optional[float]] = {
+        "content_hash": hashlib.sha256(data).hexdigest()[:16],
+        "duration": None,
+        "bitrate": None,
+        "loudness_lufs": None
+    }
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.mp3':
+        metadata["duration"] = mp3_duration(data)
+    elif extension == '.wav':
+        metadata["duration"] = _wav_duration(path)
+    if metadata["duration"] is None:
+        metadata["duration"] = _ffprobe_duration(path)
+
+    if metadata["duration"]:
+        metadata["duration"] = round(metadata["duration"], 2)
+        metadata["bitrate"] = round(len(data) * 8 / metadata["duration"] / 1000)
+
+    if measure_loudness:
+        metadata["loudness_lufs"] = integrated_loudness(path)
+
+    return metadata
+
+
+def _wav_duration(path: str) -> Optional[float]:
+    try:
+        with wave.open(path, 'rb') as wav:
+            return wav.getnframes() / float(wav.getframerate())
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def _ffprobe_duration(path: str) -> Optional[float]:
+    if not shutil.which('ffprobe'):
+        return None
+    try:
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', path],
+            capture_output=True, text=True, timeout=60
+        )
+        return float(json.loads(result.stdout)["format"]["duration"])
+    except (subprocess.SubprocessError, ValueError, KeyError, OSError):
+        return None
+
+
+def can_measure_loudness() -> bool:
+    return shutil.which('ffmpeg') is not None
+
+
+def integrated_loudness(path: str) -> Optional[float]:
+    """EBU R128 integrated loudness via ffmpeg's ebur128 filter"""
+    if not can_measure_loudness():
+        return None
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-nostats', '-hide_banner', '-i', path, '-filter_complex', 'ebur128', '-f', 'null', '-'],
+            capture_output=True, text=True, timeout=600
+        )
+    except (subprocess.SubprocessError, OSError):
+        return None
+    # The summary at the end repeats the integrated value; take the last one
+    matches = LOUDNESS_PATTERN.findall(result.stderr)
+    return float(matches[-1]) if matches else None
+
+
+def load_sidecar(path: str) -> Dict[str, dict]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not read BGM metadata {path}: {e}")
+        return {}
+
+
+def save_sidecar(path: str, entries: Dict[str, dict]):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = path + ".part"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
@@ -0,0 +1,59 @@
+import hashlib
+import json
+import re
+import unicodedata
+from typing import Dict, Optional
+
+# Typographic quote variants that are spoken the same as the plain ones
+QUOTE_TRANSLATION = str.maketrans({
+    "“": '"', "”": '"', "„": '"', "‟": '"', "«": '"', "»": '"', "″": '"',
+    "‘": "'", "’": "'", "‚": "'", "‛": "'", "‹": "'", "›": "'", "′": "'"
+})
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form of text for cache keys: NFC, plain quotes, single spaces, no outer whitespace"""
+    text = unicodedata.normalize("NFC", text).translate(QUOTE_TRANSLATION)
+    return WHITESPACE.sub(" ", text).strip()
+
+
+def render_key(text: str, voice: Optional[str], model_id: str, voice_settings: Optional[dict] = None,
+               language: Optional[str] = None, character_voices: Optional[dict] = None, namespace: Optional[str] = None) -> str:
+    """Hash of everything that determines the rendered audio
+
+    Text is normalized, and the voice map and settings are serialized with
+    sorted keys, so the same request always gives the same key no matter how
+    it was spelled or in which order the roster was built. A namespace keeps
+    audio from a non-live backend from being served as a real render.
+    """
+    payload = {
+        "text": normalize_text(text),
+        "voice": voice or "default",
+        "model": model_id,
+        "settings": voice_settings or {},
+        "language": (language or "").lower(),
+        "characters": {str(name): voice_id for name, voice_id in (character_voices or {}).items()}
+    }
+    if namespace:
+        payload["namespace"] = namespace
+    serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.md5(serialized.encode()).hexdigest()
+
+
+class CacheStats:
+    """Hit/miss counters for voice cache lookups, per kind of render"""
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, hit: bool):
+        counts = self._counts.setdefault(kind, {"hits": 0, "misses": 0})
+        counts["hits" if hit else "misses"] += 1
+
+    def stats(self) -> dict:
+        report = {}
+        for kind, counts in self._counts.items():
+            lookups = counts["hits"] + counts["misses"]
+            report[kind] = {**counts, "hit_rate": round(counts["hits"] / lookups, 3) if lookups else None}
+        return report
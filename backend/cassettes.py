@@ -0,0 +1,331 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import aiofiles
+import httpx
+
+# How AIService and AudioService reach their vendors (BACKEND_MODE)
+LIVE = "live"            # real APIs
+RECORD = "record"        # real APIs, every exchange saved to a cassette with its timings
+REPLAY = "replay"        # recorded exchanges served back, no network
+SYNTHETIC = "synthetic"  # generated responses with configurable latency, no network
+MODES = (LIVE, RECORD, REPLAY, SYNTHETIC)
+
+# Path segments that are ids (voice ids, ...) rather than part of the endpoint
+ID_SEGMENT = re.compile(r"^[A-Za-z0-9]{16,}$")
+
+# One MPEG-1 Layer III frame (128 kbps, 44.1 kHz) of silence, about 26 ms of audio
+SILENT_MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0x00]) + bytes(413)
+MP3_FRAMES_PER_SECOND = 44100 / 1152
+SPOKEN_CHARS_PER_SECOND = 15
+AUDIO_CHUNK_SIZE = 4096
+
+SYNTHETIC_SENTENCES = [
+    "The lantern light flickers as the companions step into the vaulted hall.",
+    "Somewhere beyond the walls a bell tolls, slow and heavy.",
+    "Dust drifts through a shaft of pale moonlight.",
+    "An old map crackles as it is unfolded on the table.",
+    "A voice calls out from the shadows: \"Who goes there?\"",
+    "The air smells of rain, iron and burning pine.",
+    "Footsteps echo on the stairs below, growing louder.",
+    "A narrow door stands ajar, a cold draft whispering through it.",
+    "The innkeeper leans closer and lowers her voice.",
+    "Far away, thunder rolls across the hills."
+]
+
+
+def backend_mode() -> str:
+    mode = os.getenv("BACKEND_MODE", LIVE).strip().lower()
+    if mode not in MODES:
+        print(f"⚠️ Unknown BACKEND_MODE '{mode}' (known: {', '.join(MODES)}), using live")
+        return LIVE
+    return mode
+
+
+def is_offline(mode: Optional[str] = None) -> bool:
+    """True when no request leaves the machine, so no API keys are needed"""
+    return (mode or backend_mode()) in (REPLAY, SYNTHETIC)
+
+
+def create_transport(vendor: str, limits: httpx.Limits, http2: bool = False) -> httpx.AsyncBaseTransport:
+    """Transport for a vendor's HTTP client according to BACKEND_MODE
+
+    Connection limits and HTTP/2 have to be set here: httpx ignores the
+    client's own settings once a transport is passed in.
+    """
+    mode = backend_mode()
+    if mode == LIVE:
+        return httpx.AsyncHTTPTransport(http2=http2, limits=limits)
+
+    print(f"📼 {vendor} backend in {mode} mode")
+    if mode == RECORD:
+        return RecordingTransport(Cassette(vendor), httpx.AsyncHTTPTransport(http2=http2, limits=limits))
+    if mode == REPLAY:
+        return ReplayTransport(Cassette(vendor))
+    return SyntheticTransport()
+
+
+def _request_body(request: httpx.Request):
+    try:
+        return json.loads(request.content)
+    except ValueError:
+        return None
+
+
+def request_signature(request: httpx.Request) -> Tuple[str, str]:
+    """(endpoint, key) of a request: the endpoint ignores ids in the path, the key covers the whole request"""
+    segments = ["_" if ID_SEGMENT.match(segment) else segment for segment in request.url.path.strip("/").split("/")]
+    endpoint = f"{request.method}_{'-'.join(segments)}"
+
+    body = _request_body(request)
+    # JSON bodies are compared by content, not by key order or spacing
+    content = json.dumps(body, sort_keys=True).encode() if body is not None else request.content
+    key = hashlib.md5(request.method.encode() + b" " + request.url.raw_path + b"\n" + content).hexdigest()
+    return endpoint, key
+
+
+class Cassette:
+    """Recorded exchanges of one vendor, one JSON file per distinct request
+
+    Files are named <endpoint>__<key>.json. A request that was never
+    recorded is answered with a recording of the same endpoint, picked by
+    its key so a replayed run makes the same choices every time.
+    """
+
+    def __init__(self, vendor: str, directory: Optional[str] = None):
+        self.vendor = vendor
+        self.directory = os.path.join(directory or os.getenv("CASSETTE_DIR", "cassettes"), vendor)
+        self._index: Optional[Dict[str, List[str]]] = None
+
+    def path(self, endpoint: str, key: str) -> str:
+        return os.path.join(self.directory, f"{endpoint}__{key}.json")
+
+    async def save(self, endpoint: str, key: str, recording: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(endpoint, key)
+        temp_path = path + ".part"
+        async with aiofiles.open(temp_path, "w") as f:
+            await f.write(json.dumps(recording))
+        os.replace(temp_path, path)
+        if self._index is not None and path not in self._index.setdefault(endpoint, []):
+            self._index[endpoint].append(path)
+
+    async def load(self, endpoint: str, key: str) -> Optional[dict]:
+        path = self.path(endpoint, key)
+        if not os.path.exists(path):
+            candidates = self._get_index().get(endpoint)
+            if not candidates:
+                return None
+            path = candidates[int(key, 16) % len(candidates)]
+        async with aiofiles.open(path, "r") as f:
+            return json.loads(await f.read())
+
+    def _get_index(self) -> Dict[str, List[str]]:
+        if self._index is None:
+            self._index = {}
+            if os.path.isdir(self.directory):
+                for name in sorted(os.listdir(self.directory)):
+                    if name.endswith(".json") and "__" in name:
+                        endpoint = name.rsplit("__", 1)[0]
+                        self._index.setdefault(endpoint, []).append(os.path.join(self.directory, name))
+            print(f"📼 {self.vendor} cassette: {sum(len(paths) for paths in self._index.values())} recordings")
+        return self._index
+
+
+class TimedStream(httpx.AsyncByteStream):
+    """Response body that releases each chunk at its offset (seconds since the headers)"""
+
+    def __init__(self, chunks: List[Tuple[float, bytes]]):
+        self.chunks = chunks
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        started = time.monotonic()
+        for offset, chunk in self.chunks:
+            delay = offset - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield chunk
+
+
+class RecordingStream(httpx.AsyncByteStream):
+    """Passes a live response body through while noting when each chunk arrived"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, recording: dict, save):
+        self.stream = stream
+        self.recording = recording
+        self.save = save
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        started = time.monotonic()
+        chunks = []
+        async for chunk in self.stream:
+            chunks.append([round(time.monotonic() - started, 4), base64.b64encode(chunk).decode()])
+            yield chunk
+        # Only complete bodies are worth replaying
+        self.recording["chunks"] = chunks
+        await self.save(self.recording)
+
+    async def aclose(self):
+        await self.stream.aclose()
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, transport: httpx.AsyncBaseTransport):
+        self.cassette = cassette
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        endpoint, key = request_signature(request)
+        started = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+
+        recording = {
+            "method": request.method,
+            "url": str(request.url.copy_with(query=None)),
+            "status": response.status_code,
+            # Cookies are session state, not part of the answer
+            "headers": [[name, value] for name, value in response.headers.multi_items() if name.lower() != "set-cookie"],
+            "latency": round(time.monotonic() - started, 4)
+        }
+
+        async def save(recording: dict):
+            try:
+                await self.cassette.save(endpoint, key, recording)
+            except OSError as e:
+                print(f"⚠️ Could not record {endpoint}: {e}")
+
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=RecordingStream(response.stream, recording, save),
+            extensions=response.extensions
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Serves recorded exchanges; CASSETTE_LATENCY_SCALE scales the recorded timings (0 = as fast as possible)"""
+
+    def __init__(self, cassette: Cassette, latency_scale: Optional[float] = None):
+        self.cassette = cassette
+        self.latency_scale = latency_scale if latency_scale is not None else float(os.getenv("CASSETTE_LATENCY_SCALE", "1.0"))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        endpoint, key = request_signature(request)
+        recording = await self.cassette.load(endpoint, key)
+        if recording is None:
+            print(f"⚠️ No {self.cassette.vendor} recording for {endpoint}")
+            return httpx.Response(502, json={"error": {"message": f"No recording for {endpoint}"}})
+
+        if self.latency_scale > 0:
+            await asyncio.sleep(recording["latency"] * self.latency_scale)
+        chunks = [(offset * self.latency_scale, base64.b64decode(chunk)) for offset, chunk in recording["chunks"]]
+        return httpx.Response(recording["status"], headers=recording["headers"], stream=TimedStream(chunks))
+
+
+def synthetic_story(rng: random.Random, words: int) -> str:
+    sentences = []
+    while sum(len(sentence.split()) for sentence in sentences) < words:
+        sentences.append(rng.choice(SYNTHETIC_SENTENCES))
+    return " ".join(sentences)
+
+
+def synthetic_chat_completion(body: dict, rng: random.Random) -> Tuple[str, List[bytes]]:
+    """(content type, body chunks) of an OpenAI chat completion, streamed as SSE if the request asked for it"""
+    text = synthetic_story(rng, min(int(body.get("max_tokens") or 400) * 3 // 4, 250))
+    completion_id = f"chatcmpl-synthetic-{rng.getrandbits(32):08x}"
+    model = body.get("model", "synthetic")
+    created = int(time.time())
+
+    if not body.get("stream"):
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 4
+        completion_tokens = len(text) // 4
+        return "application/json", [json.dumps({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        }).encode()]
+
+    def event(delta: dict, finish_reason: Optional[str] = None) -> bytes:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        return f"data: {json.dumps(payload)}\n\n".encode()
+
+    words = text.split(" ")
+    chunks = [event({"role": "assistant", "content": ""})]
+    # Roughly one token per event
+    chunks.extend(event({"content": word if i == 0 else " " + word}) for i, word in enumerate(words))
+    chunks.append(event({}, "stop"))
+    chunks.append(b"data: [DONE]\n\n")
+    return "text/event-stream", chunks
+
+
+def synthetic_speech(body: dict) -> Tuple[str, List[bytes]]:
+    """(content type, body chunks) of silent MP3 as long as the request's text would take to speak"""
+    if "inputs" in body:
+        characters = sum(len(item.get("text", "")) for item in body["inputs"])
+    else:
+        characters = len(body.get("text", ""))
+    frames = int(characters / SPOKEN_CHARS_PER_SECOND * MP3_FRAMES_PER_SECOND) + 1
+    audio = SILENT_MP3_FRAME * frames
+    return "audio/mpeg", [audio[i:i + AUDIO_CHUNK_SIZE] for i in range(0, len(audio), AUDIO_CHUNK_SIZE)]
+
+
+def synthetic_response(request: httpx.Request, rng: random.Random) -> Optional[Tuple[str, List[bytes]]]:
+    """Generated body for the endpoints the game uses, None for anything else"""
+    body = _request_body(request) or {}
+    path = request.url.path
+    if path.endswith("/chat/completions"):
+        return synthetic_chat_completion(body, rng)
+    if "/text-to-speech/" in path or "/text-to-dialogue" in path:
+        return synthetic_speech(body)
+    return None
+
+
+class SyntheticTransport(httpx.AsyncBaseTransport):
+    """Generated responses after SYNTHETIC_LATENCY seconds (± SYNTHETIC_JITTER as a fraction), one chunk every SYNTHETIC_CHUNK_INTERVAL
+
+    Latency and content are drawn from a generator seeded by the request, so
+    the same request gets the same answer in every run.
+    """
+
+    def __init__(self, latency: Optional[float] = None, jitter: Optional[float] = None, chunk_interval: Optional[float] = None):
+        self.latency = latency if latency is not None else float(os.getenv("SYNTHETIC_LATENCY", "0.5"))
+        self.jitter = jitter if jitter is not None else float(os.getenv("SYNTHETIC_JITTER", "0.3"))
+        self.chunk_interval = chunk_interval if chunk_interval is not None else float(os.getenv("SYNTHETIC_CHUNK_INTERVAL", "0.02"))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        endpoint, key = request_signature(request)
+        rng = random.Random(key)
+
+        generated = synthetic_response(request, rng)
+        if generated is None:
+            return httpx.Response(404, json={"error": {"message": f"No synthetic response for {endpoint}"}})
+
+        await asyncio.sleep(max(0.0, rng.gauss(self.latency, self.latency * self.jitter)))
+        content_type, chunks = generated
+        return httpx.Response(
+            200,
+            headers={"content-type": content_type},
+            stream=TimedStream([(i * self.chunk_interval, chunk) for i, chunk in enumerate(chunks)])
+        )
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Golden-output check for dialogue attribution
+
+Runs DialogueAttributor over sentences whose speakers the former
+AudioService._parse_text_segments got right and checks that every quote
+still goes to the same character.
+"""
+
+import sys
+
+from dialogue_parser import DialogueAttributor
+
+ROSTER = {"Alice": "voice-alice", "Bert": "voice-bert", "Lady Melk": "voice-melk"}
+
+# (text, speaker of each quote in order)
+GOLDEN_CASES = [
+    ('Alice turns to Bert and says, "We leave at dawn."', ["alice"]),
+    ('Bert nods to Alice: "Fine."', ["bert"]),
+    ('Bert sieht zur Lady Melk hinüber, seine Stimme leise: "Wir müssen gehen."', ["bert"]),
+    ('Lady Melk rief aus: "Das ist gefährlich!"', ["lady melk"]),
+    ('"Run!" shouted Alice.', ["alice"]),
+    ('"Where to?" Bert asks, drawing his sword.', ["bert"]),
+    ('Alice: "Over here!"', ["alice"]),
+    ('Turning to Alice, Bert says: "Stay close."', ["bert"]),
+    ('Alice looks at Bert. "Ready?" Bert nods to Alice: "Ready."', ["alice", "bert"]),
+    ('Bert draws his blade. Then he turns around and whispers, "Someone is here."', ["bert"]),
+    ('Alice spots the tracks. Lady Melk kneels beside her. "Wolves," she says.', ["lady melk"]),
+]
+
+
+def speakers(attributor: DialogueAttributor, text: str) -> list:
+    return [segment['character'] for segment in attributor.parse(text) if segment['type'] == 'character_speech']
+
+
+def check_golden() -> bool:
+    attributor = DialogueAttributor(ROSTER)
+    failures = 0
+    for text, expected in GOLDEN_CASES:
+        actual = speakers(attributor, text)
+        if actual != expected:
+            failures += 1
+            print(f"❌ {text!r}\n   expected: {expected}\n   actual:   {actual}")
+
+    if failures:
+        print(f"❌ {failures}/{len(GOLDEN_CASES)} cases attributed differently")
+        return False
+
+    print(f"✅ Attribution matches for {len(GOLDEN_CASES)} cases")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_golden() else 1)
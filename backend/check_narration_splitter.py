@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Check for the narration sentence splitter
+
+Streams texts into SentenceSplitter in small deltas, like the story stream
+does, and checks where they are cut: quoted speech stays in one chunk, but
+a quote the model never closes must not hold back the rest of the chapter.
+"""
+
+import sys
+
+from narration_pipeline import SentenceSplitter
+
+UNCLOSED_QUOTE = '"Unclosed quote starts here. and more text. And more '
+
+# (name, text, min_chars, max_quote_chars, expected chunks before the stream ends)
+CASES = [
+    (
+        "sentences are cut once the chunk is long enough",
+        "The gate creaks open. Wind howls through the pass. The torches flicker. ",
+        40, 600,
+        ["The gate creaks open. Wind howls through the pass."],
+    ),
+    (
+        "closed quotes stay in one chunk",
+        'Alice whispers: "Stay close. Something moves out there. Do you hear it?" Bert nods. ',
+        20, 600,
+        ['Alice whispers: "Stay close. Something moves out there. Do you hear it?"'],
+    ),
+    (
+        "a paragraph break ends an unclosed quote",
+        UNCLOSED_QUOTE + "text.\n\nThe next paragraph starts. It goes on for a while. ",
+        20, 600,
+        [UNCLOSED_QUOTE + "text.", "The next paragraph starts.", "It goes on for a while."],
+    ),
+    (
+        "an unclosed quote is cut after max_quote_chars",
+        UNCLOSED_QUOTE + "text. Still no closing quote here. ",
+        20, 40,
+        ['"Unclosed quote starts here. and more text.', "And more text. Still no closing quote here."],
+    ),
+]
+
+
+def split(text: str, min_chars: int, max_quote_chars: int, delta_size: int = 7) -> list:
+    splitter = SentenceSplitter(min_chars, max_quote_chars)
+    chunks = []
+    for start in range(0, len(text), delta_size):
+        chunks.extend(splitter.feed(text[start:start + delta_size]))
+    return chunks
+
+
+def check_splitter() -> bool:
+    failures = 0
+    for name, text, min_chars, max_quote_chars, expected in CASES:
+        actual = split(text, min_chars, max_quote_chars)
+        if actual != expected:
+            failures += 1
+            print(f"❌ {name}\n   expected: {expected}\n   actual:   {actual}")
+
+    if failures:
+        print(f"❌ {failures}/{len(CASES)} splitter cases failed")
+        return False
+
+    print(f"✅ Splitter cuts {len(CASES)} cases as expected")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_splitter() else 1)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Check for voice variant negotiation and announcement
+
+Runs VoiceTranscoder against an in-memory cache with ffmpeg replaced by a
+stand-in, and checks that clients get the original until a variant exists,
+that a background transcode announces the new variant exactly once, and that
+the low-bitrate MP3 only goes to clients that asked for it.
+"""
+
+import asyncio
+import os
+import sys
+
+os.environ["VOICE_TRANSCODE_FORMATS"] = "opus,mp3-low"
+
+from transcoder import VoiceTranscoder
+
+ORIGINAL = "voice_english_abc.mp3"
+
+
+class MemoryCache:
+    """Just enough of VoiceCache for the transcoder"""
+
+    def __init__(self, filenames):
+        self.filenames = set(filenames)
+
+    def lookup(self, filename: str) -> bool:
+        return filename in self.filenames
+
+    def add(self, filename: str):
+        self.filenames.add(filename)
+
+    def path(self, filename: str) -> str:
+        return filename
+
+
+def make_transcoder() -> VoiceTranscoder:
+    cache = MemoryCache([ORIGINAL])
+    transcoder = VoiceTranscoder(cache)
+    transcoder.enabled = True
+
+    async def encode(filename: str, name: str, variant: str) -> bool:
+        await asyncio.sleep(0.01)
+        cache.add(variant)
+        return True
+
+    transcoder._encode = encode
+    return transcoder
+
+
+async def run_checks() -> list:
+    transcoder = make_transcoder()
+    announced = []
+    failures = []
+
+    async def on_ready(filename: str):
+        announced.append(filename)
+
+    def expect(name: str, actual, expected):
+        if actual != expected:
+            failures.append(f"{name}\n   expected: {expected}\n   actual:   {actual}")
+
+    expect("original until the variant exists", transcoder.best_variant(ORIGINAL, ["opus", "mp3"]), ORIGINAL)
+
+    transcoder.transcode_in_background(ORIGINAL, on_ready)
+    expect("nothing announced before the transcode finished", announced, [])
+    await asyncio.gather(*transcoder._tasks)
+    expect("new variants are announced once", announced, [ORIGINAL])
+
+    expect("opus clients get the opus variant", transcoder.best_variant(ORIGINAL, ["opus", "mp3"]), "voice_english_abc.opus.webm")
+    expect("plain MP3 clients keep the original", transcoder.best_variant(ORIGINAL, ["mp3"]), ORIGINAL)
+    expect("data-saver clients get the low-bitrate MP3", transcoder.best_variant(ORIGINAL, ["mp3", "mp3-low"]), "voice_english_abc.low.mp3")
+
+    transcoder.transcode_in_background(ORIGINAL, on_ready)
+    await asyncio.gather(*transcoder._tasks)
+    expect("no announcement when every variant already existed", announced, [ORIGINAL])
+    return failures
+
+
+def check_variants() -> bool:
+    failures = asyncio.run(run_checks())
+    for failure in failures:
+        print(f"❌ {failure}")
+
+    if failures:
+        print(f"❌ {len(failures)} voice variant checks failed")
+        return False
+
+    print("✅ Voice variants are negotiated and announced as expected")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_variants() else 1)
@@ -0,0 +1,199 @@
+import re
+from typing import Dict, List, Optional
+
+# Speech verbs recognised around a quote (English and German)
+SPEECH_VERBS = (
+    r'says?|said|speaks?|spoke|calls?|called|shouts?|shouted|whispers?|whispered|'
+    r'replies|replied|reply|responds?|responded|asks?|asked|continues?|continued|adds?|added|'
+    r'sagt|sagte|spricht|sprach|ruft|rief|flüstert|flüsterte|antwortet|antwortete|'
+    r'fragt|fragte|erwidert|erwiderte|murmelt|murmelte|schreit|schrie'
+)
+
+QUOTE_SPAN = re.compile(r'"([^"]+)"')
+PRONOUN = re.compile(r'(?<!\w)(?:he|she|they|his|her|their|er|sie|sein|ihr)(?!\w)', re.IGNORECASE)
+# Greedy match up to the last sentence end in a range: its end is where the current sentence starts
+LAST_SENTENCE_END = re.compile(r'.*[.!?…]\s+', re.DOTALL)
+
+# Pronoun-attributed speech must end within this many characters of the last name mention
+PRONOUN_WINDOW = 200
+
+
+class DialogueAttributor:
+    """Attribute quoted speech to the characters of one game roster
+
+    Patterns are compiled once per roster. Parsing scans the quote spans of a
+    text once, in order, and picks a speaker for each quote:
+
+    1. an explicit attribution right after the quote ("..." says Bert)
+    2. a character named in the sentence leading up to the quote, or in the
+       last sentence naming one since the previous quote: the name followed
+       by a speech verb ("Bert sagt leise:"), otherwise the first name, which
+       is the subject far more often than a name closer to the quote
+       ("Alice turns to Bert and says, ...")
+    3. a pronoun before the quote, shortly after a character was mentioned
+    """
+
+    def __init__(self, char_voice_map: Dict[str, str]):
+        self.voice_by_name = {name.lower(): voice_id for name, voice_id in char_voice_map.items() if name and voice_id}
+        if not self.voice_by_name:
+            raise ValueError("DialogueAttributor needs at least one voiced character")
+
+        # Longest names first so "Lady Melk" wins over "Melk"
+        names = sorted(self.voice_by_name, key=len, reverse=True)
+        name_alternation = '|'.join(re.escape(name) for name in names)
+
+        self.name_pattern = re.compile(rf'(?<!\w)(?:{name_alternation})(?!\w)', re.IGNORECASE)
+        self.postfix_pattern = re.compile(
+            rf'\s*,?\s*(?:(?:{SPEECH_VERBS})\s+(?P<after>{name_alternation})|(?P<before>{name_alternation})\s+(?:{SPEECH_VERBS}))(?!\w)',
+            re.IGNORECASE
+        )
+        self.speech_verb_pattern = re.compile(rf'\s+(?:{SPEECH_VERBS})(?!\w)', re.IGNORECASE)
+
+    def parse(self, text: str) -> List[dict]:
+        """Split text into narrator, attribution and character speech segments"""
+        mentions = [(m.start(), m.end(), m.group(0).lower()) for m in self.name_pattern.finditer(text)]
+        matches = []
+        mention_index = 0
+        last_mention = None
+        prev_end = 0
+
+        for quote in QUOTE_SPAN.finditer(text):
+            quote_start, quote_end = quote.span()
+
+            # Advance over the mentions that precede this quote
+            region_mentions = []
+            while mention_index < len(mentions) and mentions[mention_index][0] < quote_start:
+                last_mention = mentions[mention_index]
+                if last_mention[0] >= prev_end:
+                    region_mentions.append(last_mention)
+                mention_index += 1
+
+            match = self._attribute(text, quote, prev_end, region_mentions, last_mention)
+            if match:
+                matches.append(match)
+            prev_end = quote_end
+
+        print(f"🔍 Dialogue attribution: {len(matches)} character lines for {list(self.voice_by_name.keys())}")
+        return build_segments(text, resolve_overlaps(matches))
+
+    def _attribute(self, text: str, quote, prev_end: int, region_mentions: list, last_mention) -> Optional[dict]:
+        quote_start, quote_end = quote.span()
+
+        # 1. "Text" says Name / "Text," Name said
+        postfix = self.postfix_pattern.match(text, quote_end)
+        if postfix:
+            name = (postfix.group('after') or postfix.group('before')).lower()
+            return self._match(text, quote, quote_start, name)
+
+        # 2. Name ... "Text" - attribution starts with the sentence naming the speaker
+        if region_mentions:
+            start = self._sentence_start(text, prev_end, region_mentions[-1][0])
+            speaker = self._sentence_speaker([mention for mention in region_mentions if mention[0] >= start], text)
+            return self._match(text, quote, start, speaker[2])
+
+        # 3. He/She ... "Text" shortly after the character was mentioned
+        if last_mention and last_mention[1] + PRONOUN_WINDOW >= quote_end:
+            start = self._sentence_start(text, prev_end, quote_start)
+            if PRONOUN.search(text, start, quote_start):
+                return self._match(text, quote, start, last_mention[2])
+
+        return None
+
+    def _sentence_speaker(self, sentence_mentions: list, text: str):
+        """The mention followed by a speech verb, otherwise the first one"""
+        for mention in sentence_mentions:
+            if self.speech_verb_pattern.match(text, mention[1]):
+                return mention
+        return sentence_mentions[0]
+
+    def _sentence_start(self, text: str, lower_bound: int, position: int) -> int:
+        boundary = LAST_SENTENCE_END.match(text, lower_bound, position)
+        return boundary.end() if boundary else lower_bound
+
+    def _match(self, text: str, quote, start: int, name: str) -> dict:
+        return {
+            'start': start,
+            'end': quote.end(),
+            'full_text': text[start:quote.end()],
+            'speech_text': quote.group(1),
+            'voice_id': self.voice_by_name[name],
+            'character': name
+        }
+
+
+def resolve_overlaps(matches: List[dict]) -> List[dict]:
+    """Drop overlapping matches, keeping the earliest and then the longest one
+
+    Accepted matches never overlap each other, so after sorting only the
+    furthest accepted end has to be checked: O(n log n) overall.
+    """
+    sorted_matches = sorted(matches, key=lambda x: (x['start'], -(x['end'] - x['start'])))
+
+    filtered_matches = []
+    accepted_end = -1
+    for match in sorted_matches:
+        if match['start'] >= accepted_end:
+            filtered_matches.append(match)
+            accepted_end = match['end']
+
+    return filtered_matches
+
+
+def build_segments(text: str, matches: List[dict]) -> List[dict]:
+    """Turn position-sorted speech matches into narrator/attribution/speech segments"""
+    segments = []
+    current_pos = 0
+
+    for match in matches:
+        # Add narrator text before this character speech
+        if match['start'] > current_pos:
+            narrator_text = text[current_pos:match['start']].strip()
+            if narrator_text:
+                segments.append({
+                    'text': narrator_text,
+                    'voice_id': None,  # Will use narrator voice
+                    'type': 'narrator'
+                })
+
+        # Attribution before the quote (e.g. "Melk rief aus:") stays with the narrator
+        full_match_text = match['full_text']
+        speech_text = match['speech_text']
+        quote_start = full_match_text.find(f'"{speech_text}"')
+        if quote_start > 0:
+            attribution = full_match_text[:quote_start].strip()
+            if attribution:
+                segments.append({
+                    'text': attribution,
+                    'voice_id': None,  # Narrator voice for attribution
+                    'type': 'attribution'
+                })
+
+        # Add only the quoted character speech
+        segments.append({
+            'text': speech_text,
+            'voice_id': match['voice_id'],
+            'type': 'character_speech',
+            'character': match['character']
+        })
+
+        current_pos = match['end']
+
+    # Add remaining narrator text
+    if current_pos < len(text):
+        remaining_text = text[current_pos:].strip()
+        if remaining_text:
+            segments.append({
+                'text': remaining_text,
+                'voice_id': None,  # Will use narrator voice
+                'type': 'narrator'
+            })
+
+    # If no character speech was found, return the entire text as narrator
+    if not segments:
+        segments = [{
+            'text': text,
+            'voice_id': None,
+            'type': 'narrator'
+        }]
+
+    return segments
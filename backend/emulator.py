@@ -0,0 +1,205 @@
+"""
+Local stand-in for the OpenAI and ElevenLabs endpoints the game uses
+
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:8100/v1 and
+ELEVENLABS_BASE_URL=http://127.0.0.1:8100, then run a load test: the real
+code path (httpx pooling, retries, scheduler, circuit breakers) talks to a
+vendor whose latency, throughput, failures and rate limits you control.
+"""
+
+import asyncio
+import math
+import os
+import random
+from collections import Counter
+from typing import AsyncIterator, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from cassettes import synthetic_chat_completion, synthetic_speech
+from scheduler import TokenBucket
+
+
+class EmulatorSettings:
+    """Knobs of the emulated vendors, from EMULATOR_* variables; adjustable at runtime via /emulator/config"""
+
+    def __init__(self):
+        self.latency = float(os.getenv("EMULATOR_LATENCY", "0.4"))                 # seconds until the response starts
+        self.jitter = float(os.getenv("EMULATOR_JITTER", "0.3"))                   # standard deviation as a fraction of latency
+        self.tokens_per_second = float(os.getenv("EMULATOR_TOKENS_PER_SECOND", "40"))         # streamed completion speed
+        self.audio_bytes_per_second = float(os.getenv("EMULATOR_AUDIO_BYTES_PER_SECOND", "64000"))  # per audio stream, 0 = unlimited
+        self.max_concurrency = int(os.getenv("EMULATOR_MAX_CONCURRENCY", "0"))     # per vendor, more is answered with 429; 0 = unlimited
+        self.requests_per_minute = float(os.getenv("EMULATOR_REQUESTS_PER_MINUTE", "0"))  # per vendor, 0 = unlimited
+        self.error_rate = float(os.getenv("EMULATOR_ERROR_RATE", "0"))             # share of requests failing with 500
+        self.rate_limit_rate = float(os.getenv("EMULATOR_RATE_LIMIT_RATE", "0"))   # share of requests refused with 429 anyway
+        self.retry_after = float(os.getenv("EMULATOR_RETRY_AFTER", "2"))
+
+    def update(self, values: dict) -> List[str]:
+        """Apply the known settings in `values`, return the names that were changed"""
+        changed = []
+        for name, value in values.items():
+            current = getattr(self, name, None)
+            if name.startswith("_") or not isinstance(current, (int, float)):
+                continue
+            setattr(self, name, type(current)(value))
+            changed.append(name)
+        return changed
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class EmulatedVendor:
+    """Admission, failure injection and counters for one emulated vendor"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.responses: Counter = Counter()
+        self.requests = TokenBucket(settings.requests_per_minute)
+
+    def reset_rate_limit(self):
+        self.requests = TokenBucket(settings.requests_per_minute)
+
+    def refuse(self) -> Optional[int]:
+        """Status code to answer with instead of serving the request, if any"""
+        if settings.max_concurrency and self.in_flight >= settings.max_concurrency:
+            return 429
+        if self.requests.wait_time(1) > 0:
+            return 429
+        self.requests.take(1)
+        roll = rng.random()
+        if roll < settings.error_rate:
+            return 500
+        if roll < settings.error_rate + settings.rate_limit_rate:
+            return 429
+        return None
+
+    def retry_after(self) -> float:
+        return max(settings.retry_after, self.requests.wait_time(1))
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "responses": dict(self.responses)
+        }
+
+
+settings = EmulatorSettings()
+rng = random.Random(os.getenv("EMULATOR_SEED"))
+vendors = {"openai": EmulatedVendor("openai"), "elevenlabs": EmulatedVendor("elevenlabs")}
+
+app = FastAPI(title="Traveler's Tale vendor emulator")
+
+
+def _error_response(vendor: EmulatedVendor, status: int) -> JSONResponse:
+    vendor.responses[status] += 1
+    headers = {}
+    if status == 429:
+        headers["Retry-After"] = str(math.ceil(vendor.retry_after()))
+        message = "Rate limit reached"
+    else:
+        message = "Internal server error"
+
+    # Each vendor's own error shape, so client error handling sees what it would in production
+    if vendor.name == "openai":
+        body = {"error": {"message": message, "type": "rate_limit_exceeded" if status == 429 else "server_error", "code": None}}
+    else:
+        body = {"detail": {"status": "too_many_concurrent_requests" if status == 429 else "internal_error", "message": message}}
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+async def _paced(vendor: EmulatedVendor, chunks: List[bytes], interval) -> AsyncIterator[bytes]:
+    """Release chunks at the configured pace; the request counts as in flight until the last one"""
+    try:
+        for chunk in chunks:
+            delay = interval(chunk)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield chunk
+    finally:
+        vendor.in_flight -= 1
+
+
+async def _serve(vendor: EmulatedVendor, generate, interval, stream: bool = True):
+    status = vendor.refuse()
+    if status is not None:
+        return _error_response(vendor, status)
+
+    vendor.in_flight += 1
+    vendor.peak_in_flight = max(vendor.peak_in_flight, vendor.in_flight)
+    try:
+        await asyncio.sleep(max(0.0, rng.gauss(settings.latency, settings.latency * settings.jitter)))
+        media_type, chunks = generate()
+    except BaseException:
+        vendor.in_flight -= 1
+        raise
+
+    vendor.responses[200] += 1
+    if not stream:
+        # Whole body at once, after the time it would have taken to generate
+        total = sum(interval(chunk) for chunk in chunks)
+        try:
+            await asyncio.sleep(total)
+        finally:
+            vendor.in_flight -= 1
+        return StreamingResponse(iter([b"".join(chunks)]), media_type=media_type)
+    return StreamingResponse(_paced(vendor, chunks, interval), media_type=media_type)
+
+
+def _token_interval(chunk: bytes) -> float:
+    return 1 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0.0
+
+
+def _audio_interval(chunk: bytes) -> float:
+    return len(chunk) / settings.audio_bytes_per_second if settings.audio_bytes_per_second > 0 else 0.0
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    return await _serve(vendors["openai"], lambda: synthetic_chat_completion(body, rng), _token_interval, stream=bool(body.get("stream")))
+
+
+@app.post("/v1/text-to-speech/{voice_id}")
+@app.post("/v1/text-to-speech/{voice_id}/stream")
+async def text_to_speech(voice_id: str, request: Request):
+    body = await request.json()
+    return await _serve(vendors["elevenlabs"], lambda: synthetic_speech(body), _audio_interval, stream=request.url.path.endswith("/stream"))
+
+
+@app.post("/v1/text-to-dialogue")
+@app.post("/v1/text-to-dialogue/convert")
+@app.post("/v1/text-to-dialogue/stream")
+async def text_to_dialogue(request: Request):
+    body = await request.json()
+    return await _serve(vendors["elevenlabs"], lambda: synthetic_speech(body), _audio_interval, stream=request.url.path.endswith("/stream"))
+
+
+@app.get("/emulator/stats")
+async def emulator_stats():
+    return {name: vendor.stats() for name, vendor in vendors.items()}
+
+
+@app.get("/emulator/config")
+async def get_emulator_config():
+    return settings.as_dict()
+
+
+@app.post("/emulator/config")
+async def update_emulator_config(request: Request):
+    """Change knobs mid-run, e.g. {"error_rate": 0.5} to watch the circuit breakers open"""
+    changed = settings.update(await request.json())
+    if "requests_per_minute" in changed:
+        for vendor in vendors.values():
+            vendor.reset_rate_limit()
+    print(f"🎛️ Emulator settings changed: {', '.join(changed) or 'nothing'}")
+    return settings.as_dict()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.getenv("EMULATOR_HOST", "127.0.0.1"), port=int(os.getenv("EMULATOR_PORT", "8100")))
@@ -1,15 +1,50 @@
 import asyncio
-from typing import Dict, List, Optional
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
 from models import GameSession, Player, GameAction, PlayerJoin, CharacterUpdate, GameState, StorySegment, ActionType
 from ai_service import AIService
 from audio_service import AudioService
+from narration_pipeline import NarrationPipeline
+from prompt_builder import PromptBuilder
+from scheduler import Scheduler, request_context
+from story_memory import StoryMemory
 import json
 
+# Callback used to push intermediate events (story deltas, ...) to a game's clients
+EventEmitter = Callable[[Dict], Awaitable[None]]
+
 class GameManager:
     def __init__(self):
         self.games: Dict[str, GameSession] = {}
-        self.ai_service = AIService()
-        self.audio_service = AudioService()
+        # One scheduler in front of both vendors, shared by every game
+        self.scheduler = Scheduler()
+        self.ai_service = AIService(self.scheduler.openai)
+        self.audio_service = AudioService(self.scheduler.elevenlabs)
+        self.stream_story = os.getenv("STORY_STREAMING", "true").lower() not in ("0", "false", "no")
+        self.narration_pipeline = os.getenv("NARRATION_PIPELINE", "true").lower() not in ("0", "false", "no")
+        
+        # Narration rendered after the chapter text went out: queued per game
+        # until start_voice_job is called, then tracked while running
+        self.pending_voice: Dict[str, Tuple[int, str, Optional[NarrationPipeline]]] = {}
+        self.voice_jobs: Dict[str, Set[asyncio.Task]] = {}
+        
+        # Rolling summary plus recent chapters the Game Master is prompted with, per game
+        self.story_memories: Dict[str, StoryMemory] = {}
+        # Story prompt assembly for games whose settings are locked
+        self.prompt_builders: Dict[str, PromptBuilder] = {}
+
+    async def startup(self):
+        """Open long-lived service resources"""
+        await self.audio_service.startup()
+
+    async def shutdown(self):
+        """Close long-lived service resources"""
+        for game_id in list(self.voice_jobs):
+            self._cancel_voice_jobs(game_id)
+        for memory in self.story_memories.values():
+            memory.cancel()
+        await self.ai_service.close()
+        await self.audio_service.shutdown()
 
     async def create_game(self, game_id: str) -> Dict:
         game_session = GameSession(id=game_id)
@@ -36,6 +71,7 @@ class GameManager:
         )
         
         game.players.append(player)
+        self._roster_changed(game.id)
         
         # Set creator if this is the first player
         if len(game.players) == 1:
@@ -121,11 +157,18 @@ class GameManager:
         # If no players left, clean up the game
         if len(game.players) == 0:
             del self.games[game_id]
+            self._cancel_voice_jobs(game_id)
+            self.prompt_builders.pop(game_id, None)
+            memory = self.story_memories.pop(game_id, None)
+            if memory is not None:
+                memory.cancel()
             return {
                 "type": "game_ended",
                 "message": "Game ended - all players disconnected"
             }
         
+        self._roster_changed(game_id)
+        
         # Adjust current player turn if needed
         if game.current_player_turn >= len(game.players):
             game.current_player_turn = 0
@@ -143,7 +186,7 @@ class GameManager:
             "message": f"{player_to_remove.name} has left the adventure"
         }
 
-    async def start_game_manually(self, game_id: str, player_id: str, theme: str = "", language: str = "English", gm_role: str = "", chapter_length: str = "medium", narrator_voice: str = "") -> Dict:
+    async def start_game_manually(self, game_id: str, player_id: str, theme: str = "", language: str = "English", gm_role: str = "", chapter_length: str = "medium", narrator_voice: str = "", emit: Optional[EventEmitter] = None) -> Dict:
         """Start the game manually when players are ready"""
         if game_id not in self.games:
             return {"type": "error", "message": "Game not found"}
@@ -171,8 +214,11 @@ class GameManager:
         print(f"🔒 Using Freya as narrator voice")
         
         print(f"🔒 Game settings locked for session - Language: {language}, Narrator: {game.narrator_voice}")
+        self.prompt_builders[game_id] = PromptBuilder(game)
         
-        voice_file, bgm_file = await self._start_game(game, theme, language, gm_role, chapter_length)
+        with request_context(game_id):
+            voice_file, voice_playlist, bgm_file = await self._start_game(game, language, emit)
+        chapter_index = len(game.story_history) - 1
         
         return {
             "type": "game_started",
@@ -181,67 +227,34 @@ class GameManager:
             "current_player": "All players" if len(game.players) > 1 else game.players[0].name,
             "game_state": game.state,
             "voice_file": voice_file,
+            "voice_playlist": voice_playlist,
+            "voice_pending": game_id in self.pending_voice,
+            "chapter_index": chapter_index,
             "background_music": bgm_file,
             "actions_needed": len(game.players),
             "actions_received": 0
         }
 
-    async def _start_game(self, game: GameSession, theme: str = "", language: str = "English", gm_role: str = "", chapter_length: str = "medium"):
+    async def _start_game(self, game: GameSession, language: str = "English", emit: Optional[EventEmitter] = None):
         game.state = GameState.STORY_TELLING
         
-        theme_instruction = f"Theme: {theme}. " if theme else ""
-        language_instruction = f"Write the story in {language}. " if language != "English" else ""
-        
-        # Chapter length instructions
-        length_instructions = {
-            "short": "Keep chapters brief and focused (1-2 paragraphs). Move quickly between action points.",
-            "medium": "Use moderate pacing with 2-3 paragraphs per chapter. Balance description and action.",
-            "long": "Create detailed, immersive chapters (3-4 paragraphs). Include rich descriptions and character development."
-        }
-        length_instruction = length_instructions.get(chapter_length, length_instructions["medium"])
-        
-        # Build character context for story generation
-        character_context = self._build_character_context(game)
-        
-        initial_prompt = f"""
-        You are the Game Master for an interactive adventure with {len(game.players)} players: {', '.join([p.name for p in game.players])}.
-        
-        {language_instruction}{theme_instruction}Start an engaging adventure story. Set the scene, introduce the world, and create an interesting situation where the players need to make decisions or take actions.
-        
-        CHAPTER LENGTH: {length_instruction}
-        
-        {character_context}
-        
-        The story should be immersive and leave room for player agency. End with a situation where the players need to decide what to do.
-        
-        Keep the story appropriate for all audiences and focus on adventure, exploration, and problem-solving.
-        """
-        
-        story_response = await self.ai_service.generate_story(initial_prompt, game.scene_context, gm_role)
+        messages = self._get_prompt_builder(game).opening_messages(self._story_context(game))
+        pipeline = self._create_narration_pipeline(game, language, emit)
+        story_response = await self._generate_story(messages, emit, pipeline)
         game.current_story = story_response["story"]
-        game.scene_context = story_response["context"]
-        
-        # Prepare character voices for multi-voice generation
-        character_voices = self._get_character_voices(game)
-        
-        # Generate voice for the story using consistent session settings
-        voice_file = await self.audio_service.generate_voice(
-            story_response["story"], 
-            language,
-            character_voices=character_voices,
-            narrator_voice_id=game.narrator_voice,
-            session_language=game.language
-        )
         
         # Select background music
         bgm_file = await self.audio_service.select_background_music("adventure")
         
         story_segment = StorySegment(
             text=story_response["story"],
-            voice_file=voice_file,
             background_music=bgm_file
         )
         game.story_history.append(story_segment)
+        self._get_story_memory(game).add_chapter(story_segment.text)
+        
+        # Generate voice for the story using consistent session settings
+        voice_file, voice_playlist = await self._narrate_chapter(game, story_segment, language, pipeline, emit)
         
         # Set up round-based gameplay
         game.state = GameState.PLAYER_TURN
@@ -249,9 +262,9 @@ class GameManager:
         game.actions_needed = len(game.players)
         game.pending_actions = []
         
-        return voice_file, bgm_file
+        return voice_file, voice_playlist, bgm_file
 
-    async def process_pending_actions(self, game_id: str) -> Dict:
+    async def process_pending_actions(self, game_id: str, emit: Optional[EventEmitter] = None) -> Dict:
         """Process all pending actions for a game that's in GM_WORKING state"""
         if game_id not in self.games:
             return {"type": "error", "message": "Game not found"}
@@ -261,7 +274,8 @@ class GameManager:
         if game.state != GameState.GM_WORKING:
             return {"type": "error", "message": "Game is not in GM working state"}
         
-        return await self._process_all_actions(game)
+        with request_context(game_id):
+            return await self._process_all_actions(game, emit)
 
     async def update_character(self, character_update: CharacterUpdate) -> Dict:
         """Update a player's character information (with voice consistency enforcement)"""
@@ -294,6 +308,8 @@ class GameManager:
                     else:
                         print(f"⚠️ Voice locked for {player.name} - game in progress")
                 
+                self._roster_changed(game.id)
+                
                 return {
                     "type": "character_updated",
                     "player_id": character_update.player_id,
@@ -315,6 +331,42 @@ class GameManager:
             "voices": voices
         }
     
+    async def get_bgm_tracks(self) -> Dict:
+        """Get the indexed background music tracks"""
+        library = self.audio_service.bgm_library
+        return {
+            "type": "bgm_list",
+            "tracks": library.list_tracks()
+        }
+    
+    async def get_scheduler_stats(self) -> Dict:
+        """Queue depth, waits and remaining rate budget per vendor"""
+        return {
+            "type": "scheduler_stats",
+            **self.scheduler.stats()
+        }
+    
+    async def get_cache_stats(self) -> Dict:
+        """Voice cache hit rates and health of the TTS backends"""
+        return {
+            "type": "cache_stats",
+            **self.audio_service.cache_report()
+        }
+    
+    def personalize_event(self, event: Dict, supported_formats: List[str]) -> Dict:
+        """Copy of an event whose voice URLs point at the variants a client can play"""
+        if not supported_formats or ("voice_file" not in event and "voice_playlist" not in event):
+            return event
+        
+        personalized = dict(event)
+        if "voice_file" in event:
+            personalized["voice_file"] = self.audio_service.voice_url_for(event["voice_file"], supported_formats)
+        if event.get("voice_playlist"):
+            personalized["voice_playlist"] = [
+                self.audio_service.voice_url_for(voice_file, supported_formats) for voice_file in event["voice_playlist"]
+            ]
+        return personalized
+    
     def _get_character_voices(self, game: GameSession) -> dict:
         """Get character voices mapping for multi-voice generation"""
         character_voices = {}
@@ -329,39 +381,165 @@ class GameManager:
         print(f"🎭 Active character voices: {len(character_voices)} players with voice settings")
         return character_voices
     
-    def _build_character_context(self, game: GameSession) -> str:
-        """Build character context for story generation"""
-        if not game.players:
-            return ""
+    def _get_prompt_builder(self, game: GameSession) -> PromptBuilder:
+        """The game's prompt builder, created on first use"""
+        builder = self.prompt_builders.get(game.id)
+        if builder is None:
+            builder = PromptBuilder(game)
+            self.prompt_builders[game.id] = builder
+        return builder
+    
+    def _roster_changed(self, game_id: str):
+        """Have the next story prompt pick up joined, departed or edited characters"""
+        builder = self.prompt_builders.get(game_id)
+        if builder is not None:
+            builder.invalidate_roster()
+    
+    def _get_story_memory(self, game: GameSession) -> StoryMemory:
+        """The game's story memory, created on first use"""
+        memory = self.story_memories.get(game.id)
+        if memory is None:
+            async def summarize(summary: str, chapters: List[str]) -> Optional[str]:
+                return await self.ai_service.summarize_story(summary, chapters, game.language, memory.summary_tokens)
+            
+            memory = StoryMemory(summarize)
+            self.story_memories[game.id] = memory
+        return memory
+    
+    def _story_context(self, game: GameSession, query: str = "") -> str:
+        """Story so far as the Game Master sees it, with earlier passages relevant to `query`, within the memory token budget"""
+        game.scene_context = self._get_story_memory(game).render(query)
+        return game.scene_context
+    
+    async def _generate_story(self, messages: List[Dict[str, str]], emit: Optional[EventEmitter] = None, pipeline: Optional[NarrationPipeline] = None) -> Dict[str, str]:
+        """Generate the next chapter, streaming text deltas to clients when enabled"""
+        if emit is None or not self.stream_story:
+            return await self.ai_service.generate_story(messages)
+        
+        async def on_delta(delta: str):
+            # Narration first: a failed broadcast must not cost the chapter its audio
+            if pipeline is not None:
+                await pipeline.feed(delta)
+            try:
+                await emit({"type": "story_delta", "delta": delta})
+            except Exception as e:
+                print(f"⚠️ Could not broadcast story delta: {e}")
+        
+        try:
+            return await self.ai_service.generate_story_streaming(messages, on_delta)
+        except BaseException:
+            if pipeline is not None:
+                await pipeline.cancel()
+            raise
+    
+    def _create_narration_pipeline(self, game: GameSession, language: str, emit: Optional[EventEmitter] = None) -> Optional[NarrationPipeline]:
+        """Create a sentence-pipelined narrator for a streamed chapter, if enabled"""
+        if emit is None or not self.stream_story or not self.narration_pipeline:
+            return None
         
-        character_descriptions = []
-        for player in game.players:
-            if player.character_name:
-                char_info = f"- {player.character_name}"
-                
-                # Add gender information
-                if player.character_gender:
-                    char_info += f" ({player.character_gender})"
-                
-                # Add character description
-                if player.character_description:
-                    char_info += f": {player.character_description}"
-                else:
-                    char_info += f": A {player.character_gender or 'character'} adventurer"
-                
-                character_descriptions.append(char_info)
+        async def on_chunk(index: int, voice_file: str):
+            await emit({"type": "narration_chunk", "index": index, "voice_file": voice_file})
         
-        if character_descriptions:
-            return f"""
-
-CHARACTER ROSTER:
-{chr(10).join(character_descriptions)}
-
-IMPORTANT: Use these character descriptions to inform your storytelling. Reference their abilities, personalities, and backgrounds when they act or when situations would be relevant to their skills."""
+        return NarrationPipeline(
+            self.audio_service,
+            on_chunk,
+            language,
+            character_voices=self._get_character_voices(game),
+            narrator_voice_id=game.narrator_voice,
+            session_language=game.language,
+            on_variants=self._variant_announcer(emit)
+        )
+    
+    @staticmethod
+    def _variant_announcer(emit: EventEmitter) -> Callable[[str], Awaitable[None]]:
+        """Tell clients a compact variant of a voice file they were sent exists now"""
+        async def on_variants(voice_file: str):
+            # personalize_event rewrites voice_file per client; "original" says which file it replaces
+            await emit({"type": "voice_variant_ready", "original": voice_file, "voice_file": voice_file})
+        return on_variants
+    
+    async def _render_narration(self, game: GameSession, story_text: str, language: str, pipeline: Optional[NarrationPipeline] = None, on_live: Optional[Callable[[str], Awaitable[None]]] = None, on_variants: Optional[Callable[[str], Awaitable[None]]] = None) -> Tuple[Optional[str], List[str]]:
+        """Render chapter narration as one file, or collect the pipelined chunk playlist"""
+        if pipeline is not None:
+            return None, await pipeline.finish()
+        
+        # Prepare character voices for multi-voice generation
+        character_voices = self._get_character_voices(game)
+        
+        voice_file = await self.audio_service.generate_voice(
+            story_text, 
+            language,
+            character_voices=character_voices,
+            narrator_voice_id=game.narrator_voice,
+            session_language=game.language,
+            on_live=on_live,
+            on_variants=on_variants
+        )
+        return voice_file, []
+    
+    async def _narrate_chapter(self, game: GameSession, segment: StorySegment, language: str, pipeline: Optional[NarrationPipeline] = None, emit: Optional[EventEmitter] = None) -> Tuple[Optional[str], List[str]]:
+        """Render narration now, or defer it to a background voice job when clients can be notified later"""
+        if emit is None:
+            segment.voice_file, segment.voice_playlist = await self._render_narration(game, segment.text, language, pipeline)
+            return segment.voice_file, segment.voice_playlist
+        
+        # The chapter text goes out first; start_voice_job renders and pushes voice_ready
+        self.pending_voice[game.id] = (len(game.story_history) - 1, language, pipeline)
+        return None, []
+    
+    def start_voice_job(self, game_id: str, emit: EventEmitter) -> Optional[asyncio.Task]:
+        """Start rendering the narration deferred by the last chapter in the background"""
+        if game_id not in self.pending_voice:
+            return None
+        
+        chapter_index, language, pipeline = self.pending_voice.pop(game_id)
+        task = asyncio.create_task(self._run_voice_job(game_id, chapter_index, language, pipeline, emit))
         
-        return ""
+        jobs = self.voice_jobs.setdefault(game_id, set())
+        jobs.add(task)
+        task.add_done_callback(jobs.discard)
+        print(f"🎙️ Voice job started for chapter {chapter_index} ({len(jobs)} running for this game)")
+        return task
+    
+    async def _run_voice_job(self, game_id: str, chapter_index: int, language: str, pipeline: Optional[NarrationPipeline], emit: EventEmitter):
+        game = self.games.get(game_id)
+        if game is None or chapter_index >= len(game.story_history):
+            return
+        
+        segment = game.story_history[chapter_index]
+        
+        async def on_live(live_url: str):
+            # Clients can start playing before the render has finished
+            await emit({"type": "voice_streaming", "chapter_index": chapter_index, "live_url": live_url})
+        
+        try:
+            with request_context(game_id):
+                voice_file, voice_playlist = await self._render_narration(game, segment.text, language, pipeline, on_live, self._variant_announcer(emit))
+        except asyncio.CancelledError:
+            if pipeline is not None:
+                await pipeline.cancel()
+            raise
+        except Exception as e:
+            print(f"❌ Voice job failed for chapter {chapter_index}: {e}")
+            voice_file, voice_playlist = None, []
+        
+        segment.voice_file = voice_file
+        segment.voice_playlist = voice_playlist
+        
+        await emit({
+            "type": "voice_ready",
+            "chapter_index": chapter_index,
+            "voice_file": voice_file,
+            "voice_playlist": voice_playlist
+        })
+    
+    def _cancel_voice_jobs(self, game_id: str):
+        """Cancel narration still rendering for a game that has ended"""
+        self.pending_voice.pop(game_id, None)
+        for task in self.voice_jobs.pop(game_id, set()):
+            task.cancel()
 
-    async def _process_all_actions(self, game: GameSession) -> Dict:
+    async def _process_all_actions(self, game: GameSession, emit: Optional[EventEmitter] = None) -> Dict:
         """Process all collected player actions and generate the next story"""
         game.state = GameState.STORY_TELLING
         
@@ -373,49 +551,12 @@ IMPORTANT: Use these character descriptions to inform your storytelling. Referen
             action_desc = f"{char_name} wants to {action.action_text} (Type: {action.action_type})"
             actions_summary.append(action_desc)
         
-        character_context = self._build_character_context(game)
-        
-        # Include language instruction to maintain consistency
-        language_instruction = f"Write the story in {game.language}. " if game.language != "English" else ""
-        
-        # Include theme instruction for consistency
-        theme_instruction = f"Theme: {game.theme}. " if game.theme else ""
-        
-        # Include chapter length instruction for consistency
-        length_instructions = {
-            "short": "Keep chapters brief and focused (1-2 paragraphs). Move quickly between action points.",
-            "medium": "Use moderate pacing with 2-3 paragraphs per chapter. Balance description and action.",
-            "long": "Create detailed, immersive chapters (3-4 paragraphs). Include rich descriptions and character development."
-        }
-        length_instruction = length_instructions.get(game.chapter_length, length_instructions["medium"])
-        
-        context = f"""
-        {language_instruction}{theme_instruction}Continue the adventure story for {len(game.players)} players.
-        
-        CHAPTER LENGTH: {length_instruction}
-        
-        Current scene: {game.scene_context}
-        Previous story: {game.current_story}
-        
-        {character_context}
-        
-        All players have submitted their actions:
-        {chr(10).join(actions_summary)}
-        
-        Continue the story based on ALL these actions happening simultaneously or in sequence. 
-        Describe what happens as a result of the players' combined actions.
-        Include consequences, new developments, or challenges.
-        
-        Consider each character's abilities, personality, and background when describing their actions and their results.
-        
-        If any actions lead to combat, indicate that combat has begun.
-        If the actions resolve the current situation, set up the next scenario.
-        
-        End with a new situation that requires all players to decide their next actions.
-        """
-        
         print(f"🔒 Processing actions - Narrator Voice: '{game.narrator_voice}', Language: {game.language}")
-        story_response = await self.ai_service.generate_story(context, game.scene_context, game.gm_role)
+        # Recall earlier passages about whoever and whatever the players' actions name
+        recall_query = "\n".join(action.action_text for action in game.pending_actions)
+        messages = self._get_prompt_builder(game).round_messages(actions_summary, self._story_context(game, recall_query))
+        pipeline = self._create_narration_pipeline(game, game.language, emit)
+        story_response = await self._generate_story(messages, emit, pipeline)
         
         # Determine if we're entering combat
         if "combat" in story_response.get("scene_type", "").lower():
@@ -425,38 +566,33 @@ IMPORTANT: Use these character descriptions to inform your storytelling. Referen
             game.state = GameState.PLAYER_TURN
             bgm_type = "adventure"
         
-        # Prepare character voices for multi-voice generation
-        character_voices = self._get_character_voices(game)
-        
-        # Generate voice using consistent session settings
-        voice_file = await self.audio_service.generate_voice(
-            story_response["story"], 
-            game.language,
-            character_voices=character_voices,
-            narrator_voice_id=game.narrator_voice,
-            session_language=game.language
-        )
         bgm_file = await self.audio_service.select_background_music(bgm_type)
         
         # Update game state
         game.current_story = story_response["story"]
-        game.scene_context = story_response["context"]
         
         story_segment = StorySegment(
             text=story_response["story"],
-            voice_file=voice_file,
             background_music=bgm_file
         )
         game.story_history.append(story_segment)
+        self._get_story_memory(game).add_chapter(story_segment.text)
+        
+        # Generate voice using consistent session settings
+        voice_file, voice_playlist = await self._narrate_chapter(game, story_segment, game.language, pipeline, emit)
         
         # Reset for next round
         game.pending_actions = []
         game.actions_needed = len(game.players)
         
         return {
-            "type": "story_update",
+            # Streamed chapters close with story_complete after their story_delta frames
+            "type": "story_complete" if emit is not None and self.stream_story else "story_update",
             "story": story_response["story"],
             "voice_file": voice_file,
+            "voice_playlist": voice_playlist,
+            "voice_pending": game.id in self.pending_voice,
+            "chapter_index": len(game.story_history) - 1,
             "background_music": bgm_file,
             "current_player": "All players",
             "game_state": game.state,
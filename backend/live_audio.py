@@ -0,0 +1,88 @@
+import asyncio
+from typing import AsyncIterator, Dict, Optional
+
+import aiofiles
+
+CHUNK_SIZE = 64 * 1024
+
+
+class LiveRender:
+    """A voice file being streamed to disk that listeners can follow while it grows
+
+    The writer appends to a temporary file and renames it into place when the
+    render completes. Listeners open the file once and keep reading from the
+    same handle, so the rename does not interrupt them.
+    """
+
+    def __init__(self, filename: str, temp_path: str, final_path: str):
+        self.filename = filename
+        self.temp_path = temp_path
+        self.final_path = final_path
+        self.size = 0
+        self.done = False
+        self.failed = False
+        self._changed = asyncio.Event()
+
+    def wrote(self, length: int):
+        self.size += length
+        self._notify()
+
+    def finish(self, failed: bool = False):
+        self.done = True
+        self.failed = failed
+        self._notify()
+
+    def _notify(self):
+        # Wake everyone waiting on the current event and give later waiters a fresh one
+        changed = self._changed
+        self._changed = asyncio.Event()
+        changed.set()
+
+    async def follow(self) -> AsyncIterator[bytes]:
+        """Yield the audio written so far, then new chunks as they arrive, until the render ends"""
+        try:
+            f = await aiofiles.open(self.temp_path, 'rb')
+        except FileNotFoundError:
+            if self.failed:
+                return
+            # Already renamed into place
+            f = await aiofiles.open(self.final_path, 'rb')
+
+        sent = 0
+        try:
+            while True:
+                # Take the event before reading so a chunk written in between is never missed
+                changed = self._changed
+                chunk = await f.read(CHUNK_SIZE)
+                if chunk:
+                    sent += len(chunk)
+                    yield chunk
+                    continue
+                if self.done and (self.failed or sent >= self.size):
+                    return
+                await changed.wait()
+        finally:
+            await f.close()
+
+
+class LiveRenders:
+    """Registry of the voice files currently streaming in, by cache file name"""
+
+    def __init__(self):
+        self._renders: Dict[str, LiveRender] = {}
+
+    def start(self, filename: str, temp_path: str, final_path: str) -> LiveRender:
+        render = LiveRender(filename, temp_path, final_path)
+        self._renders[filename] = render
+        return render
+
+    def finish(self, render: LiveRender, failed: bool = False):
+        render.finish(failed)
+        if self._renders.get(render.filename) is render:
+            del self._renders[render.filename]
+
+    def get(self, filename: str) -> Optional[LiveRender]:
+        return self._renders.get(filename)
+
+    def __len__(self) -> int:
+        return len(self._renders)
@@ -1,16 +1,25 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import json
 import uuid
-import os
 import asyncio
 import time
+from contextlib import asynccontextmanager
 from typing import Dict, List
 from game_manager import GameManager
 from models import GameAction, PlayerJoin, CharacterUpdate
+from media_responses import IMMUTABLE, REVALIDATE, file_response
 
-app = FastAPI(title="Traveler's Tale API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await game_manager.startup()
+    yield
+    # Release pooled vendor connections on shutdown
+    await game_manager.shutdown()
+
+app = FastAPI(title="Traveler's Tale API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,25 +32,14 @@ app.add_middleware(
 # Mount static files for audio
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Create symbolic link to bgm folder if it doesn't exist
-bgm_static_path = "static/bgm"
-if not os.path.exists(bgm_static_path):
-    os.makedirs("static", exist_ok=True)
-    if os.path.exists("../bgm"):
-        try:
-            os.symlink("../../bgm", bgm_static_path)
-        except OSError:
-            # If symlink fails (Windows), copy files instead
-            import shutil
-            if os.path.exists("../bgm"):
-                shutil.copytree("../bgm", bgm_static_path, dirs_exist_ok=True)
-
 game_manager = GameManager()
 
 class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
         self.game_connections: Dict[str, List[str]] = {}
+        # Audio formats each client advertised on join_game, e.g. ["opus", "mp3"]
+        self.audio_formats: Dict[str, List[str]] = {}
 
     async def connect(self, websocket: WebSocket, client_id: str):
         await websocket.accept()
@@ -52,6 +50,7 @@ class ConnectionManager:
         
         if client_id in self.active_connections:
             del self.active_connections[client_id]
+        self.audio_formats.pop(client_id, None)
         
         for game_id in self.game_connections:
             if client_id in self.game_connections[game_id]:
@@ -62,21 +61,52 @@ class ConnectionManager:
         return disconnected_from_game
 
     async def send_personal_message(self, message: str, client_id: str):
-        if client_id in self.active_connections:
-            await self.active_connections[client_id].send_text(message)
+        websocket = self.active_connections.get(client_id)
+        if websocket is None:
+            return
+        try:
+            await websocket.send_text(message)
+        except Exception as e:
+            # A client that went away must not break the game for the others: stop sending
+            # to it, its receive loop sees the disconnect and removes the player
+            print(f"⚠️ Dropping client {client_id} after a failed send: {e}")
+            self.active_connections.pop(client_id, None)
 
     async def broadcast_to_game(self, message: str, game_id: str):
         if game_id in self.game_connections:
-            for client_id in self.game_connections[game_id]:
+            for client_id in list(self.game_connections[game_id]):
                 await self.send_personal_message(message, client_id)
 
+    async def broadcast_event(self, event: Dict, game_id: str):
+        """Broadcast a game event, pointing voice URLs at the variant each client plays best"""
+        if game_id not in self.game_connections:
+            return
+        # Serialize once per distinct set of formats rather than once per client
+        messages: Dict[tuple, str] = {}
+        for client_id in list(self.game_connections[game_id]):
+            formats = tuple(self.audio_formats.get(client_id, ()))
+            if formats not in messages:
+                messages[formats] = json.dumps(game_manager.personalize_event(event, list(formats)))
+            await self.send_personal_message(messages[formats], client_id)
+
 manager = ConnectionManager()
 
+def game_emitter(game_id: str, connection_manager: ConnectionManager):
+    """Build a callback that broadcasts intermediate game events to every client in a game"""
+    async def emit(event: Dict):
+        await connection_manager.broadcast_event(event, game_id)
+    return emit
+
 async def process_actions_after_delay(game_id: str, connection_manager: ConnectionManager):
     """Process pending actions after a brief delay to show the GM working status"""
     await asyncio.sleep(2)  # Show "GM working" for 2 seconds
-    result = await game_manager.process_pending_actions(game_id)
-    await connection_manager.broadcast_to_game(json.dumps(result), game_id)
+    emit = game_emitter(game_id, connection_manager)
+    try:
+        result = await game_manager.process_pending_actions(game_id, emit=emit)
+        await connection_manager.broadcast_event(result, game_id)
+    finally:
+        # Narration renders in the background once the text is out, even if sending it failed
+        game_manager.start_voice_job(game_id, emit)
 
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
@@ -89,6 +119,9 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
             if message["type"] == "join_game":
                 game_id = message["game_id"]
                 player_name = message["player_name"]
+                supported_formats = message.get("supported_formats")
+                if isinstance(supported_formats, list):
+                    manager.audio_formats[client_id] = [str(audio_format).lower() for audio_format in supported_formats]
                 
                 # Check if game exists first
                 game_status = await game_manager.get_game_status(game_id)
@@ -150,8 +183,12 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                 chapter_length = message.get("chapter_length", "medium")
                 narrator_voice = message.get("narrator_voice", "")
                 
-                result = await game_manager.start_game_manually(game_id, client_id, theme, language, gm_role, chapter_length, narrator_voice)
-                await manager.broadcast_to_game(json.dumps(result), game_id)
+                emit = game_emitter(game_id, manager)
+                try:
+                    result = await game_manager.start_game_manually(game_id, client_id, theme, language, gm_role, chapter_length, narrator_voice, emit=emit)
+                    await manager.broadcast_event(result, game_id)
+                finally:
+                    game_manager.start_voice_job(game_id, emit)
             
             elif message["type"] == "chat_message":
                 game_id = message["game_id"]
@@ -203,6 +240,56 @@ async def get_game_status(game_id: str):
 async def get_available_voices():
     return await game_manager.get_available_voices()
 
+@app.get("/api/bgm")
+async def get_bgm_tracks():
+    return await game_manager.get_bgm_tracks()
+
+@app.get("/api/scheduler/stats")
+async def get_scheduler_stats():
+    return await game_manager.get_scheduler_stats()
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    return await game_manager.get_cache_stats()
+
+@app.api_route("/bgm/{version}/{filename}", methods=["GET", "HEAD"])
+async def get_bgm_track(version: str, filename: str, request: Request):
+    """Serve background music; content-hash URLs are cacheable forever"""
+    track = game_manager.audio_service.bgm_library.get(filename)
+    if track is None:
+        raise HTTPException(status_code=404, detail="Track not found")
+    
+    if version != "latest" and version != track.content_hash:
+        # Outdated hash: point the client at the current version of the track
+        return RedirectResponse(url=f"/{track.url}", status_code=307)
+    
+    # Only promise immutability while the file still matches what was hashed
+    hashed = track.content_hash is not None and track.unchanged_on_disk()
+    if hashed:
+        etag = f'"{track.content_hash}"'
+    else:
+        etag = f'W/"{track.size:x}-{int(track.mtime):x}"'
+    cache_control = IMMUTABLE if hashed and version == track.content_hash else REVALIDATE
+    
+    try:
+        return file_response(request, track.path, etag, cache_control)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Track not found")
+
+@app.get("/audio/live/{filename}")
+async def get_live_audio(filename: str):
+    """Play a voice file while it is still streaming in from ElevenLabs"""
+    audio_service = game_manager.audio_service
+    live = audio_service.live_renders.get(filename)
+    if live is None:
+        # Finished (or never started): the cached file is the thing to play
+        if audio_service.voice_cache.lookup(filename):
+            return RedirectResponse(url=f"/static/audio/{filename}", status_code=307)
+        raise HTTPException(status_code=404, detail="Audio not found")
+    
+    # Length is unknown while rendering, so the body goes out chunked
+    return StreamingResponse(live.follow(), media_type="audio/mpeg", headers={"Cache-Control": "no-store"})
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
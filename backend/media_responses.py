@@ -0,0 +1,111 @@
+import mimetypes
+import os
+from email.utils import formatdate
+from typing import AsyncIterator, Optional, Tuple
+
+import aiofiles
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=" range into an inclusive (start, end) pair
+
+    Returns None for ranges that cannot be satisfied. Multi-range requests
+    are answered with their first range only.
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not ranges:
+        return None
+
+    first = ranges.split(",")[0].strip()
+    start_text, _, end_text = first.partition("-")
+    try:
+        if not start_text:
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                return None
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison as used by If-None-Match"""
+    if header.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+async def _iter_file(path: str, start: int, length: int) -> AsyncIterator[bytes]:
+    async with aiofiles.open(path, 'rb') as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request: Request, path: str, etag: str, cache_control: str, media_type: Optional[str] = None) -> Response:
+    """Serve a file with validators and byte-range support
+
+    Answers If-None-Match with 304, honours Range (and If-Range) with 206 or
+    416, and streams the body in chunks. Raises FileNotFoundError if the file
+    is gone.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True)
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    status_code = 200
+    start, end = 0, size - 1
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range needs a strong match; otherwise the client gets the whole (changed) file
+    if range_header and (if_range is None or (not etag.startswith("W/") and if_range.strip() == etag)):
+        byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    length = max(0, end - start + 1)
+    headers["Content-Length"] = str(length)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(_iter_file(path, start, length), status_code=status_code, headers=headers, media_type=media_type)
@@ -49,6 +49,7 @@ class CharacterUpdate(BaseModel):
 class StorySegment(BaseModel):
     text: str
     voice_file: Optional[str] = None
+    voice_playlist: List[str] = []  # Ordered narration chunks when pipelined
     background_music: Optional[str] = None
 
 class GameSession(BaseModel):
@@ -0,0 +1,222 @@
+import os
+from typing import List, Optional, Tuple
+
+# Bitrates in kbit/s by (MPEG-1?, layer), indexed by the 4-bit bitrate field
+BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# Sample rates by version bits: 0 = MPEG-2.5, 2 = MPEG-2, 3 = MPEG-1
+SAMPLE_RATES = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000),
+}
+
+VERSION_NAMES = {0: "MPEG-2.5", 2: "MPEG-2", 3: "MPEG-1"}
+
+
+class Mp3FormatError(ValueError):
+    """Raised when files cannot be joined frame by frame"""
+
+
+class FrameHeader:
+    __slots__ = ('length', 'version', 'layer', 'sample_rate', 'mono')
+
+    def __init__(self, length: int, version: int, layer: int, sample_rate: int, mono: bool):
+        self.length = length
+        self.version = version
+        self.layer = layer
+        self.sample_rate = sample_rate
+        self.mono = mono
+
+    @property
+    def samples(self) -> int:
+        """Samples per channel carried by one frame"""
+        if self.layer == 1:
+            return 384
+        if self.layer == 3 and self.version != 3:
+            return 576
+        return 1152
+
+    @property
+    def signature(self) -> Tuple[int, int, int, bool]:
+        """Frames with the same signature can follow each other in one stream"""
+        return (self.version, self.layer, self.sample_rate, self.mono)
+
+    def describe(self) -> str:
+        channels = "mono" if self.mono else "stereo"
+        return f"{VERSION_NAMES[self.version]} layer {self.layer}, {self.sample_rate} Hz {channels}"
+
+
+def parse_frame_header(data: bytes, pos: int) -> Optional[FrameHeader]:
+    """Decode the 4-byte MPEG audio frame header at pos, or None if there is none"""
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = (b1 >> 3) & 0x03
+    layer_bits = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        # Reserved values, or free format which has no computable frame length
+        return None
+
+    layer = 4 - layer_bits
+    mpeg1 = version == 3
+    bitrate = BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+
+    if layer == 1:
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 3 and not mpeg1:
+        length = 72 * bitrate // sample_rate + padding
+    else:
+        length = 144 * bitrate // sample_rate + padding
+
+    return FrameHeader(length, version, layer, sample_rate, (b3 >> 6) == 3)
+
+
+def _skip_id3v2(data: bytes) -> int:
+    """Return the offset of the first byte after any leading ID3v2 tags"""
+    pos = 0
+    while data[pos:pos + 3] == b"ID3" and pos + 10 <= len(data):
+        flags = data[pos + 5]
+        size = (data[pos + 6] << 21) | (data[pos + 7] << 14) | (data[pos + 8] << 7) | data[pos + 9]
+        pos += 10 + size + (10 if flags & 0x10 else 0)
+    return pos
+
+
+def _is_info_frame(data: bytes, pos: int, header: FrameHeader) -> bool:
+    """Detect Xing/Info and VBRI frames, which describe the whole file rather than carry audio"""
+    if header.version == 3:
+        side_info = 17 if header.mono else 32
+    else:
+        side_info = 9 if header.mono else 17
+    xing_tag = data[pos + 4 + side_info:pos + 8 + side_info]
+    return xing_tag in (b"Xing", b"Info") or data[pos + 36:pos + 40] == b"VBRI"
+
+
+def read_frames(data: bytes) -> Tuple[Optional[Tuple[int, int, int, bool]], List[Tuple[int, int]], Optional[FrameHeader]]:
+    """Find the audio frames of an MP3 file
+
+    Returns the stream signature, the (start, end) byte range of every audio
+    frame and the first frame header. Tags and Xing/Info/VBRI headers are
+    left out, so the frames can be written straight into another stream.
+    """
+    end = len(data)
+    if end >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128  # ID3v1 tag
+
+    pos = _skip_id3v2(data)
+    frames: List[Tuple[int, int]] = []
+    first: Optional[FrameHeader] = None
+
+    while pos + 4 <= end:
+        header = parse_frame_header(data, pos)
+        if header is None or pos + header.length > end:
+            # Junk between frames: resync on a header that is followed by another one
+            pos = _resync(data, pos + 1, end)
+            if pos < 0:
+                break
+            continue
+
+        if first is None:
+            first = header
+            if _is_info_frame(data, pos, header):
+                pos += header.length
+                continue
+        elif header.signature != first.signature:
+            raise Mp3FormatError(f"stream changes format mid-file ({first.describe()} -> {header.describe()})")
+
+        frames.append((pos, pos + header.length))
+        pos += header.length
+
+    return (first.signature if first else None), frames, first
+
+
+def _resync(data: bytes, pos: int, end: int) -> int:
+    while True:
+        pos = data.find(b"\xff", pos, end)
+        if pos < 0 or pos + 4 > end:
+            return -1
+        header = parse_frame_header(data, pos)
+        if header is not None and pos + header.length <= end:
+            following = pos + header.length
+            if following == end or parse_frame_header(data, following) is not None:
+                return pos
+        pos += 1
+
+
+def mp3_duration(data: bytes) -> Optional[float]:
+    """Playing time in seconds, counted from the frame headers"""
+    pos = _skip_id3v2(data)
+    samples = 0
+    sample_rate = None
+    first = True
+    while pos + 4 <= len(data):
+        header = parse_frame_header(data, pos)
+        if header is None:
+            # Trailing tags or junk: stop rather than guess
+            break
+        if first and _is_info_frame(data, pos, header):
+            pos += header.length
+            first = False
+            continue
+        first = False
+        samples += header.samples
+        sample_rate = header.sample_rate
+        pos += header.length
+    return samples / sample_rate if sample_rate else None
+
+
+def concatenate_mp3_files(paths: List[str], output_path: str) -> int:
+    """Join MP3 files that share one encoding without decoding them
+
+    Writes the audio frames of every input, in order, to output_path and
+    returns the number of frames written. Raises Mp3FormatError if an input
+    has no frames or the inputs differ in version, layer, sample rate or
+    channel count; those need re-encoding instead.
+    """
+    signature = None
+    described = ""
+    parts = []
+
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        file_signature, frames, first = read_frames(data)
+        if not frames:
+            raise Mp3FormatError(f"no MPEG audio frames in {os.path.basename(path)}")
+        if signature is None:
+            signature, described = file_signature, first.describe()
+        elif file_signature != signature:
+            raise Mp3FormatError(f"{os.path.basename(path)} is {first.describe()}, expected {described}")
+        parts.append((data, frames))
+
+    # Write next to the target and swap it in so readers never see a partial file
+    temp_path = output_path + ".part"
+    count = 0
+    with open(temp_path, 'wb') as out:
+        for data, frames in parts:
+            view = memoryview(data)
+            # Frames are contiguous runs almost always; write each run in one go
+            run_start, run_end = frames[0]
+            for start, stop in frames[1:]:
+                if start != run_end:
+                    out.write(view[run_start:run_end])
+                    run_start = start
+                run_end = stop
+            out.write(view[run_start:run_end])
+            count += len(frames)
+    os.replace(temp_path, output_path)
+
+    return count
@@ -0,0 +1,181 @@
+import asyncio
+import os
+import re
+from typing import Awaitable, Callable, List, Optional
+
+# Sentence end: terminal punctuation, optionally followed by a closing quote
+SENTENCE_TAIL = re.compile(r'[.!?…]["”“»\']?\Z')
+
+QUOTE_OPENERS = '„«'
+QUOTE_CLOSERS = '”»'
+
+
+class SentenceSplitter:
+    """Cut streamed story text into narration chunks at sentence or paragraph boundaries
+
+    Sentences inside quotes are not cut, but a quote never spans a paragraph
+    break or more than `max_quote_chars`, so a quote the model never closes
+    cannot hold back the rest of the chapter.
+    """
+
+    def __init__(self, min_chars: int = 120, max_quote_chars: int = 600):
+        self.min_chars = min_chars
+        self.max_quote_chars = max_quote_chars
+        self.buffer = ""
+        self._scan_pos = 0
+        self._quote_depth = 0
+        self._quote_start = 0
+
+    def feed(self, delta: str) -> List[str]:
+        """Add a text delta and return every chunk that is now complete"""
+        self.buffer += delta
+        chunks = []
+
+        # Boundaries are only taken at the whitespace following a sentence,
+        # so punctuation at the very end of a delta waits for the next one
+        while self._scan_pos < len(self.buffer):
+            char = self.buffer[self._scan_pos]
+            self._track_quotes(char)
+            self._scan_pos += 1
+
+            end = self._scan_pos - 1
+            is_paragraph = char == '\n' and end > 0 and self.buffer[end - 1] == '\n'
+            if self._quote_depth and (is_paragraph or end - self._quote_start > self.max_quote_chars):
+                # Treat the quote as unclosed rather than wait for its end
+                self._quote_depth = 0
+
+            if self._quote_depth or not char.isspace():
+                continue
+
+            is_sentence = SENTENCE_TAIL.search(self.buffer, max(0, end - 2), end) is not None
+
+            # Paragraphs always end a chunk, sentences once the chunk is long enough
+            if is_paragraph or (is_sentence and end >= self.min_chars):
+                chunk = self._take(self._scan_pos)
+                if chunk:
+                    chunks.append(chunk)
+
+        return chunks
+
+    def flush(self) -> Optional[str]:
+        """Return whatever text is left once the stream has ended"""
+        chunk = self.buffer.strip()
+        self.buffer = ""
+        self._scan_pos = 0
+        self._quote_depth = 0
+        return chunk or None
+
+    def _track_quotes(self, char: str):
+        """Keep quoted speech in one chunk so dialogue attribution still works"""
+        if not self._quote_depth:
+            self._quote_start = self._scan_pos
+        if char == '"':
+            self._quote_depth = 0 if self._quote_depth else 1
+        elif char in QUOTE_OPENERS:
+            self._quote_depth += 1
+        elif char in QUOTE_CLOSERS:
+            self._quote_depth = max(0, self._quote_depth - 1)
+        elif char == '“':
+            # Closes German „...“ quotes, opens English “...” quotes
+            self._quote_depth = self._quote_depth - 1 if self._quote_depth else 1
+
+    def _take(self, end: int) -> str:
+        chunk = self.buffer[:end].strip()
+        self.buffer = self.buffer[end:]
+        self._scan_pos -= end
+        self._quote_start = max(0, self._quote_start - end)
+        return chunk
+
+
+class NarrationPipeline:
+    """Render narration sentence by sentence while the story is still being written
+
+    Each completed chunk is sent to the audio service right away (a few at a
+    time); rendered chunks are reported through on_chunk strictly in story order.
+    on_variants is passed on to the audio service for every chunk.
+    """
+
+    def __init__(self, audio_service, on_chunk: Callable[[int, str], Awaitable[None]], language: str, character_voices: Optional[dict] = None, narrator_voice_id: Optional[str] = None, session_language: Optional[str] = None, on_variants: Optional[Callable[[str], Awaitable[None]]] = None):
+        self.audio_service = audio_service
+        self.on_chunk = on_chunk
+        self.on_variants = on_variants
+        self.language = language
+        self.character_voices = character_voices
+        self.narrator_voice_id = narrator_voice_id
+        self.session_language = session_language
+
+        self.splitter = SentenceSplitter(
+            int(os.getenv("NARRATION_CHUNK_MIN_CHARS", "120")),
+            int(os.getenv("NARRATION_MAX_QUOTE_CHARS", "600"))
+        )
+        self._semaphore = asyncio.Semaphore(int(os.getenv("NARRATION_MAX_PARALLEL", "3")))
+        self._renders: "asyncio.Queue[Optional[asyncio.Task]]" = asyncio.Queue()
+        self._emitter: Optional[asyncio.Task] = None
+        self.playlist: List[str] = []
+
+    async def feed(self, delta: str):
+        """Feed a story text delta into the pipeline"""
+        for chunk in self.splitter.feed(delta):
+            self._schedule(chunk)
+
+    async def finish(self) -> List[str]:
+        """Render the remaining text and return the ordered list of chunk files"""
+        chunk = self.splitter.flush()
+        if chunk:
+            self._schedule(chunk)
+
+        if self._emitter is None:
+            return self.playlist
+
+        await self._renders.put(None)
+        await self._emitter
+        return self.playlist
+
+    async def cancel(self):
+        """Stop rendering, e.g. when the story request failed"""
+        if self._emitter is not None:
+            self._emitter.cancel()
+        while not self._renders.empty():
+            task = self._renders.get_nowait()
+            if task is not None:
+                task.cancel()
+
+    def _schedule(self, chunk: str):
+        print(f"🎙️ Narration chunk ready ({len(chunk)} chars), starting TTS")
+        self._renders.put_nowait(asyncio.create_task(self._render(chunk)))
+        if self._emitter is None:
+            self._emitter = asyncio.create_task(self._emit_in_order())
+
+    async def _render(self, chunk: str) -> Optional[str]:
+        async with self._semaphore:
+            return await self.audio_service.generate_voice(
+                chunk,
+                self.language,
+                character_voices=self.character_voices,
+                narrator_voice_id=self.narrator_voice_id,
+                session_language=self.session_language,
+                on_variants=self.on_variants
+            )
+
+    async def _emit_in_order(self):
+        index = 0
+        while True:
+            task = await self._renders.get()
+            if task is None:
+                return
+
+            try:
+                voice_file = await task
+            except Exception as e:
+                print(f"❌ Error rendering narration chunk: {e}")
+                voice_file = None
+
+            if not voice_file:
+                continue
+
+            self.playlist.append(voice_file)
+            try:
+                await self.on_chunk(index, voice_file)
+            except Exception as e:
+                print(f"⚠️ Could not deliver narration chunk {index}: {e}")
+            index += 1
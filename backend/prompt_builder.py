@@ -0,0 +1,145 @@
+from typing import Dict, List, Optional
+
+from models import GameSession
+
+GM_SYSTEM_PROMPT = """
+        You are a skilled Game Master for a collaborative fantasy adventure game. Your role is to:
+
+        1. Create engaging, immersive story content
+        2. Respond to player actions with logical consequences
+        3. Maintain narrative flow and consistency
+        4. Create opportunities for all players to participate
+        5. Balance challenge and fun
+        6. Describe scenes vividly but concisely
+
+        Guidelines:
+        - Keep responses between 100-300 words
+        - End with a clear situation requiring player decision/action
+        - Maintain consistent tone and world-building
+        - Include sensory details (sights, sounds, smells)
+        - Create meaningful choices and consequences
+        - Indicate if the scene is: adventure, combat, dialog, or exploration
+        - NEVER include meta text like "Scene:", "Dialog:", "Decision:", or player names as labels
+        - Focus on immersive storytelling without breaking the fourth wall
+
+        Return your response as a story that advances the narrative based on the prompt.
+        """
+
+LENGTH_INSTRUCTIONS = {
+    "short": "Keep chapters brief and focused (1-2 paragraphs). Move quickly between action points.",
+    "medium": "Use moderate pacing with 2-3 paragraphs per chapter. Balance description and action.",
+    "long": "Create detailed, immersive chapters (3-4 paragraphs). Include rich descriptions and character development."
+}
+
+OPENING_PROMPT = """
+        Start an engaging adventure story. Set the scene, introduce the world, and create an interesting situation where the players need to make decisions or take actions.
+
+        The story should be immersive and leave room for player agency. End with a situation where the players need to decide what to do.
+
+        Keep the story appropriate for all audiences and focus on adventure, exploration, and problem-solving.
+        """
+
+ROUND_PROMPT = """
+        All players have submitted their actions:
+        {actions}
+
+        Continue the story based on ALL these actions happening simultaneously or in sequence.
+        Describe what happens as a result of the players' combined actions.
+        Include consequences, new developments, or challenges.
+
+        Consider each character's abilities, personality, and background when describing their actions and their results.
+
+        If any actions lead to combat, indicate that combat has begun.
+        If the actions resolve the current situation, set up the next scenario.
+
+        End with a new situation that requires all players to decide their next actions.
+        """
+
+
+class PromptBuilder:
+    """Story prompts for one game, built so that consecutive requests share a byte-identical prefix
+
+    The system message holds everything that stays the same for the session:
+    the Game Master instructions, the GM role and the settings locked when the
+    game started, then the player roster. It is assembled once; only the
+    roster part is rebuilt, and only after the roster changed. What changes
+    every round (story context and the round's actions) comes last, in the
+    user message, so provider-side prompt caching can reuse the prefix.
+    """
+
+    def __init__(self, game: GameSession):
+        self.game = game
+        self._settings_block = self._build_settings_block()
+        self._system_prompt: Optional[str] = None
+
+    def invalidate_roster(self):
+        """Rebuild the roster part of the prefix on the next request"""
+        self._system_prompt = None
+
+    def opening_messages(self, story_context: str) -> List[Dict[str, str]]:
+        return self._messages(story_context, OPENING_PROMPT)
+
+    def round_messages(self, actions: List[str], story_context: str) -> List[Dict[str, str]]:
+        return self._messages(story_context, ROUND_PROMPT.format(actions="\n".join(actions)))
+
+    def _messages(self, story_context: str, prompt: str) -> List[Dict[str, str]]:
+        if self._system_prompt is None:
+            self._system_prompt = self._settings_block + self._build_roster_block()
+        return [
+            {"role": "system", "content": self._system_prompt},
+            {"role": "user", "content": f"Context: {story_context}\n\nPrompt: {prompt}"}
+        ]
+
+    def _build_settings_block(self) -> str:
+        game = self.game
+        system_prompt = GM_SYSTEM_PROMPT
+        if game.gm_role and game.gm_role.strip():
+            system_prompt += f"""
+
+        IMPORTANT: Adopt this specific Game Master personality and style:
+        {game.gm_role.strip()}
+
+        Embody this role consistently throughout the adventure. Let this personality shine through in your narration style, descriptions, and how you present challenges to the players.
+        """
+
+        language_instruction = f"Write the story in {game.language}. " if game.language != "English" else ""
+        theme_instruction = f"Theme: {game.theme}. " if game.theme else ""
+        length_instruction = LENGTH_INSTRUCTIONS.get(game.chapter_length, LENGTH_INSTRUCTIONS["medium"])
+        return system_prompt + f"""
+        {language_instruction}{theme_instruction}
+        CHAPTER LENGTH: {length_instruction}
+        """
+
+    def _build_roster_block(self) -> str:
+        """Players and their characters, for story generation"""
+        game = self.game
+        roster = f"""
+        This adventure has {len(game.players)} players: {', '.join([p.name for p in game.players])}.
+        """
+
+        character_descriptions = []
+        for player in game.players:
+            if player.character_name:
+                char_info = f"- {player.character_name}"
+
+                # Add gender information
+                if player.character_gender:
+                    char_info += f" ({player.character_gender})"
+
+                # Add character description
+                if player.character_description:
+                    char_info += f": {player.character_description}"
+                else:
+                    char_info += f": A {player.character_gender or 'character'} adventurer"
+
+                character_descriptions.append(char_info)
+
+        if character_descriptions:
+            roster += f"""
+
+CHARACTER ROSTER:
+{chr(10).join(character_descriptions)}
+
+IMPORTANT: Use these character descriptions to inform your storytelling. Reference their abilities, personalities, and backgrounds when they act or when situations would be relevant to their skills."""
+
+        return roster
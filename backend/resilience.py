@@ -0,0 +1,119 @@
+import os
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Stops calling a vendor endpoint that keeps failing
+
+    Outcomes of the calls in the last `window` seconds are kept; errors and
+    calls whose response took longer than `slow_call` seconds to start count
+    as failures. Once at least
+    `min_calls` were made and the failure rate reaches `failure_rate`, the
+    circuit opens and calls fail fast for `cooldown` seconds. After that a
+    limited number of trial calls are let through (half-open): a success
+    closes the circuit again, a failure reopens it.
+    """
+
+    def __init__(self, name: str, failure_rate: Optional[float] = None, min_calls: Optional[int] = None,
+                 window: Optional[float] = None, cooldown: Optional[float] = None, slow_call: Optional[float] = None,
+                 half_open_calls: Optional[int] = None):
+        self.name = name
+        self.failure_rate = failure_rate if failure_rate is not None else float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+        self.min_calls = min_calls if min_calls is not None else int(os.getenv("CIRCUIT_MIN_CALLS", "4"))
+        self.window = window if window is not None else float(os.getenv("CIRCUIT_WINDOW", "60"))
+        self.cooldown = cooldown if cooldown is not None else float(os.getenv("CIRCUIT_COOLDOWN", "30"))
+        self.slow_call = slow_call if slow_call is not None else float(os.getenv("CIRCUIT_SLOW_CALL", "20"))
+        self.half_open_calls = half_open_calls if half_open_calls is not None else int(os.getenv("CIRCUIT_HALF_OPEN_CALLS", "1"))
+
+        self.state = CLOSED
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._trials = 0
+        self._average_latency: Optional[float] = None
+        self._rejected = 0
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are being rejected"""
+        return self.state == OPEN and time.monotonic() - self._opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        """Return True if a call may go out now; every allowed call must be followed by exactly one record_* call"""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.cooldown:
+                self._rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._trials = 0
+            print(f"🔌 {self.name} circuit half-open, probing")
+
+        if self.state == HALF_OPEN:
+            if self._trials >= self.half_open_calls:
+                self._rejected += 1
+                return False
+            self._trials += 1
+        return True
+
+    def record_success(self, latency: float):
+        """Record a call that succeeded; `latency` is the wait until the response started"""
+        self._average_latency = latency if self._average_latency is None else 0.8 * self._average_latency + 0.2 * latency
+        if latency > self.slow_call:
+            self.record_failure(f"slow call ({latency:.1f}s)")
+            return
+
+        if self.state == HALF_OPEN:
+            self._outcomes.clear()
+            self.state = CLOSED
+            print(f"✅ {self.name} circuit closed again")
+            return
+        self._record(True)
+
+    def record_failure(self, reason: str = "error"):
+        if self.state == HALF_OPEN:
+            self._open(f"probe failed: {reason}")
+            return
+        self._record(False)
+
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        if self.state == CLOSED and len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self._open(f"{failures}/{len(self._outcomes)} calls failed in {self.window:.0f}s, last: {reason}")
+
+    def release(self):
+        """Give back a trial slot for a call that ended without an outcome (e.g. cancelled)"""
+        if self.state == HALF_OPEN and self._trials > 0:
+            self._trials -= 1
+
+    def stats(self) -> dict:
+        self._expire(time.monotonic())
+        return {
+            "state": self.state,
+            "calls": len(self._outcomes),
+            "failures": sum(1 for _, ok in self._outcomes if not ok),
+            "rejected": self._rejected,
+            "average_latency": round(self._average_latency, 3) if self._average_latency is not None else None
+        }
+
+    def _record(self, ok: bool):
+        now = time.monotonic()
+        self._outcomes.append((now, ok))
+        self._expire(now)
+
+    def _expire(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def _open(self, reason: str):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        print(f"🚫 {self.name} circuit open for {self.cooldown:.0f}s ({reason})")
@@ -0,0 +1,268 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Optional
+
+# Priority classes, most urgent first
+PRIORITY_ROUND = 0       # story text and narration of the round players are waiting for
+PRIORITY_BACKGROUND = 1  # previews, NPC lines and other work nobody is waiting on
+PRIORITY_NAMES = ("round", "background")
+
+# Which game and priority class the vendor calls made by the current task belong to
+current_game: ContextVar[str] = ContextVar("current_game", default="global")
+current_priority: ContextVar[int] = ContextVar("current_priority", default=PRIORITY_ROUND)
+
+
+@contextmanager
+def request_context(game_id: Optional[str] = None, priority: Optional[int] = None) -> Iterator[None]:
+    """Attribute vendor calls made inside the block (and tasks started there) to a game and priority"""
+    game_token = current_game.set(game_id) if game_id is not None else None
+    priority_token = current_priority.set(priority) if priority is not None else None
+    try:
+        yield
+    finally:
+        if priority_token is not None:
+            current_priority.reset(priority_token)
+        if game_token is not None:
+            current_game.reset(game_token)
+
+
+def retry_after_seconds(headers, default: float = 5.0, limit: float = 60.0) -> float:
+    """Pause a vendor asked for in its Retry-After header, capped at `limit`"""
+    try:
+        return min(limit, float(headers.get("retry-after", default)))
+    except ValueError:
+        return default
+
+
+class TokenBucket:
+    """Allows `per_minute` units per minute with bursts up to one minute's worth; 0 means unlimited"""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self._rate = per_minute / 60.0
+        self._updated = time.monotonic()
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available"""
+        if self.per_minute <= 0:
+            return 0.0
+        self._refill()
+        # A single request larger than the bucket waits for a full bucket rather than forever
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self._rate
+
+    def available(self) -> Optional[float]:
+        if self.per_minute <= 0:
+            return None
+        self._refill()
+        return self.tokens
+
+    def take(self, amount: float):
+        if self.per_minute <= 0:
+            return
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+
+class _Waiter:
+    __slots__ = ('future', 'game_id', 'priority', 'cost', 'enqueued')
+
+    def __init__(self, future: asyncio.Future, game_id: str, priority: int, cost: float, enqueued: float):
+        self.future = future
+        self.game_id = game_id
+        self.priority = priority
+        self.cost = cost
+        self.enqueued = enqueued
+
+
+class VendorScheduler:
+    """Admission control for one vendor, shared by every game
+
+    A call waits for a concurrency slot, a request token and `cost` units
+    (tokens or characters) from the per-minute buckets. Waiting calls are
+    served by priority class; within a class the games take turns, one call
+    each, so a table firing many requests cannot starve the others. Calls
+    that have waited longer than `aging` seconds are served as if they were
+    in the most urgent class.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, requests_per_minute: float, units_per_minute: float,
+                 unit_name: str, aging: Optional[float] = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.unit_name = unit_name
+        self.aging = aging if aging is not None else float(os.getenv("SCHEDULER_AGING", "30"))
+        self.requests = TokenBucket(requests_per_minute)
+        self.units = TokenBucket(units_per_minute)
+
+        self.in_flight = 0
+        self._queues: List["OrderedDict[str, Deque[_Waiter]]"] = [OrderedDict() for _ in PRIORITY_NAMES]
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._paused_until = 0.0
+        self._granted = [0 for _ in PRIORITY_NAMES]
+        self._total_wait = [0.0 for _ in PRIORITY_NAMES]
+        self._max_wait = [0.0 for _ in PRIORITY_NAMES]
+
+    @asynccontextmanager
+    async def slot(self, cost: float = 0, priority: Optional[int] = None, game_id: Optional[str] = None) -> AsyncIterator[None]:
+        """Hold one admitted call to the vendor for the duration of the block"""
+        await self._acquire(cost, priority, game_id)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def backoff(self, seconds: float):
+        """Stop admitting calls for a while, e.g. after the vendor answered 429"""
+        loop = asyncio.get_running_loop()
+        self._paused_until = max(self._paused_until, loop.time() + seconds)
+        print(f"⏸️ {self.name} paused for {seconds:.1f}s after a rate limit response")
+
+    def queue_depth(self) -> int:
+        return sum(len(waiters) for queue in self._queues for waiters in queue.values())
+
+    def stats(self) -> dict:
+        classes = {}
+        for priority, name in enumerate(PRIORITY_NAMES):
+            queue = self._queues[priority]
+            granted = self._granted[priority]
+            classes[name] = {
+                "queued": sum(len(waiters) for waiters in queue.values()),
+                "games_waiting": len(queue),
+                "granted": granted,
+                "average_wait": round(self._total_wait[priority] / granted, 3) if granted else None,
+                "max_wait": round(self._max_wait[priority], 3)
+            }
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth(),
+            "requests_available": _rounded(self.requests.available()),
+            f"{self.unit_name}_available": _rounded(self.units.available()),
+            "classes": classes
+        }
+
+    async def _acquire(self, cost: float, priority: Optional[int], game_id: Optional[str]):
+        loop = asyncio.get_running_loop()
+        priority = current_priority.get() if priority is None else priority
+        priority = min(max(priority, 0), len(PRIORITY_NAMES) - 1)
+        waiter = _Waiter(loop.create_future(), game_id or current_game.get(), priority, cost, loop.time())
+        self._queues[priority].setdefault(waiter.game_id, deque()).append(waiter)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as the caller went away: hand the slot on
+                self._release()
+            else:
+                self._discard(waiter)
+            raise
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _discard(self, waiter: _Waiter):
+        queue = self._queues[waiter.priority]
+        waiters = queue.get(waiter.game_id)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            return
+        if not waiters:
+            del queue[waiter.game_id]
+        self._dispatch()
+
+    def _next_waiter(self, now: float) -> Optional[_Waiter]:
+        """Head of the game whose turn it is in the most urgent class, unless an older call has aged out"""
+        first = None
+        for queue in self._queues:
+            if not queue:
+                continue
+            head = queue[next(iter(queue))][0]
+            if first is None:
+                first = head
+            elif now - head.enqueued > self.aging:
+                return head
+        return first
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        loop = asyncio.get_running_loop()
+        while self.in_flight < self.max_concurrency:
+            now = loop.time()
+            waiter = self._next_waiter(now)
+            if waiter is None:
+                return
+
+            delay = max(self._paused_until - now, self.requests.wait_time(1), self.units.wait_time(waiter.cost))
+            if delay > 0:
+                self._timer = loop.call_later(delay, self._dispatch)
+                return
+
+            queue = self._queues[waiter.priority]
+            waiters = queue[waiter.game_id]
+            waiters.popleft()
+            if waiters:
+                # This game had its turn: it goes to the back of the line
+                queue.move_to_end(waiter.game_id)
+            else:
+                del queue[waiter.game_id]
+
+            self.requests.take(1)
+            self.units.take(waiter.cost)
+            self.in_flight += 1
+
+            waited = now - waiter.enqueued
+            self._granted[waiter.priority] += 1
+            self._total_wait[waiter.priority] += waited
+            self._max_wait[waiter.priority] = max(self._max_wait[waiter.priority], waited)
+            waiter.future.set_result(None)
+
+
+def _rounded(value: Optional[float]) -> Optional[int]:
+    return round(value) if value is not None else None
+
+
+class Scheduler:
+    """Per-vendor schedulers shared by the AI and audio services"""
+
+    def __init__(self):
+        openai_concurrency = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+        self.openai = VendorScheduler(
+            "OpenAI",
+            max_concurrency=openai_concurrency,
+            requests_per_minute=float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "0")),
+            units_per_minute=float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "0")),
+            unit_name="tokens"
+        )
+        self.elevenlabs = VendorScheduler(
+            "ElevenLabs",
+            max_concurrency=int(os.getenv("ELEVENLABS_MAX_CONCURRENCY", "10")),
+            requests_per_minute=float(os.getenv("ELEVENLABS_REQUESTS_PER_MINUTE", "0")),
+            units_per_minute=float(os.getenv("ELEVENLABS_CHARACTERS_PER_MINUTE", "0")),
+            unit_name="characters"
+        )
+
+    def stats(self) -> Dict[str, dict]:
+        return {"openai": self.openai.stats(), "elevenlabs": self.elevenlabs.stats()}
@@ -13,6 +13,10 @@ def check_environment():
     """Check if all required environment variables are set"""
     load_dotenv()
     
+    # Replayed and synthetic backends never reach the vendors
+    if os.getenv("BACKEND_MODE", "live").strip().lower() in ("replay", "synthetic"):
+        return True
+    
     required_vars = ['OPENAI_API_KEY', 'ELEVENLABS_API_KEY']
     missing_vars = []
     
@@ -0,0 +1,87 @@
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+WORD = re.compile(r"\w+", re.UNICODE)
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+# Words that say nothing about what a passage is about; IDF takes care of the rest
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i in is it its of on or our she that the their them
+they this to was we were what when where which who will with you your wants
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def split_passages(text: str, max_words: int) -> List[str]:
+    """Paragraphs of a chapter, with overlong ones cut into runs of at most `max_words` words"""
+    passages = []
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        words = paragraph.split()
+        for start in range(0, len(words), max_words):
+            passages.append(" ".join(words[start:start + max_words]))
+    return passages
+
+
+class StoryIndex:
+    """BM25 index over the passages of a game's chapters, updated as chapters are added
+
+    Runs in memory without any model or network: finding the passage where
+    the old hermit or the silver key came up is a matter of shared words.
+    """
+
+    def __init__(self, passage_words: Optional[int] = None, k1: float = 1.2, b: float = 0.75):
+        self.passage_words = passage_words if passage_words is not None else int(os.getenv("STORY_INDEX_PASSAGE_WORDS", "80"))
+        self.k1 = k1
+        self.b = b
+
+        # Passage id -> (chapter number, text) and its length in terms
+        self.passages: List[Tuple[int, str]] = []
+        self._lengths: List[int] = []
+        self._total_length = 0
+        # Term -> {passage id: term frequency}
+        self._postings: Dict[str, Dict[int, int]] = {}
+
+    def add_chapter(self, number: int, text: str):
+        for passage in split_passages(text, self.passage_words):
+            terms = Counter(tokenize(passage))
+            if not terms:
+                continue
+            passage_id = len(self.passages)
+            self.passages.append((number, passage))
+            length = sum(terms.values())
+            self._lengths.append(length)
+            self._total_length += length
+            for term, frequency in terms.items():
+                self._postings.setdefault(term, {})[passage_id] = frequency
+
+    def search(self, query: str, k: int, exclude_chapters: Iterable[int] = ()) -> List[Tuple[int, str]]:
+        """Up to `k` passages most relevant to the query as (chapter number, text), in story order"""
+        if not self.passages or k <= 0:
+            return []
+
+        excluded = set(exclude_chapters)
+        count = len(self.passages)
+        average_length = self._total_length / count
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for passage_id, frequency in postings.items():
+                if self.passages[passage_id][0] in excluded:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[passage_id] / average_length)
+                scores[passage_id] = scores.get(passage_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        best = sorted(scores, key=lambda passage_id: scores[passage_id], reverse=True)[:k]
+        return [self.passages[passage_id] for passage_id in sorted(best)]
+
+    def __len__(self) -> int:
+        return len(self.passages)
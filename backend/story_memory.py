@@ -0,0 +1,161 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from story_index import StoryIndex
+
+# Folds finished chapters into the running summary: (summary, chapters) -> new summary, or None on failure
+Summarizer = Callable[[str, List[str]], Awaitable[Optional[str]]]
+
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """tiktoken encoding when available, None to fall back to the character heuristic"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(os.getenv("STORY_MEMORY_ENCODING", "cl100k_base"))
+        except ImportError:
+            print("⚠️ tiktoken not installed, story memory estimates tokens from text length")
+        except Exception as e:
+            print(f"⚠️ Could not load tokenizer ({e}), story memory estimates tokens from text length")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text))
+
+
+def tail_tokens(text: str, max_tokens: int) -> str:
+    """Last `max_tokens` tokens of a text, starting at a word boundary"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    encoding = _get_encoding()
+    if encoding is None:
+        # One extra character shows whether the cut falls inside a word
+        tail = text[-max_tokens * CHARS_PER_TOKEN - 1:]
+    else:
+        tail = encoding.decode(encoding.encode(text)[-max_tokens:])
+    # Drop the partial word at the cut
+    _, _, rest = tail.partition(" ")
+    return "…" + (rest or tail).lstrip()
+
+
+class StoryMemory:
+    """What the Game Master remembers of one game's story
+
+    The last `recent_chapters` chapters are kept verbatim. Older chapters are
+    folded into a rolling summary by a background task, so nobody waits for
+    it. Every chapter is also indexed, so passages from older chapters that
+    match what the players are doing now can be recalled word for word. The
+    context handed to the model is trimmed to `token_budget`: the summary gets
+    at most `summary_tokens`, recalled passages at most `recall_tokens`, and
+    the newest chapters get the rest.
+    """
+
+    def __init__(self, summarize: Summarizer, token_budget: Optional[int] = None, recent_chapters: Optional[int] = None,
+                 summary_tokens: Optional[int] = None, recall_passages: Optional[int] = None, recall_tokens: Optional[int] = None):
+        self.summarize = summarize
+        self.token_budget = token_budget if token_budget is not None else int(os.getenv("STORY_MEMORY_TOKENS", "1500"))
+        self.recent_chapters = recent_chapters if recent_chapters is not None else int(os.getenv("STORY_MEMORY_RECENT_CHAPTERS", "2"))
+        self.summary_tokens = summary_tokens if summary_tokens is not None else int(os.getenv("STORY_SUMMARY_TOKENS", "400"))
+        self.recall_passages = recall_passages if recall_passages is not None else int(os.getenv("STORY_RECALL_PASSAGES", "3"))
+        self.recall_tokens = recall_tokens if recall_tokens is not None else int(os.getenv("STORY_RECALL_TOKENS", "400"))
+
+        self.summary = ""
+        # Chapters not folded into the summary yet, as (chapter number, text)
+        self.chapters: List[Tuple[int, str]] = []
+        self.index = StoryIndex()
+        self._next_number = 1
+        self._task: Optional[asyncio.Task] = None
+
+    def add_chapter(self, text: str):
+        """Remember a finished chapter and start folding older ones into the summary"""
+        self.chapters.append((self._next_number, text))
+        self.index.add_chapter(self._next_number, text)
+        self._next_number += 1
+        self._schedule_summary()
+
+    def render(self, query: str = "") -> str:
+        """Summary, passages relevant to `query` and recent chapters, within the token budget"""
+        parts = []
+        used = 0
+        if self.summary:
+            summary = tail_tokens(self.summary, min(self.summary_tokens, self.token_budget))
+            parts.append(f"Story so far: {summary}")
+            used = count_tokens(parts[0])
+
+        # Room for recalled passages is set aside before the recent chapters take the rest
+        recall_reserve = min(self.recall_tokens, self.token_budget - used) if query and self.recall_passages else 0
+        recent = []
+        recent_numbers = []
+        for number, text in reversed(self.chapters):
+            remaining = self.token_budget - used - recall_reserve
+            block = f"[Chapter {number}]\n{text}"
+            tokens = count_tokens(block)
+            if tokens > remaining:
+                if not recent:
+                    # Even the latest chapter does not fit: keep its ending, where the players are now
+                    block = f"[Chapter {number}]\n{tail_tokens(text, remaining - count_tokens(f'[Chapter {number}]'))}"
+                    recent.append(block)
+                    recent_numbers.append(number)
+                    used += count_tokens(block)
+                break
+            recent.append(block)
+            recent_numbers.append(number)
+            used += tokens
+
+        recalled = []
+        if recall_reserve:
+            remaining = min(recall_reserve, self.token_budget - used)
+            for number, passage in self.index.search(query, self.recall_passages, exclude_chapters=recent_numbers):
+                block = f"[Chapter {number}] {passage}"
+                tokens = count_tokens(block)
+                if tokens > remaining:
+                    continue
+                recalled.append(block)
+                remaining -= tokens
+
+        if recalled:
+            parts.append("Earlier passages that may matter now:\n" + "\n".join(recalled))
+        if recent:
+            parts.append("Recent chapters:\n" + "\n\n".join(reversed(recent)))
+        return "\n\n".join(parts)
+
+    def cancel(self):
+        """Stop a summary update still running, e.g. when the game ended"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _schedule_summary(self):
+        if self._task is not None or len(self.chapters) <= self.recent_chapters:
+            return
+        self._task = asyncio.create_task(self._update_summary())
+
+    async def _update_summary(self):
+        try:
+            while len(self.chapters) > self.recent_chapters:
+                folding = self.chapters[:len(self.chapters) - self.recent_chapters]
+                summary = await self.summarize(self.summary, [text for _, text in folding])
+                if not summary:
+                    # Keep the chapters verbatim and try again after the next one
+                    print(f"⚠️ Story summary update failed, {len(folding)} chapter(s) kept verbatim")
+                    return
+                self.summary = tail_tokens(summary.strip(), self.summary_tokens)
+                del self.chapters[:len(folding)]
+                print(f"🧠 Folded {len(folding)} chapter(s) into the story summary ({count_tokens(self.summary)} tokens)")
+        finally:
+            self._task = None
@@ -0,0 +1,162 @@
+import asyncio
+import os
+import shutil
+from typing import Awaitable, Callable, List, Optional, Set
+
+from voice_cache import SingleFlight, VoiceCache
+
+# Compact variants a rendered voice file can be transcoded to. "codec" is what
+# a client has to advertise in supported_formats to be given the variant; the
+# low-bitrate MP3 has a token of its own so only clients asking for it get it.
+VARIANTS = {
+    "opus": {
+        "codec": "opus",
+        "suffix": ".opus.webm",
+        "bitrate_env": "VOICE_OPUS_BITRATE",
+        "bitrate": "32k",
+        "args": ["-c:a", "libopus", "-application", "voip", "-vbr", "on", "-f", "webm"]
+    },
+    "mp3-low": {
+        "codec": "mp3-low",
+        "suffix": ".low.mp3",
+        "bitrate_env": "VOICE_MP3_LOW_BITRATE",
+        "bitrate": "48k",
+        "args": ["-c:a", "libmp3lame", "-f", "mp3"]
+    }
+}
+
+
+class VoiceTranscoder:
+    """Optional ffmpeg stage that stores compact variants next to each voice file
+
+    Enabled by listing variants in VOICE_TRANSCODE_FORMATS (e.g. "opus,mp3-low"),
+    in order of preference. Variants live in the voice cache like any other
+    file; a client is sent the first variant it can play that exists, and the
+    original MP3 otherwise. Variants are made in the background, so callers
+    can ask to be told once a new one is ready.
+    """
+
+    def __init__(self, voice_cache: VoiceCache):
+        self.voice_cache = voice_cache
+        configured = [name.strip() for name in os.getenv("VOICE_TRANSCODE_FORMATS", "").split(",") if name.strip()]
+        for name in configured:
+            if name not in VARIANTS:
+                print(f"⚠️ Unknown voice transcode format '{name}' (known: {', '.join(VARIANTS)})")
+        self.formats = [name for name in configured if name in VARIANTS]
+        self.timeout = float(os.getenv("VOICE_TRANSCODE_TIMEOUT", "30"))
+        self._semaphore = asyncio.Semaphore(int(os.getenv("VOICE_TRANSCODE_CONCURRENCY", "2")))
+        self._inflight = SingleFlight()
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.enabled = bool(self.formats)
+        if self.enabled and shutil.which("ffmpeg") is None:
+            print("⚠️ VOICE_TRANSCODE_FORMATS is set but ffmpeg is not installed, serving original MP3 only")
+            self.enabled = False
+        elif self.enabled:
+            print(f"🗜️ Voice transcoding enabled: {', '.join(self.formats)}")
+
+    @staticmethod
+    def variant_filename(filename: str, name: str) -> str:
+        return os.path.splitext(filename)[0] + VARIANTS[name]["suffix"]
+
+    async def transcode(self, filename: str) -> bool:
+        """Make sure every configured variant of a cached voice file exists, return whether one was added"""
+        if not self.enabled:
+            return False
+        added = False
+        for name in self.formats:
+            variant = self.variant_filename(filename, name)
+            if self.voice_cache.lookup(variant):
+                continue
+            if await self._inflight.run(variant, lambda name=name, variant=variant: self._encode(filename, name, variant)):
+                added = True
+        return added
+
+    def transcode_in_background(self, filename: str, on_ready: Optional[Callable[[str], Awaitable[None]]] = None):
+        """Transcode without making anyone wait; on_ready is called with the filename once a new variant exists"""
+        if not self.enabled:
+            return
+        task = asyncio.create_task(self._transcode_and_announce(filename, on_ready))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def cancel(self):
+        """Stop background transcodes, e.g. on shutdown"""
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def _transcode_and_announce(self, filename: str, on_ready: Optional[Callable[[str], Awaitable[None]]]):
+        try:
+            added = await self.transcode(filename)
+        except Exception as e:
+            print(f"⚠️ Could not transcode {filename}: {e}")
+            return
+        if added and on_ready is not None:
+            try:
+                await on_ready(filename)
+            except Exception as e:
+                print(f"⚠️ Could not announce variants of {filename}: {e}")
+
+    def best_variant(self, filename: str, supported_formats: List[str]) -> str:
+        """Pick the preferred variant the client can play, falling back to the original"""
+        if not self.enabled or not supported_formats:
+            return filename
+        for name in self.formats:
+            if VARIANTS[name]["codec"] not in supported_formats:
+                continue
+            variant = self.variant_filename(filename, name)
+            if self.voice_cache.lookup(variant):
+                return variant
+        return filename
+
+    async def _encode(self, filename: str, name: str, variant: str) -> bool:
+        spec = VARIANTS[name]
+        source = self.voice_cache.path(filename)
+        target = self.voice_cache.path(variant)
+        temp_path = target + ".part"
+        bitrate = os.getenv(spec["bitrate_env"], spec["bitrate"])
+        command = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y", "-i", source,
+                   "-vn", "-ac", "1", "-b:a", bitrate, *spec["args"], temp_path]
+
+        async with self._semaphore:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *command, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+                )
+            except OSError as e:
+                print(f"⚠️ Could not start ffmpeg for {variant}: {e}")
+                return False
+
+            try:
+                _, stderr = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                print(f"⚠️ Transcoding {variant} timed out after {self.timeout:.0f}s")
+                self._discard(temp_path)
+                return False
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                self._discard(temp_path)
+                raise
+
+        if process.returncode != 0:
+            print(f"⚠️ Transcoding {variant} failed: {stderr.decode(errors='replace').strip()[-300:]}")
+            self._discard(temp_path)
+            return False
+
+        os.replace(temp_path, target)
+        self.voice_cache.add(variant)
+
+        original_size = os.path.getsize(source)
+        variant_size = os.path.getsize(target)
+        print(f"🗜️ {variant}: {variant_size / 1024:.0f} KB ({variant_size / max(original_size, 1):.0%} of original)")
+        return True
+
+    @staticmethod
+    def _discard(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,351 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+AUDIO_EXTENSIONS = ('.mp3', '.ogg', '.webm', '.wav')
+
+
+class CacheEntry:
+    __slots__ = ('size', 'last_access', 'voice', 'language')
+
+    def __init__(self, size: int, last_access: float, voice: Optional[str] = None, language: Optional[str] = None):
+        self.size = size
+        self.last_access = last_access
+        self.voice = voice
+        self.language = language
+
+
+class SingleFlight:
+    """Share one in-flight render between concurrent callers asking for the same key
+
+    The first caller starts the work as its own task; later callers await the
+    same task. A caller being cancelled does not cancel the shared render, so
+    the others still get their result and the file still lands in the cache.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._finished(key, done))
+        else:
+            print(f"🔁 Joining in-flight render for {key}")
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            # Mark the error as seen even if every caller has gone away
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+class NegativeCache:
+    """Remembers renders that failed recently so they are not retried on every request
+
+    A failed key is skipped for `ttl` seconds. After `retry_budget` failures
+    in a row it is skipped for `max_ttl` instead. Failures are forgotten once
+    a key has been quiet for `max_ttl`, and on the first success, so every
+    key is eventually retried without purging anything by hand.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_ttl: Optional[float] = None, retry_budget: Optional[int] = None, max_entries: int = 10000):
+        self.ttl = ttl if ttl is not None else float(os.getenv("VOICE_FAILURE_TTL", "60"))
+        self.max_ttl = max_ttl if max_ttl is not None else float(os.getenv("VOICE_FAILURE_MAX_TTL", "900"))
+        self.retry_budget = retry_budget if retry_budget is not None else int(os.getenv("VOICE_FAILURE_RETRY_BUDGET", "3"))
+        self.max_entries = max_entries
+        # key -> (consecutive failures, retry allowed at, forget at)
+        self._failures: "OrderedDict[str, Tuple[int, float, float]]" = OrderedDict()
+        self.skipped = 0
+
+    def blocked(self, key: str) -> Optional[float]:
+        """Seconds until the key may be retried, or None if it may be rendered now"""
+        entry = self._failures.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        if now >= entry[2]:
+            del self._failures[key]
+            return None
+        if now >= entry[1]:
+            return None
+        self.skipped += 1
+        return entry[1] - now
+
+    def record_failure(self, key: str, reason: str = ""):
+        previous = self._failures.pop(key, None)
+        failures = previous[0] + 1 if previous else 1
+        delay = self.ttl if failures <= self.retry_budget else self.max_ttl
+        now = time.time()
+        self._failures[key] = (failures, now + delay, now + delay + self.max_ttl)
+        print(f"🚧 Render of {key} failed ({failures}x{', ' + reason if reason else ''}), not retrying for {delay:.0f}s")
+
+        while len(self._failures) > self.max_entries:
+            self._failures.popitem(last=False)
+
+    def record_success(self, key: str):
+        self._failures.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"failed_keys": len(self._failures), "skipped": self.skipped}
+
+    def __len__(self) -> int:
+        return len(self._failures)
+
+
+class VoiceCache:
+    """Size-bounded index of the rendered voice files in static/audio
+
+    File names are content-addressed (a hash of text, voice and language), so
+    a file name is its cache key. The index lives in SQLite next to, not
+    inside, the publicly served directory; lookups use an in-memory LRU
+    mirror and never touch the filesystem. When the byte or file limit is
+    exceeded the least recently used files are deleted in the background.
+    """
+
+    def __init__(self, cache_dir: str, index_path: Optional[str] = None, max_bytes: Optional[int] = None, max_files: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.index_path = index_path or os.getenv("VOICE_CACHE_INDEX", "voice_cache/index.sqlite3")
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("VOICE_CACHE_MAX_MB", "2048")) * 1024 * 1024
+        self.max_files = max_files if max_files is not None else int(os.getenv("VOICE_CACHE_MAX_FILES", "5000"))
+        self.evict_interval = float(os.getenv("VOICE_CACHE_EVICT_INTERVAL", "60"))
+        # Files used this recently are never evicted (e.g. a chapter players are still hearing)
+        self.min_age = float(os.getenv("VOICE_CACHE_MIN_AGE", "600"))
+
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.total_bytes = 0
+        self._dirty: Dict[str, CacheEntry] = {}
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._evictor: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def startup(self):
+        """Open the index, reconcile it with the files on disk and start evicting"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._open_and_rebuild)
+        self._wakeup = asyncio.Event()
+        self._evictor = asyncio.create_task(self._evict_loop())
+        print(f"🗄️ Voice cache ready: {len(self.entries)} files, {self.total_bytes / 1024 / 1024:.1f} MB "
+              f"(limits {self.max_files} files, {self.max_bytes / 1024 / 1024:.0f} MB)")
+
+    async def shutdown(self):
+        """Stop the evictor and persist access times"""
+        if self._evictor is not None:
+            self._evictor.cancel()
+            try:
+                await self._evictor
+            except asyncio.CancelledError:
+                pass
+            self._evictor = None
+        if self._db is not None:
+            self._flush()
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.cache_dir, filename)
+
+    def lookup(self, filename: str) -> bool:
+        """Return True if the file is cached, marking it as recently used"""
+        if self._db is None:
+            # Index not opened (e.g. a standalone script): fall back to the filesystem
+            return os.path.exists(self.path(filename))
+
+        with self._lock:
+            entry = self.entries.get(filename)
+            if entry is None:
+                return False
+            entry.last_access = time.time()
+            self.entries.move_to_end(filename)
+            self._dirty[filename] = entry
+        return True
+
+    def add(self, filename: str, voice: Optional[str] = None, language: Optional[str] = None):
+        """Register a file that was just written to the cache directory"""
+        if self._db is None:
+            return
+
+        try:
+            size = os.path.getsize(self.path(filename))
+        except OSError as e:
+            print(f"⚠️ Voice cache could not stat {filename}: {e}")
+            return
+
+        with self._lock:
+            previous = self.entries.pop(filename, None)
+            if previous is not None:
+                self.total_bytes -= previous.size
+            entry = CacheEntry(size, time.time(), voice, language)
+            self.entries[filename] = entry
+            self.total_bytes += size
+            self._dirty[filename] = entry
+            over_limit = self._over_limit()
+
+        if over_limit and self._wakeup is not None:
+            self._wakeup.set()
+
+    def filenames_with_size(self, size: int) -> List[str]:
+        with self._lock:
+            return [filename for filename, entry in self.entries.items() if entry.size == size]
+
+    def remove(self, filename: str):
+        """Delete a file and forget it"""
+        with self._lock:
+            entry = self.entries.pop(filename, None)
+            if entry is not None:
+                self.total_bytes -= entry.size
+            self._dirty.pop(filename, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM voice_files WHERE filename = ?", (filename,))
+                self._db.commit()
+        try:
+            os.remove(self.path(filename))
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_files": self.max_files,
+                "max_bytes": self.max_bytes
+            }
+
+    def evict(self, max_files: Optional[int] = None, max_bytes: Optional[int] = None) -> int:
+        """Delete least recently used files until the cache is within its limits"""
+        max_files = self.max_files if max_files is None else max_files
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        cutoff = time.time() - self.min_age
+
+        victims: List[Tuple[str, CacheEntry]] = []
+        with self._lock:
+            count = len(self.entries)
+            total = self.total_bytes
+            for filename, entry in self.entries.items():
+                if count <= max_files and total <= max_bytes:
+                    break
+                if entry.last_access > cutoff:
+                    # Everything after this entry was used even more recently
+                    break
+                victims.append((filename, entry))
+                count -= 1
+                total -= entry.size
+
+            # Drop victims from the index first so no lookup can return them
+            for filename, entry in victims:
+                del self.entries[filename]
+                self._dirty.pop(filename, None)
+                self.total_bytes -= entry.size
+
+        if not victims:
+            return 0
+
+        for filename, _ in victims:
+            try:
+                os.remove(self.path(filename))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠️ Could not evict cached voice file {filename}: {e}")
+
+        with self._lock:
+            if self._db is not None:
+                self._db.executemany("DELETE FROM voice_files WHERE filename = ?", [(filename,) for filename, _ in victims])
+                self._db.commit()
+
+        freed = sum(entry.size for _, entry in victims)
+        print(f"🧹 Voice cache evicted {len(victims)} files ({freed / 1024 / 1024:.1f} MB)")
+        return len(victims)
+
+    def _over_limit(self) -> bool:
+        return len(self.entries) > self.max_files or self.total_bytes > self.max_bytes
+
+    def _open_and_rebuild(self):
+        index_dir = os.path.dirname(self.index_path)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        db = sqlite3.connect(self.index_path, check_same_thread=False)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS voice_files (
+                filename TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                voice TEXT,
+                language TEXT
+            )
+        """)
+
+        indexed = {
+            row[0]: CacheEntry(row[1], row[2], row[3], row[4])
+            for row in db.execute("SELECT filename, size, last_access, voice, language FROM voice_files")
+        }
+
+        # The directory is the source of truth: pick up unindexed files, forget deleted ones
+        on_disk: Dict[str, CacheEntry] = {}
+        with os.scandir(self.cache_dir) as scan:
+            for item in scan:
+                if not item.is_file() or not item.name.lower().endswith(AUDIO_EXTENSIONS):
+                    continue
+                stat = item.stat()
+                entry = indexed.get(item.name)
+                if entry is None:
+                    entry = CacheEntry(stat.st_size, stat.st_mtime)
+                entry.size = stat.st_size
+                on_disk[item.name] = entry
+
+        db.execute("DELETE FROM voice_files")
+        db.executemany(
+            "INSERT INTO voice_files (filename, size, last_access, voice, language) VALUES (?, ?, ?, ?, ?)",
+            [(name, e.size, e.last_access, e.voice, e.language) for name, e in on_disk.items()]
+        )
+        db.commit()
+
+        with self._lock:
+            self.entries = OrderedDict(sorted(on_disk.items(), key=lambda item: item[1].last_access))
+            self.total_bytes = sum(entry.size for entry in on_disk.values())
+            self._dirty.clear()
+            self._db = db
+
+    def _flush(self):
+        """Write changed entries and access times to the index"""
+        with self._lock:
+            if self._db is None or not self._dirty:
+                return
+            rows = [(name, e.size, e.last_access, e.voice, e.language) for name, e in self._dirty.items()]
+            self._dirty.clear()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO voice_files (filename, size, last_access, voice, language) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._db.commit()
+
+    async def _evict_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.evict_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await loop.run_in_executor(None, self._flush)
+                if self._over_limit():
+                    await loop.run_in_executor(None, self.evict)
+            except Exception as e:
+                print(f"⚠️ Voice cache maintenance failed: {e}")
@@ -28,11 +28,16 @@ export interface GameState {
 	storyHistory: Array<{
 		text: string;
 		voice_file?: string;
+		voice_playlist?: string[];
 		background_music?: string;
 	}>;
 	chatMessages: ChatMessage[];
+	isStreaming: boolean;
+	currentChapter: number;
 	isMyTurn: boolean;
 	voiceUrl?: string;
+	voiceQueue: string[];
+	liveVoiceChapter: number;
 	backgroundMusic?: string;
 	isLoading: boolean;
 	loadingMessage: string;
@@ -60,7 +65,11 @@ const initialState: GameState = {
 	gameStatus: 'waiting',
 	storyHistory: [],
 	chatMessages: [],
+	isStreaming: false,
+	currentChapter: -1,
 	isMyTurn: false,
+	voiceQueue: [],
+	liveVoiceChapter: -1,
 	isLoading: false,
 	loadingMessage: '',
 	gameTheme: '',
@@ -102,7 +111,8 @@ function createGameStore() {
 				ws?.send(JSON.stringify({
 					type: 'join_game',
 					game_id: gameId,
-					player_name: playerName
+					player_name: playerName,
+					supported_formats: supportedAudioFormats()
 				}));
 			};
 			
@@ -136,7 +146,28 @@ function createGameStore() {
 						});
 						break;
 						
+					case 'story_delta':
+						// Streamed chapter text: start a fresh story on the first delta
+						update(state => ({
+							...state,
+							currentStory: (state.isStreaming ? state.currentStory : '') + message.delta,
+							voiceQueue: state.isStreaming ? state.voiceQueue : [],
+							isStreaming: true,
+							isLoading: false,
+							loadingMessage: ''
+						}));
+						break;
+
+					case 'narration_chunk':
+						// Pipelined narration arrives sentence by sentence, in story order
+						update(state => ({
+							...state,
+							voiceQueue: [...state.voiceQueue, `http://localhost:8000/${message.voice_file}`]
+						}));
+						break;
+
 					case 'story_update':
+					case 'story_complete':
 						console.log('Story update received:', {
 							voice_file: message.voice_file,
 							background_music: message.background_music,
@@ -147,9 +178,12 @@ function createGameStore() {
 							currentStory: message.story,
 							currentPlayer: message.current_player,
 							gameStatus: message.game_state,
+							isStreaming: false,
+							currentChapter: message.chapter_index ?? state.currentChapter,
 							storyHistory: [...state.storyHistory, {
 								text: message.story,
 								voice_file: message.voice_file,
+								voice_playlist: message.voice_playlist,
 								background_music: message.background_music
 							}],
 							isMyTurn: true, // All players can act in round-based system
@@ -175,6 +209,8 @@ function createGameStore() {
 							currentStory: message.current_story,
 							currentPlayer: message.current_player,
 							gameStatus: message.game_state,
+							isStreaming: false,
+							currentChapter: message.chapter_index ?? state.currentChapter,
 							isMyTurn: true, // All players can act in round-based system
 							voiceUrl: message.voice_file ? `http://localhost:8000/${message.voice_file}` : undefined,
 							backgroundMusic: message.background_music ? `http://localhost:8000/${message.background_music}` : undefined,
@@ -187,6 +223,69 @@ function createGameStore() {
 						}));
 						break;
 
+					case 'voice_streaming':
+						// Narration still rendering: play it as it streams in
+						update(state => {
+							if (message.chapter_index !== state.currentChapter) {
+								return state;
+							}
+							return {
+								...state,
+								liveVoiceChapter: message.chapter_index,
+								voiceUrl: `http://localhost:8000/${message.live_url}`
+							};
+						});
+						break;
+
+					case 'voice_ready':
+						// Narration rendered after the chapter text; ignore audio for older chapters
+						update(state => {
+							if (message.chapter_index !== state.currentChapter) {
+								return state;
+							}
+							const history = [...state.storyHistory];
+							const last = history[history.length - 1];
+							if (last) {
+								history[history.length - 1] = {
+									...last,
+									voice_file: message.voice_file,
+									voice_playlist: message.voice_playlist
+								};
+							}
+							return {
+								...state,
+								storyHistory: history,
+								// Already playing from the live stream: don't start it over
+								voiceUrl: message.voice_file && state.liveVoiceChapter !== message.chapter_index
+									? `http://localhost:8000/${message.voice_file}`
+									: state.voiceUrl
+							};
+						});
+						break;
+
+					case 'voice_variant_ready':
+						// A smaller copy of narration we were sent exists now: use it for whatever has not been fetched yet
+						update(state => {
+							if (!message.voice_file || message.voice_file === message.original) {
+								return state;
+							}
+							const swap = (url: string) => url === message.original ? message.voice_file : url;
+							const swapUrl = (url: string) => url === `http://localhost:8000/${message.original}`
+								? `http://localhost:8000/${message.voice_file}`
+								: url;
+							return {
+								...state,
+								// The chapter playing now keeps its source; only queued chunks and replays switch
+								voiceQueue: state.voiceQueue.map(swapUrl),
+								storyHistory: state.storyHistory.map(segment => ({
+									...segment,
+									voice_file: segment.voice_file && swap(segment.voice_file),
+									voice_playlist: segment.voice_playlist?.map(swap)
+								}))
+							};
+						});
+						break;
+
 					case 'action_received':
 						update(state => ({
 							...state,
@@ -377,6 +476,20 @@ function createGameStore() {
 	}
 }
 
+// Audio codecs this browser can play; the server picks narration variants from these
+function supportedAudioFormats(): string[] {
+	const audio = document.createElement('audio');
+	const formats: string[] = [];
+	if (audio.canPlayType('audio/webm; codecs="opus"')) formats.push('opus');
+	if (audio.canPlayType('audio/mpeg')) {
+		formats.push('mp3');
+		// Lower-quality MP3 only when the user asked the browser to save data
+		const connection = (navigator as Navigator & { connection?: { saveData?: boolean } }).connection;
+		if (connection?.saveData) formats.push('mp3-low');
+	}
+	return formats;
+}
+
 function generatePlayerId(): string {
 	return Math.random().toString(36).substring(2, 15) + Math.random().toString(36).substring(2, 15);
 }